@@ -0,0 +1,125 @@
+"""
+Measure the memory held per caption and per transcript segment by the
+editors, compared with the previous instance-dict layout that also kept
+UI state on every object and the raw transcript JSON for the editor's
+whole life.
+
+Run from the repository root:
+
+    python -m benchmarks.memory [captions ...]
+"""
+
+import gc
+import json
+import sys
+import tracemalloc
+
+from utils.speakers import SpeakerTable
+from utils.srt import SRTCaption
+from utils.transcript import TranscriptSegment
+
+
+class LegacyCaption:
+    def __init__(self, index: int, start: float, end: float, text: str):
+        self.index = index
+        self.start = start
+        self.end = end
+        self.text = text
+        self.is_selected = False
+        self.is_highlighted = False
+        self.item_id = index
+
+
+class LegacySegment:
+    def __init__(self, speakers, speaker_id: int, text: str, start: float, end: float):
+        self.speakers = speakers
+        self.speaker_id = speaker_id
+        self.text = text
+        self.start = start
+        self.end = end
+        self.duration = end - start
+        self.is_selected = False
+        self.is_highlighted = False
+        self.parts = None
+        self.words = None
+        self.item_id = 0
+
+
+def retained(build) -> int:
+    """
+    Get the number of bytes still allocated by build() after it returns.
+    """
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = build()
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+
+    return after - before
+
+
+def main(sizes: list) -> None:
+    print(
+        f"{'captions':>10} {'legacy caption':>15} {'caption':>8} "
+        f"{'legacy segment':>15} {'segment':>8} {'raw json':>9}  (bytes each)"
+    )
+
+    for count in sizes:
+        # Texts are created up front so only the objects themselves count.
+        texts = [f"Caption number {i} with some text" for i in range(count)]
+        speakers = SpeakerTable()
+        speakers.intern("SPEAKER_00")
+        raw = json.dumps(
+            {
+                "segments": [
+                    {
+                        "speaker": "SPEAKER_00",
+                        "text": text,
+                        "start": i * 3.0,
+                        "end": i * 3.0 + 2.5,
+                    }
+                    for i, text in enumerate(texts)
+                ]
+            }
+        )
+
+        legacy_captions = retained(
+            lambda: [
+                LegacyCaption(i, i * 3.0, i * 3.0 + 2.5, text)
+                for i, text in enumerate(texts)
+            ]
+        )
+        captions = retained(
+            lambda: [
+                SRTCaption.from_seconds(i, i * 3.0, i * 3.0 + 2.5, text)
+                for i, text in enumerate(texts)
+            ]
+        )
+        legacy_segments = retained(
+            lambda: [
+                LegacySegment(speakers, 0, text, i * 3.0, i * 3.0 + 2.5)
+                for i, text in enumerate(texts)
+            ]
+        )
+        segments = retained(
+            lambda: [
+                TranscriptSegment("SPEAKER_00", text, i * 3.0, i * 3.0 + 2.5, speakers)
+                for i, text in enumerate(texts)
+            ]
+        )
+        # Previously kept as TranscriptEditor.original_data, now dropped.
+        raw_json = retained(lambda: json.loads(raw))
+
+        print(
+            f"{count:>10} {legacy_captions / count:>15.0f} {captions / count:>8.0f} "
+            f"{legacy_segments / count:>15.0f} {segments / count:>8.0f} "
+            f"{raw_json / count:>9.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000])
@@ -0,0 +1,138 @@
+"""
+Compare the throughput of the streaming SRT parser with the previous
+regex based parser on large synthetic files.
+
+Run from the repository root:
+
+    python -m benchmarks.srt_parse [captions ...]
+"""
+
+import io
+import re
+import sys
+import time
+
+from utils.srt_parser import parse_srt
+
+
+class LegacyCaption:
+    def __init__(self, index: int, start_time: str, end_time: str, text: str):
+        self.index = index
+        self.start_time = start_time
+        self.end_time = end_time
+        self.text = text
+
+
+def legacy_parse(srt_content: str) -> list:
+    """
+    The regex based parser previously used by SRTEditor.parse_srt.
+    """
+
+    captions = []
+
+    for block in re.split(r"\n\s*\n", srt_content.strip()):
+        if not block.strip():
+            continue
+
+        lines = block.strip().split("\n")
+        if len(lines) < 3:
+            continue
+
+        try:
+            index = int(lines[0])
+            timestamp_line = lines[1]
+            text = "\n".join(lines[2:])
+
+            if " --> " in timestamp_line:
+                start_time, end_time = timestamp_line.split(" --> ")
+                captions.append(
+                    LegacyCaption(index, start_time.strip(), end_time.strip(), text)
+                )
+        except (ValueError, IndexError):
+            continue
+
+    return captions
+
+
+def legacy_seconds(timestamp: str) -> float:
+    """
+    The timestamp conversion previously done by SRTCaption.get_start_seconds.
+    """
+
+    time_parts = timestamp.replace(",", ".").split(":")
+
+    return (
+        float(time_parts[0]) * 3600 + float(time_parts[1]) * 60 + float(time_parts[2])
+    )
+
+
+def legacy_parse_with_times(srt_content: str) -> list:
+    """
+    The legacy parser plus converting each timestamp once, which is what the
+    new parser does up front.
+    """
+
+    captions = legacy_parse(srt_content)
+
+    for caption in captions:
+        caption.start = legacy_seconds(caption.start_time)
+        caption.end = legacy_seconds(caption.end_time)
+
+    return captions
+
+
+def make_caption(index: int, start: float, end: float, text: str) -> tuple:
+    return index, start, end, text
+
+
+def generate_srt(count: int) -> str:
+    parts = []
+
+    for i in range(count):
+        start = i * 3
+        parts.append(
+            f"{i + 1}\n"
+            f"{start // 3600:02d}:{start // 60 % 60:02d}:{start % 60:02d},000 --> "
+            f"{start // 3600:02d}:{start // 60 % 60:02d}:{start % 60 + 2:02d},500\n"
+            f"Caption number {i + 1} with some text\nand a second line\n\n"
+        )
+
+    return "".join(parts)
+
+
+def measure(func, *args, repeat: int = 3) -> float:
+    best = float("inf")
+
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - started)
+
+    return best
+
+
+def main(sizes: list) -> None:
+    print(
+        f"{'captions':>10} {'MB':>7} {'legacy':>9} {'legacy+times':>13} "
+        f"{'new str':>9} {'new bytes':>10}  (MB/s)"
+    )
+
+    for count in sizes:
+        content = generate_srt(count)
+        encoded = content.encode()
+        megabytes = len(encoded) / 1024 / 1024
+
+        legacy = measure(legacy_parse, content)
+        legacy_times = measure(legacy_parse_with_times, content)
+        new = measure(parse_srt, content, make_caption)
+        stream = measure(lambda: parse_srt(io.BytesIO(encoded), make_caption))
+
+        print(
+            f"{count:>10} {megabytes:>7.2f} {megabytes / legacy:>9.1f} "
+            f"{megabytes / legacy_times:>13.1f} {megabytes / new:>9.1f} "
+            f"{megabytes / stream:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000])
@@ -5,7 +5,10 @@ from pages.home import create as create_files_table
 from pages.txt import create as create_txt
 from pages.admin import create as create_admin
 from pages.user import create as create_user_page
+from utils.health import health
+from utils.metrics import create_metrics_endpoint
 from utils.settings import get_settings
+from utils.token import get_user_data
 
 settings = get_settings()
 
@@ -14,6 +17,8 @@ create_srt()
 create_txt()
 create_admin()
 create_user_page()
+create_metrics_endpoint()
+app.on_startup(health.start)
 
 
 @ui.page("/")
@@ -30,6 +35,8 @@ def index(request: Request) -> None:
 
     if token:
         app.storage.user["token"] = token
+        # The profile is fetched once here and reused by the pages after it.
+        get_user_data(refresh=True)
         ui.navigate.to("/home")
 
     with ui.card() as card:
@@ -1,27 +1,33 @@
+from fastapi.responses import Response
+from nicegui import app
+from nicegui import run
 from nicegui import ui
+from utils.analytics import UsageAnalytics
+from utils.analytics import analyze
 from utils.common import (
     page_init,
 )
+from utils.health import health
+from utils.metrics import measure_page
+from utils.paging import PagedTable
 from utils.token import get_admin_status
-import requests
+from utils.token import load_user_data
 from utils.settings import get_settings
+from utils.statistics import statistics_cache
 from utils.token import get_auth_header
+from utils.usage_export import EXPORT_FORMATS
+from utils.usage_export import EXPORT_TABLES
+from utils.usage_export import create_usage_export_endpoint
 from datetime import datetime, timedelta
 import json
+import pandas as pd
 
 settings = get_settings()
 
+create_usage_export_endpoint()
 
-def get_statistics() -> dict:
-    """
-    Get statistics from the API.
-    """
-    response = requests.get(
-        f"{settings.API_URL}/api/v1/statistics", headers=get_auth_header()
-    )
-    response.raise_for_status()
-    data = response.json()
-    return data
+# How often the health panel on the dashboard is updated, in seconds.
+HEALTH_INTERVAL = 5.0
 
 
 def format_seconds_to_duration(seconds: int) -> str:
@@ -67,71 +73,212 @@ def format_last_login(last_login_str: str) -> str:
         return last_login_str
 
 
-def create_chart_data(active_users: list) -> dict:
+def bar_chart(title: str, labels: list, values: list, horizontal: bool = False) -> None:
     """
-    Create chart data from active users.
+    Draw a simple bar chart.
     """
-    transcription_data = []
-    for user in active_users:
-        seconds = int(user.get("transcribed_seconds", 0))
-        transcription_data.append(
-            {
-                "user": user["username"].split("@")[0],  # Show username without domain
-                "seconds": seconds,
-                "formatted": format_seconds_to_duration(seconds),
-            }
-        )
-
-    admin_count = sum(1 for user in active_users if user.get("admin", False))
-    regular_count = len(active_users) - admin_count
-    recent_activity = []
-    now = datetime.now()
-
-    for user in active_users:
-        try:
-            last_login = datetime.fromisoformat(
-                user["last_login"].replace("Z", "+00:00")
+    category_axis = {"type": "category", "data": labels}
+    value_axis = {"type": "value"}
+
+    ui.echart(
+        {
+            "title": {"text": title, "textStyle": {"fontSize": 14}},
+            "tooltip": {"trigger": "axis"},
+            "grid": {"containLabel": True, "left": 10, "right": 10},
+            "xAxis": value_axis if horizontal else category_axis,
+            "yAxis": category_axis if horizontal else value_axis,
+            "series": [{"type": "bar", "data": values}],
+        }
+    ).classes("w-full h-64")
+
+
+def create_charts(analytics: UsageAnalytics) -> None:
+    """
+    Draw the usage analytics of a statistics snapshot.
+    """
+    buckets = analytics.activity_buckets()
+
+    with ui.row().classes("w-full gap-6 mb-8"):
+        for label, count in buckets.items():
+            with ui.card().classes("metric-card flex-1"):
+                ui.html(f'<div class="metric-value">{count}</div>')
+                ui.html(f'<div class="metric-label">Last login: {label}</div>')
+
+    with ui.grid(columns=2).classes("w-full gap-6 mb-8"):
+        with ui.card():
+            realms = analytics.realms
+            bar_chart(
+                "Transcribed hours per realm",
+                realms.index.astype(str).tolist(),
+                (realms["seconds"] / 3600).round(1).tolist(),
             )
-            days_ago = (now - last_login).days
-            if days_ago <= 7:
-                recent_activity.append(
-                    {
-                        "day": f"{days_ago} days ago" if days_ago > 0 else "Today",
-                        "user": user["username"].split("@")[0],
-                    }
-                )
-        except:
-            pass
 
-    return {
-        "transcription": transcription_data,
-        "user_types": [
-            {"type": "Admin", "count": admin_count},
-            {"type": "Regular", "count": regular_count},
-        ],
-        "recent_activity": recent_activity,
-    }
+        with ui.card():
+            # Largest first, from the top of the chart.
+            top_users = analytics.top_users.iloc[::-1]
+            bar_chart(
+                f"Top {len(top_users)} users (hours)",
+                top_users["name"].tolist(),
+                (top_users["transcribed_seconds"] / 3600).round(1).tolist(),
+                horizontal=True,
+            )
+
+        with ui.card():
+            percentiles = analytics.percentiles
+            bar_chart(
+                "Transcribed hours per user, percentiles",
+                [f"p{round(p * 100)}" for p in percentiles.index],
+                (percentiles / 3600).round(1).tolist(),
+            )
+
+        with ui.card():
+            daily = analytics.daily_activity()
+            bar_chart(
+                "Users by days since last login",
+                [str(day) for day in range(len(daily))],
+                daily.tolist(),
+            )
+
+
+def format_bytes(count: float) -> str:
+    """
+    Convert a byte count to a human readable size.
+    """
+    for unit in ("B", "KB", "MB", "GB"):
+        if count < 1024:
+            return f"{count:.0f} {unit}"
+        count /= 1024
+
+    return f"{count:.1f} TB"
+
+
+@ui.refreshable
+def health_panel() -> None:
+    """
+    Show the current health figures of the UI server.
+    """
+    snapshot = health.snapshot()
+    clients = snapshot["clients"]
+    video = snapshot["video"]
+    editors = snapshot["editors"]
+
+    figures = [
+        (f"{snapshot['event_loop']['lag'] * 1000:.0f} ms", "Event loop lag"),
+        (f"{snapshot['event_loop']['max_lag'] * 1000:.0f} ms", "Max lag, last minute"),
+        (f"{clients['connected']} / {clients['total']}", "Connected clients"),
+        (clients["sessions"], "Sessions"),
+        (video["active_streams"], "Video streams"),
+        (f"{format_bytes(video['bytes_per_second'])}/s", "Video proxied"),
+        (snapshot["uploads_in_flight"], "Uploads in flight"),
+        (format_bytes(editors["bytes"]), f"Memory of {editors['count']} editors"),
+    ]
+
+    with ui.grid(columns=4).classes("w-full gap-4 mb-4"):
+        for value, label in figures:
+            with ui.card().classes("metric-card"):
+                ui.html(f'<div class="metric-value">{value}</div>')
+                ui.html(f'<div class="metric-label">{label}</div>')
+
+    rows = [
+        {
+            "endpoint": endpoint,
+            "calls": window["calls"],
+            "errors": window["errors"],
+            **{
+                p: f"{window[p] * 1000:.0f} ms"
+                for p in ("p50", "p90", "p99")
+                if p in window
+            },
+        }
+        for endpoint, window in snapshot["backend"].items()
+    ]
+    columns = [
+        {"name": "endpoint", "label": "Backend endpoint", "field": "endpoint"},
+        {"name": "calls", "label": "Calls", "field": "calls"},
+        {"name": "errors", "label": "Errors", "field": "errors"},
+        {"name": "p50", "label": "p50", "field": "p50"},
+        {"name": "p90", "label": "p90", "field": "p90"},
+        {"name": "p99", "label": "p99", "field": "p99"},
+    ]
+    for column in columns:
+        column["align"] = "left" if column["name"] == "endpoint" else "right"
+
+    ui.table(columns=columns, rows=rows, row_key="endpoint").classes("w-full")
+
+
+def create_health_endpoint() -> None:
+    """
+    Create the endpoint returning the health figures as JSON for admins.
+    """
+
+    @app.get("/admin/health")
+    async def server_health():
+        if not get_auth_header():
+            return Response(
+                content="Unauthorized",
+                status_code=401,
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+
+        if not get_admin_status(await load_user_data()):
+            return Response(content="Forbidden", status_code=403)
+
+        return health.snapshot()
 
 
 def create() -> None:
+    create_health_endpoint()
+
     @ui.refreshable
     @ui.page("/admin")
-    def home() -> None:
+    @measure_page("/admin")
+    async def home() -> None:
         """
         Admin dashboard page with statistics and charts.
         """
-        if not get_admin_status():
+        user_data = await load_user_data()
+
+        if not get_admin_status(user_data):
             ui.navigate.to("/home")
             return
 
-        page_init()
+        page_init(user_data=user_data)
+
+        async def force_refresh() -> None:
+            await statistics_cache.refresh(force=True)
+            home.refresh()
 
         try:
-            statistics = get_statistics()
+            # Served from the shared snapshot, which is only waited for
+            # when no admin has loaded the statistics yet.
+            statistics = await statistics_cache.get(get_auth_header())
+
+            with ui.row().classes("w-full items-center justify-end gap-2"):
+                ui.label(
+                    f"Last updated {statistics_cache.updated:%Y-%m-%d %H:%M:%S}"
+                ).classes("text-sm text-gray-500")
+                if statistics_cache.error:
+                    ui.icon("warning", color="orange").tooltip(
+                        f"Refresh failed: {statistics_cache.error}"
+                    )
+                ui.button(icon="refresh", on_click=force_refresh).props(
+                    "flat color=primary"
+                ).tooltip("Refresh statistics")
+                with ui.dropdown_button("Export", icon="download").props(
+                    "flat color=primary"
+                ):
+                    for table in EXPORT_TABLES:
+                        for export_format in EXPORT_FORMATS:
+                            ui.item(
+                                f"{table.capitalize()} as {export_format.upper()}",
+                                on_click=lambda url=(
+                                    f"/admin/export/{table}/{export_format}"
+                                ): ui.download(url),
+                            )
+
             result = statistics.get("result", {})
 
             total_users = result.get("total_users", 0)
-            active_users = result.get("active_users", [])
             total_transcribed_seconds = result.get("total_transcribed_seconds", 0)
 
             with ui.row().classes("w-full gap-6 mb-8"):
@@ -145,6 +292,10 @@ def create() -> None:
                     )
                     ui.html('<div class="metric-label">Total Transcription Time</div>')
 
+            # Computed once per snapshot, off the event loop.
+            analytics = await run.io_bound(analyze, statistics)
+            create_charts(analytics)
+
             columns = [
                 {
                     "name": "username",
@@ -170,27 +321,41 @@ def create() -> None:
                     "field": "transcribed_seconds",
                     "align": "right",
                 },
+                {
+                    "name": "last_login",
+                    "label": "Last Login",
+                    "field": "last_login",
+                    "align": "right",
+                },
             ]
+            for column in columns:
+                column["sortable"] = True
 
-            table_data = []
-            for user in active_users:
-                table_data.append(
-                    {
-                        "username": user.get("username", "N/A"),
-                        "realm": user.get("realm", "N/A"),
-                        "admin": "👑 Admin" if user.get("admin", False) else "👤 User",
-                        "transcribed_seconds": format_seconds_to_duration(
-                            int(user.get("transcribed_seconds", 0))
-                        ),
-                        "last_login": format_last_login(
-                            user.get("last_login", "Never")
-                        ),
-                    }
-                )
+            def format_user(user: dict) -> dict:
+                last_login = user["last_login"]
+                return {
+                    "username": user["username"],
+                    "realm": user["realm"],
+                    "admin": "👑 Admin" if user["admin"] else "👤 User",
+                    "transcribed_seconds": format_seconds_to_duration(
+                        user["transcribed_seconds"]
+                    ),
+                    "last_login": (
+                        "Never"
+                        if pd.isna(last_login)
+                        else format_last_login(last_login.isoformat())
+                    ),
+                }
 
-            ui.table(columns=columns, rows=table_data, pagination=10).classes(
-                "w-full h-full"
-            )
+            # Only the visible page is formatted and sent to the browser.
+            PagedTable(
+                columns,
+                analytics.users,
+                format_user,
+                search_columns=["username", "realm"],
+                sort_by="transcribed_seconds",
+                descending=True,
+            ).render("Search users").classes("w-full h-full")
 
         except Exception as e:
             with ui.column().classes("w-full items-center justify-center min-h-96"):
@@ -200,3 +365,18 @@ def create() -> None:
                 )
                 ui.html(f'<div class="text-gray-600">{str(e)}</div>')
                 ui.button("🔄 Retry", on_click=home.refresh).classes("refresh-btn mt-4")
+
+        # Shown even when the statistics cannot be loaded, and only updated
+        # while it is open.
+        with ui.expansion("Server health", icon="monitor_heart").classes(
+            "w-full mt-8"
+        ) as expansion:
+            health_panel()
+            timer = ui.timer(HEALTH_INTERVAL, health_panel.refresh, active=False)
+
+        def toggle_health(opened: bool) -> None:
+            timer.active = opened
+            if opened:
+                health_panel.refresh()
+
+        expansion.on_value_change(lambda e: toggle_health(e.value))
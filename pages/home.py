@@ -8,11 +8,13 @@ from utils.common import (
     table_upload,
     table_delete,
 )
+from utils.metrics import measure_page
 
 
 def create() -> None:
     @ui.refreshable
     @ui.page("/home")
+    @measure_page("/home")
     def home() -> None:
         """
         Main page of the application.
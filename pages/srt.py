@@ -1,24 +1,56 @@
+import asyncio
 import requests
 
+from nicegui import run
 from nicegui import ui
-from utils.common import API_URL
-from utils.common import get_auth_header
+from utils.autosave import EditJournal
+from utils.autosave import has_unsaved_edits
+from utils.autosave import journal_path
+from utils.autosave import journal_version
+from utils.autosave import load_journal
+from utils.autosave import start_autosave
+from utils.autosave import usable_journal
+from utils.common import fetch_result
+from utils.common import loading_placeholder
 from utils.common import page_init
+from utils.common import save_result
+from utils.metrics import measure_page
+from utils.token import load_user_data
+from utils.exporters import create_export_endpoint
 from utils.video import create_video_proxy
 from utils.srt import SRTEditor
 
 create_video_proxy()
+create_export_endpoint()
+
+export_formats = {
+    "srt": "Export as SRT",
+    "vtt": "Export as VTT",
+    "ttml": "Export as TTML",
+    "dfxp": "Export as DFXP",
+    "sbv": "Export as SBV",
+    "json": "Export as JSON",
+}
+
+
+async def save_srt(job_id: str, editor: SRTEditor, notify: bool = True) -> bool:
+    saved = await save_result(
+        job_id,
+        "srt",
+        editor.changes,
+        editor.captions,
+        editor.serialize_caption,
+        lambda: {"format": "srt", "data": editor.export_srt()},
+    )
 
+    if not notify:
+        return saved
 
-def save_srt(job_id: str, data: str, editor: SRTEditor) -> None:
-    jsondata = {"format": "srt", "data": data}
-    headers = get_auth_header()
-    headers["Content-Type"] = "application/json"
-    requests.put(
-        f"{API_URL}/api/v1/transcriber/{job_id}/result",
-        headers=headers,
-        json=jsondata,
-    )
+    if not saved:
+        # A conflict has already been shown by save_result.
+        if not editor.changes.conflict:
+            ui.notify("Error: Failed to save file", type="negative", position="bottom")
+        return saved
 
     ui.notify(
         "File saved successfully",
@@ -27,56 +59,65 @@ def save_srt(job_id: str, data: str, editor: SRTEditor) -> None:
         icon="check_circle",
     )
 
+    return saved
+
 
 def create() -> None:
     @ui.page("/srt")
-    def result(uuid: str, filename: str, model: str, language: str) -> None:
+    @measure_page("/srt")
+    async def result(uuid: str, filename: str, model: str, language: str) -> None:
         """
         Display the result of the transcription job.
-        """
-        page_init()
 
-        try:
-            response = requests.get(
-                f"{API_URL}/api/v1/transcriber/{uuid}/result/srt",
-                headers=get_auth_header(),
-            )
-            response.raise_for_status()
-            data = response.json()
-        except requests.exceptions.RequestException as e:
-            ui.notify(f"Error: Failed to get result: {e}")
-            return
+        The layout and the video are sent first with a placeholder for the
+        captions, which are then loaded and sent in batches.
+        """
+        # The profile for the header and the result are requested together,
+        # the result is only awaited once the page has been shown.
+        profile = load_user_data()
+
+        # Unsaved work from an earlier session is replayed from the local
+        # journal if the result hasn't changed since, in which case the
+        # result isn't downloaded again.
+        saved_edits = load_journal(journal_path(uuid, "srt"))
+        result = asyncio.ensure_future(
+            fetch_result(uuid, "srt", journal_version(saved_edits))
+        )
+
+        page_init(user_data=await profile)
+
+        editor = SRTEditor()
+        journal = EditJournal(
+            journal_path(uuid, "srt"),
+            lambda: editor.captions,
+            editor.serialize_caption,
+        )
 
         with ui.row():
 
             def export(srt_format: str):
-                if srt_format == "srt":
-                    srt_content = editor.export_srt()
-                elif srt_format == "vtt":
-                    srt_content = editor.export_vtt()
-
-                ui.download(srt_content.encode(), filename=f"{filename}.{srt_format}")
+                # The file is streamed by the export endpoint rather than
+                # being built in memory and pushed over the websocket.
+                ui.download(editor.export_url(srt_format, filename, language=language))
                 ui.notify("File exported successfully", type="positive")
 
             with ui.button("Save", icon="save").style("width: 150px;") as save_button:
                 save_button.on(
                     "click",
-                    lambda: save_srt(uuid, editor.export_srt(), editor),
+                    lambda: save_srt(uuid, editor),
                 )
                 save_button.props("color=primary flat")
 
             with ui.dropdown_button("Export", icon="share").props("color=primary flat"):
-                export_button_srt = ui.button("Export as SRT", icon="share").style(
-                    "width: 150px;"
-                )
-                export_button_srt.props("color=primary flat")
-                export_button_srt.on("click", lambda: export("srt"))
-
-                export_button_vtt = ui.button("Export as VTT", icon="share").style(
-                    "width: 150px;"
-                )
-                export_button_vtt.props("color=primary flat")
-                export_button_vtt.on("click", lambda: export("vtt"))
+                for export_format, label in export_formats.items():
+                    export_button = ui.button(label, icon="share").style(
+                        "width: 150px;"
+                    )
+                    export_button.props("color=primary flat")
+                    export_button.on(
+                        "click",
+                        lambda export_format=export_format: export(export_format),
+                    )
 
             with ui.button("Validate", icon="check").props(
                 "color=primary flat"
@@ -86,17 +127,24 @@ def create() -> None:
                     lambda: editor.validate_captions(),
                 )
 
+            ui.button("Undo", icon="undo").props("color=primary flat").on(
+                "click", lambda: editor.undo()
+            )
+            ui.button("Redo", icon="redo").props("color=primary flat").on(
+                "click", lambda: editor.redo()
+            )
+
         ui.separator()
 
         with ui.splitter(value=60).classes("w-full h-full") as splitter:
             with splitter.before:
                 with ui.card().classes("w-full h-full"):
-                    editor = SRTEditor()
                     editor.create_search_panel()
+                    editor.create_issues_panel()
                     with ui.scroll_area().style("height: calc(100vh - 200px);"):
                         editor.main_container = ui.column().classes("w-full h-full")
-                    editor.parse_srt(data["result"])
-                    editor.refresh_display()
+                        with editor.main_container:
+                            loading_placeholder()
                 with splitter.after:
                     with ui.card().classes("w-full h-full"):
                         autoscroll = ui.switch("Autoscroll")
@@ -121,3 +169,43 @@ def create() -> None:
                             f"<b>Words per minute:</b> {editor.get_words_per_minute():.2f}"
                         ).classes("text-sm")
                         editor.set_words_per_minute_element(html_wpm)
+
+        # Everything below runs after the page has been shown.
+        await ui.context.client.connected()
+
+        try:
+            data = await result
+        except requests.exceptions.RequestException as e:
+            editor.main_container.clear()
+            ui.notify(f"Error: Failed to get result: {e}")
+            return
+
+        restored = usable_journal(saved_edits, data.get("version"))
+        if restored is not None:
+            editor.restore_journal(restored)
+            ui.notify("Restored unsaved changes", type="info")
+        else:
+            if has_unsaved_edits(saved_edits):
+                ui.notify(
+                    "Unsaved changes from an earlier session were discarded, "
+                    "the file has been changed since",
+                    type="warning",
+                )
+            await run.io_bound(editor.parse_srt, data["result"], data.get("version"))
+        del data
+
+        if editor.parse_errors:
+            ui.notify(
+                f"{len(editor.parse_errors)} problems while reading "
+                f"the subtitles, first: {editor.parse_errors[0]}",
+                type="warning",
+            )
+        journal.attach(editor.changes)
+        start_autosave(
+            journal,
+            editor.changes,
+            lambda: save_srt(uuid, editor, notify=False),
+        )
+        editor.update_words_per_minute()
+        editor.refresh_issues()
+        await editor.render_progressively()
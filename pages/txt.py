@@ -1,29 +1,62 @@
+import asyncio
 import requests
 
+from nicegui import run
 from nicegui import ui
-from utils.common import API_URL
-from utils.common import get_auth_header
+from utils.autosave import EditJournal
+from utils.autosave import has_unsaved_edits
+from utils.autosave import journal_path
+from utils.autosave import journal_version
+from utils.autosave import load_journal
+from utils.autosave import start_autosave
+from utils.autosave import usable_journal
+from utils.common import fetch_result
+from utils.common import loading_placeholder
 from utils.common import page_init
+from utils.common import save_result
+from utils.metrics import measure_page
+from utils.token import load_user_data
 from utils.video import create_video_proxy
 from utils.transcript import TranscriptEditor
 
 create_video_proxy()
 
+# Subtitle formats that can be built from the transcript.
+subtitle_formats = {
+    "srt": "SRT subtitles",
+    "vtt": "WebVTT subtitles",
+}
+
 
 def export_file(data: str, filename: str) -> None:
     ui.download.content(data, filename)
 
 
-def save_file(job_id: str, data: str) -> None:
-    data["format"] = "json"
-    headers = get_auth_header()
-    headers["Content-Type"] = "application/json"
-    requests.put(
-        f"{API_URL}/api/v1/transcriber/{job_id}/result",
-        headers=headers,
-        json=data,
+async def save_file(job_id: str, editor: TranscriptEditor, notify: bool = True) -> bool:
+    def full_data() -> dict:
+        data = editor.get_json_data()
+        data["format"] = "json"
+        return data
+
+    editor.apply_pending_text()
+    saved = await save_result(
+        job_id,
+        "json",
+        editor.changes,
+        editor.segments,
+        lambda segment: segment.to_dict(),
+        full_data,
     )
 
+    if not notify:
+        return saved
+
+    if not saved:
+        # A conflict has already been shown by save_result.
+        if not editor.changes.conflict:
+            ui.notify("Error: Failed to save file", type="negative", position="bottom")
+        return saved
+
     ui.notify(
         "File saved successfully",
         type="positive",
@@ -31,45 +64,77 @@ def save_file(job_id: str, data: str) -> None:
         icon="check_circle",
     )
 
+    return saved
+
 
 def create() -> None:
     @ui.page("/txt")
-    def result(uuid: str, filename: str, language: str, model: str) -> None:
-        page_init()
-
-        try:
-            response = requests.get(
-                f"{API_URL}/api/v1/transcriber/{uuid}/result/txt",
-                headers=get_auth_header(),
-            )
-            response.raise_for_status()
-        except requests.exceptions.RequestException as e:
-            ui.notify(f"Error: Failed to get result: {e}", type="negative")
-            return
-
-        data = response.json()
-        editor = TranscriptEditor(data["result"])
+    @measure_page("/txt")
+    async def result(uuid: str, filename: str, language: str, model: str) -> None:
+        """
+        Display the transcript of a job.
+
+        The layout and the video are sent first with a placeholder for the
+        transcript, which is then loaded and rendered.
+        """
+        # The profile for the header and the result are requested together,
+        # the result is only awaited once the page has been shown.
+        profile = load_user_data()
+
+        # Unsaved work from an earlier session is replayed from the local
+        # journal if the result hasn't changed since, in which case the
+        # result isn't downloaded again.
+        saved_edits = load_journal(journal_path(uuid, "txt"))
+        result = asyncio.ensure_future(
+            fetch_result(uuid, "txt", journal_version(saved_edits))
+        )
+
+        page_init(user_data=await profile)
+
+        editor = TranscriptEditor()
+        editor.add_assets()
+        journal = EditJournal(
+            journal_path(uuid, "txt"),
+            lambda: editor.segments,
+            lambda segment: segment.to_journal(),
+        )
 
         ui.add_css(".q-editor__toolbar { display: none }")
 
         with ui.row().classes("justify-between items-center mb-4"):
             with ui.button_group().props("outline"):
                 ui.button("Save", icon="save").style("width: 150px;").on_click(
-                    lambda: save_file(uuid, editor.get_json_data())
+                    lambda: save_file(uuid, editor)
                 )
-                ui.button("Export", icon="share").style("width: 150px;").on_click(
-                    lambda: export_file(
-                        editor.get_export_data(),
-                        f"{filename}.txt",
+                with ui.dropdown_button("Export", icon="share").style("width: 150px;"):
+                    ui.item(
+                        "Text",
+                        on_click=lambda: export_file(
+                            editor.get_export_data(),
+                            f"{filename}.txt",
+                        ),
                     )
-                )
+                    for export_format, label in subtitle_formats.items():
+                        ui.item(
+                            label,
+                            on_click=lambda export_format=export_format: export_file(
+                                editor.get_subtitles(export_format),
+                                f"{filename}.{export_format}",
+                            ),
+                        )
+                ui.button("Undo", icon="undo").on_click(lambda: editor.undo())
+                ui.button("Redo", icon="redo").on_click(lambda: editor.redo())
 
         ui.separator()
 
         with ui.splitter(value=60).classes("w-full h-screen") as splitter:
             with splitter.before:
-                with ui.scroll_area().style("height: calc(100vh - 200px);"):
-                    editor.render()
+                editor.create_search_panel()
+                editor.create_speaker_panel()
+                with ui.scroll_area().style(
+                    "height: calc(100vh - 200px);"
+                ) as scroll_area:
+                    loading_placeholder()
 
             with splitter.after:
                 with ui.card().classes("w-full h-full"):
@@ -95,3 +160,41 @@ def create() -> None:
                     ui.html(f"<b>Filename:</b> {filename}").classes("text-sm")
                     ui.html(f"<b>Language:</b> {language}").classes("text-sm")
                     ui.html(f"<b>Model:</b> {model}").classes("text-sm")
+
+        # Everything below runs after the page has been shown.
+        await ui.context.client.connected()
+
+        try:
+            data = await result
+        except requests.exceptions.RequestException as e:
+            scroll_area.clear()
+            ui.notify(f"Error: Failed to get result: {e}", type="negative")
+            return
+
+        restored = usable_journal(saved_edits, data.get("version"))
+        if restored is not None:
+            editor.restore_journal(restored)
+            ui.notify("Restored unsaved changes", type="info")
+        else:
+            if has_unsaved_edits(saved_edits):
+                ui.notify(
+                    "Unsaved changes from an earlier session were discarded, "
+                    "the file has been changed since",
+                    type="warning",
+                )
+            await run.io_bound(editor.load, data["result"], data.get("version"))
+        del data
+
+        # Text still being typed is applied before the journal is flushed.
+        ui.context.client.on_disconnect(editor.apply_pending_text)
+        journal.attach(editor.changes)
+        start_autosave(
+            journal, editor.changes, lambda: save_file(uuid, editor, notify=False)
+        )
+
+        # Only the rows in view are rendered, so the transcript is usable
+        # as soon as this returns regardless of its length.
+        editor.update_speaker_options()
+        scroll_area.clear()
+        with scroll_area:
+            editor.render(scroll_area)
@@ -2,19 +2,24 @@ from nicegui import ui
 from utils.common import (
     page_init,
 )
-from utils.token import get_user_data
+from utils.metrics import measure_page
+from utils.paging import PagedTable
+from utils.token import load_user_data
 from datetime import datetime
+import pandas as pd
 
 
 def create() -> None:
     @ui.refreshable
     @ui.page("/user")
-    def home() -> None:
+    @measure_page("/user")
+    async def home() -> None:
         """
         User page for managing user settings and information.
         """
-        page_init()
-        userdata = get_user_data()
+        # One profile request serves both the header and the page.
+        userdata = await load_user_data()
+        page_init(user_data=userdata)
 
         with ui.row().classes("w-full justify-center"):
             ui.label("User Dashboard").classes("text-3xl font-bold text-blue-600")
@@ -81,46 +86,65 @@ def create() -> None:
                             "label": "Filename",
                             "field": "filename",
                             "align": "left",
+                            "sortable": True,
                         },
                         {
                             "name": "job_type",
                             "label": "Type",
                             "field": "job_type",
                             "align": "center",
+                            "sortable": True,
                         },
                         {
                             "name": "created_at",
                             "label": "Created",
                             "field": "created_at",
                             "align": "center",
+                            "sortable": True,
                         },
                         {
                             "name": "deletion_date",
                             "label": "Expires",
                             "field": "deletion_date",
                             "align": "center",
+                            "sortable": True,
                         },
                     ]
 
-                    jobs_data = []
-                    for job in userdata["jobs"]["jobs"]:
-                        created_date = datetime.fromisoformat(
-                            job["created_at"].replace(" ", "T")
-                        )
-                        deletion_date = datetime.fromisoformat(
-                            job["deletion_date"].replace(" ", "T")
-                        )
-
-                        jobs_data.append(
-                            {
-                                "filename": job["filename"],
-                                "job_type": job["job_type"].capitalize(),
-                                "created_at": created_date.strftime("%m/%d/%Y %H:%M"),
-                                "deletion_date": deletion_date.strftime("%m/%d/%Y"),
-                            }
+                    jobs = pd.DataFrame.from_records(
+                        userdata["jobs"]["jobs"],
+                        columns=["filename", "job_type", "created_at", "deletion_date"],
+                    )
+                    for column in ("created_at", "deletion_date"):
+                        jobs[column] = pd.to_datetime(
+                            jobs[column], errors="coerce", format="ISO8601"
                         )
 
-                    ui.table(columns=columns, rows=jobs_data).classes("w-full").style(
+                    def format_date(value, date_format: str) -> str:
+                        # Dates that couldn't be parsed are NaT.
+                        return "" if pd.isna(value) else value.strftime(date_format)
+
+                    def format_job(job: dict) -> dict:
+                        return {
+                            "filename": job["filename"],
+                            "job_type": job["job_type"].capitalize(),
+                            "created_at": format_date(
+                                job["created_at"], "%m/%d/%Y %H:%M"
+                            ),
+                            "deletion_date": format_date(
+                                job["deletion_date"], "%m/%d/%Y"
+                            ),
+                        }
+
+                    # Only the visible page is formatted and sent to the browser.
+                    PagedTable(
+                        columns,
+                        jobs,
+                        format_job,
+                        search_columns=["filename", "job_type"],
+                        sort_by="created_at",
+                        descending=True,
+                    ).render("Search jobs").classes("w-full").style(
                         "box-shadow: none;"
                     )
 
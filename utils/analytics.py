@@ -0,0 +1,119 @@
+import numpy as np
+import pandas as pd
+
+from typing import Dict
+from typing import Optional
+
+# Users shown in the top users chart, and the percentiles of transcribed
+# time shown in the distribution chart.
+TOP_USERS = 10
+PERCENTILES = (0.5, 0.75, 0.9, 0.95, 0.99)
+
+# Days covered by the daily activity chart.
+ACTIVITY_DAYS = 30
+
+USER_COLUMNS = ["username", "realm", "admin", "transcribed_seconds", "last_login"]
+
+
+def users_frame(active_users: list) -> pd.DataFrame:
+    """
+    Load the per-user statistics into a columnar frame.
+
+    Every column is parsed once here, including the login times, so the
+    analytics below are whole-column operations.
+    """
+
+    frame = pd.DataFrame.from_records(active_users, columns=USER_COLUMNS)
+
+    frame["username"] = frame["username"].fillna("N/A").astype(str)
+    frame["name"] = frame["username"].str.split("@", n=1).str[0]
+    frame["realm"] = frame["realm"].fillna("N/A").astype("category")
+    frame["admin"] = frame["admin"].fillna(False).astype(bool)
+    frame["transcribed_seconds"] = (
+        pd.to_numeric(frame["transcribed_seconds"], errors="coerce")
+        .fillna(0)
+        .astype("int64")
+    )
+    frame["last_login"] = pd.to_datetime(
+        frame["last_login"], errors="coerce", utc=True, format="ISO8601"
+    )
+
+    return frame
+
+
+class UsageAnalytics:
+    def __init__(self, active_users: list, now: Optional[pd.Timestamp] = None):
+        """
+        Usage analytics over the per-user statistics, computed once per
+        statistics snapshot.
+        """
+
+        self.now = now or pd.Timestamp.now(tz="UTC")
+        self.users = users_frame(active_users)
+
+        seconds = self.users["transcribed_seconds"]
+
+        self.realms = (
+            self.users.groupby("realm", observed=True)
+            .agg(
+                users=("username", "size"),
+                seconds=("transcribed_seconds", "sum"),
+            )
+            .sort_values("seconds", ascending=False)
+        )
+        self.top_users = self.users.nlargest(TOP_USERS, "transcribed_seconds")[
+            ["name", "realm", "transcribed_seconds"]
+        ]
+        self.percentiles = (
+            seconds.quantile(PERCENTILES) if len(seconds) else pd.Series(dtype=float)
+        )
+        self.admins = int(self.users["admin"].sum())
+
+        # Whole days since the last login, -1 for users that never logged in.
+        days = (self.now - self.users["last_login"]).dt.days.clip(lower=0)
+        self.days_since_login = days.fillna(-1).astype("int64").to_numpy()
+
+    def activity_buckets(self) -> Dict[str, int]:
+        """
+        Number of users by how recently they last logged in.
+        """
+
+        days = self.days_since_login
+        logged_in = days >= 0
+
+        return {
+            "Last 7 days": int(np.count_nonzero(logged_in & (days <= 7))),
+            "8-30 days": int(np.count_nonzero((days >= 8) & (days <= 30))),
+            "Over 30 days": int(np.count_nonzero(days > 30)),
+            "Never": int(np.count_nonzero(~logged_in)),
+        }
+
+    def daily_activity(self) -> np.ndarray:
+        """
+        Number of users whose last login was 0, 1, ... ACTIVITY_DAYS - 1
+        days ago.
+        """
+
+        days = self.days_since_login
+        recent = days[(days >= 0) & (days < ACTIVITY_DAYS)]
+
+        return np.bincount(recent, minlength=ACTIVITY_DAYS)
+
+
+# The analytics of the latest statistics snapshot, shared by all admins.
+_latest: tuple = (None, None)
+
+
+def analyze(statistics: dict) -> UsageAnalytics:
+    """
+    Get the analytics of a statistics snapshot, computing them only the
+    first time the snapshot is seen.
+    """
+
+    global _latest
+
+    if _latest[0] is not statistics:
+        active_users = statistics.get("result", {}).get("active_users", [])
+        _latest = (statistics, UsageAnalytics(active_users))
+
+    return _latest[1]
@@ -0,0 +1,380 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+
+from nicegui import app
+from nicegui import run
+from nicegui import ui
+from typing import Any
+from typing import Awaitable
+from typing import Callable
+from typing import List
+from typing import Optional
+from typing import Set
+from utils.changes import ChangeTracker
+from utils.settings import get_settings
+
+settings = get_settings()
+
+# Last time old journals were removed, see prune_journals().
+_last_prune = 0.0
+
+
+def journal_path(job_id: str, result_format: str) -> str:
+    """
+    Get the journal file of a job for the current browser session.
+    """
+
+    browser_id = app.storage.browser.get("id", "")
+    key = hashlib.sha256(f"{browser_id}:{job_id}:{result_format}".encode())
+
+    return os.path.join(settings.JOURNAL_DIR, f"{key.hexdigest()}.jsonl")
+
+
+def prune_journals() -> None:
+    """
+    Remove journals that haven't been written to for JOURNAL_MAX_AGE seconds.
+    This runs at most once an hour.
+    """
+
+    global _last_prune
+
+    now = time.time()
+    if now - _last_prune < 3600:
+        return
+
+    _last_prune = now
+
+    try:
+        entries = list(os.scandir(settings.JOURNAL_DIR))
+    except OSError:
+        return
+
+    for entry in entries:
+        try:
+            if now - entry.stat().st_mtime > settings.JOURNAL_MAX_AGE:
+                os.remove(entry.path)
+        except OSError:
+            continue
+
+
+def load_journal(path: str) -> Optional[dict]:
+    """
+    Read a journal, returning the snapshot and the operations after it.
+    A line cut short by a crash ends the journal.
+    """
+
+    try:
+        with open(path, encoding="utf-8") as journal:
+            snapshot = json.loads(journal.readline())
+            operations = []
+            for line in journal:
+                try:
+                    operations.append(json.loads(line))
+                except ValueError:
+                    break
+    except (OSError, ValueError):
+        return None
+
+    snapshot["operations"] = operations
+
+    return snapshot
+
+
+def has_unsaved_edits(journal: Optional[dict]) -> bool:
+    return bool(journal and (journal["tracker"]["changes"] or journal["operations"]))
+
+
+def journal_version(journal: Optional[dict]) -> Optional[int]:
+    """
+    Get the version of the result that the unsaved edits of a loaded
+    journal were made to, so that the result only needs to be downloaded
+    if it has changed since.
+    """
+
+    if not has_unsaved_edits(journal):
+        return None
+
+    return journal["tracker"]["version"]
+
+
+def usable_journal(journal: Optional[dict], version: Optional[int]) -> Optional[dict]:
+    """
+    Get a loaded journal if it holds unsaved edits of the given version of
+    the result. Edits made to an older version are not replayed, as that
+    would overwrite whatever changed the result since.
+    """
+
+    if not has_unsaved_edits(journal):
+        return None
+    if journal["tracker"]["version"] != version:
+        return None
+
+    return journal
+
+
+class EditJournal:
+    def __init__(
+        self,
+        path: str,
+        get_items: Callable[[], List[Any]],
+        serialize: Callable[[Any], dict],
+    ):
+        """
+        Append-only journal of edit operations for one editor.
+
+        The first line is a snapshot of the document and of the change
+        tracker; every following line is a single operation. The journal
+        only exists while there are unsaved edits: it is started by the
+        first edit, removed after each save and compacted into a new
+        snapshot whenever it grows past JOURNAL_MAX_OPS operations.
+
+        Operations are collected in memory and written by flush(), which
+        runs on the autosave timer, so a large edit such as a replace-all
+        costs one write instead of one per item. File access happens in a
+        worker thread.
+        """
+
+        self.path = path
+        self.get_items = get_items
+        self.serialize = serialize
+        self.tracker: Optional[ChangeTracker] = None
+        self.enabled = True
+        self.written = False
+        self.operations = 0
+        self.last_write = 0.0
+        # Operations not yet written, as (kind, item, position).
+        self.pending: List[tuple] = []
+        self.pending_updates: Set[int] = set()
+        # Set when the next flush should write a new snapshot, or remove
+        # the journal if the document has been saved.
+        self.compact_due = False
+        self.flush_lock = asyncio.Lock()
+
+    def attach(self, tracker: ChangeTracker) -> None:
+        """
+        Start recording the changes of a tracker. A journal left from an
+        earlier session is replaced, or removed if there are no unsaved
+        edits, on the next flush.
+        """
+
+        self.tracker = tracker
+        tracker.journal = self
+        self.compact()
+
+    def compact(self) -> None:
+        """
+        Replace the journal with a snapshot of the current document on the
+        next flush, or remove it if the document has been saved by then.
+        """
+
+        self.compact_due = True
+        self.pending = []
+        self.pending_updates = set()
+
+    def record(self, kind: str, item: Any) -> None:
+        """
+        Add one operation to be written by the next flush.
+        """
+
+        self.last_write = time.monotonic()
+
+        if not self.enabled:
+            return
+
+        if not self.written or self.compact_due:
+            # The first edit since the last save starts the journal with a
+            # snapshot that already includes it.
+            self.compact()
+            return
+
+        if kind == "update":
+            # The item is serialized when written, so one update per item
+            # is enough.
+            if item.item_id in self.pending_updates:
+                return
+            self.pending_updates.add(item.item_id)
+
+        position = None
+        if kind in ("insert", "move"):
+            position = self.get_items().index(item)
+
+        self.pending.append((kind, item, position))
+
+        if self.operations + len(self.pending) >= settings.JOURNAL_MAX_OPS:
+            self.compact()
+
+    async def flush(self) -> None:
+        """
+        Write the pending operations, or the snapshot if one is due.
+        """
+
+        if not self.tracker or not self.enabled:
+            return
+
+        async with self.flush_lock:
+            if self.compact_due:
+                await self._write_snapshot()
+                return
+
+            if not self.pending:
+                return
+
+            lines = []
+            for kind, item, position in self.pending:
+                operation = {"op": kind, "id": item.item_id}
+                if position is not None:
+                    operation["position"] = position
+                if kind in ("insert", "update"):
+                    operation["data"] = self.serialize(item)
+                lines.append(operation)
+
+            self.pending = []
+            self.pending_updates = set()
+
+            if not await run.io_bound(self._append, lines):
+                self.enabled = False
+                return
+
+            self.operations += len(lines)
+
+    async def _write_snapshot(self) -> None:
+        self.compact_due = False
+        self.operations = 0
+
+        if not self.tracker.is_dirty():
+            self.written = False
+            await run.io_bound(self._remove)
+            return
+
+        # The snapshot is taken on the event loop, edits made while it is
+        # written are recorded as operations after it.
+        snapshot = {
+            "tracker": self.tracker.get_state(),
+            "items": [
+                [item.item_id, self.serialize(item)] for item in self.get_items()
+            ],
+        }
+        self.written = True
+
+        if not await run.io_bound(self._replace, snapshot):
+            # Keep editing without a journal rather than failing the edit.
+            self.enabled = False
+
+    def _replace(self, snapshot: dict) -> bool:
+        tmp_path = f"{self.path}.tmp"
+
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as journal:
+                journal.write(json.dumps(snapshot, separators=(",", ":")) + "\n")
+                journal.flush()
+                os.fsync(journal.fileno())
+            os.replace(tmp_path, self.path)
+        except OSError:
+            return False
+
+        prune_journals()
+
+        return True
+
+    def _append(self, operations: List[dict]) -> bool:
+        # The file is opened per flush so that idle editors don't hold file
+        # handles; the write is flushed when it is closed.
+        try:
+            with open(self.path, "a", encoding="utf-8") as journal:
+                journal.write(
+                    "".join(
+                        json.dumps(operation, separators=(",", ":")) + "\n"
+                        for operation in operations
+                    )
+                )
+        except OSError:
+            return False
+
+        return True
+
+    def _remove(self) -> None:
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+def replay(
+    journal: dict,
+    tracker: ChangeTracker,
+    build: Callable[[dict], Any],
+    apply_data: Callable[[Any, dict], None],
+) -> List[Any]:
+    """
+    Rebuild the items and the tracker state from a loaded journal.
+    """
+
+    items = []
+    for item_id, data in journal["items"]:
+        item = build(data)
+        item.item_id = item_id
+        items.append(item)
+
+    tracker.set_state(journal["tracker"], items)
+    by_id = {item.item_id: item for item in items}
+
+    for operation in journal["operations"]:
+        kind = operation["op"]
+
+        if kind == "insert":
+            item = build(operation["data"])
+            items.insert(operation["position"], item)
+            tracker.next_id = operation["id"]
+            tracker.inserted(item)
+            by_id[item.item_id] = item
+            continue
+
+        item = by_id.get(operation["id"])
+        if item is None:
+            continue
+
+        if kind == "update":
+            apply_data(item, operation["data"])
+            tracker.updated(item)
+        elif kind == "move":
+            items.remove(item)
+            items.insert(operation["position"], item)
+            tracker.moved(item)
+        elif kind == "delete":
+            items.remove(item)
+            tracker.deleted(item)
+
+    return items
+
+
+def start_autosave(
+    journal: EditJournal,
+    tracker: ChangeTracker,
+    save: Callable[[], Awaitable[bool]],
+) -> ui.timer:
+    """
+    Flush the journal every second and save to the backend once no edit
+    has been made for AUTOSAVE_DELAY seconds. Nothing is saved after a
+    conflict, the edits are only kept in the journal.
+    """
+
+    async def tick() -> None:
+        await journal.flush()
+
+        if tracker.conflict or not tracker.is_dirty() or tracker.save_lock.locked():
+            return
+        if time.monotonic() - journal.last_write < settings.AUTOSAVE_DELAY:
+            return
+
+        # Don't retry a failing backend on every tick.
+        if not await save():
+            journal.last_write = time.monotonic()
+
+    # The timer stops with the page, write what is left when it closes.
+    ui.context.client.on_disconnect(journal.flush)
+
+    return ui.timer(1.0, tick)
@@ -0,0 +1,71 @@
+import re
+import requests
+import time
+
+from functools import lru_cache
+from typing import Optional
+from urllib.parse import urlsplit
+from utils import metrics
+from utils.health import health
+
+# Path segments that identify a single resource, replaced by a placeholder
+# so that calls are grouped by endpoint rather than by job.
+ID_SEGMENT_RE = re.compile(
+    r"/(?:[0-9a-fA-F]{8}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{4}-?"
+    r"[0-9a-fA-F]{12}|\d+)(?=/|$)"
+)
+
+
+@lru_cache(maxsize=4096)
+def endpoint_template(url: str) -> str:
+    """
+    Get the endpoint a backend URL belongs to, e.g.
+    /api/v1/transcriber/{uuid}/result/srt.
+    """
+
+    return ID_SEGMENT_RE.sub("/{uuid}", urlsplit(url).path) or "/"
+
+
+def record(method: str, url: str, status: Optional[int], seconds: float) -> None:
+    endpoint = endpoint_template(url)
+    health.record_backend_call(method, endpoint, status, seconds)
+    metrics.record_backend_call(method, endpoint, status, seconds)
+
+
+def request(method: str, url: str, **kwargs) -> requests.Response:
+    """
+    Make a request to the backend, recording how long it took.
+
+    Behaves like requests.request, including the exceptions it raises.
+    """
+
+    start = time.perf_counter()
+    try:
+        response = requests.request(method, url, **kwargs)
+    except requests.exceptions.RequestException:
+        record(method, url, None, time.perf_counter() - start)
+        raise
+
+    record(method, url, response.status_code, time.perf_counter() - start)
+
+    return response
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    return request("GET", url, **kwargs)
+
+
+def post(url: str, **kwargs) -> requests.Response:
+    return request("POST", url, **kwargs)
+
+
+def put(url: str, **kwargs) -> requests.Response:
+    return request("PUT", url, **kwargs)
+
+
+def patch(url: str, **kwargs) -> requests.Response:
+    return request("PATCH", url, **kwargs)
+
+
+def delete(url: str, **kwargs) -> requests.Response:
+    return request("DELETE", url, **kwargs)
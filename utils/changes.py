@@ -0,0 +1,185 @@
+import asyncio
+import copy
+
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+
+
+class ChangeTracker:
+    def __init__(self):
+        """
+        Track which captions or segments changed since the last save.
+
+        Items are identified by item_id, which is their position in the
+        version last saved to (or loaded from) the backend. Items added
+        since then get ids after the last position. Only dirty items are
+        turned into operations, so a save is proportional to the edit.
+        """
+
+        self.version: Optional[int] = None
+        self.changes: Dict[int, list] = {}
+        self.next_id = 0
+        self.journal = None
+        # Counts every change, so a save can tell whether the document was
+        # edited while it was being sent.
+        self.edits = 0
+        # Set when the changes no longer apply to the saved version, i.e.
+        # they were made while a save was in flight. The next save then
+        # sends the whole document.
+        self.full_save = False
+        # Set when the backend refused the changes because the result was
+        # changed elsewhere. Saving stops until the page is reloaded.
+        self.conflict = False
+        self.save_lock = asyncio.Lock()
+
+    def reset(self, items: List[Any], version: Optional[int] = None) -> None:
+        """
+        Start tracking from a clean state, e.g. after loading or saving.
+        """
+
+        for item_id, item in enumerate(items):
+            item.item_id = item_id
+
+        self.next_id = len(items)
+        self.version = version
+        self.changes = {}
+        self.full_save = False
+
+        if self.journal:
+            self.journal.compact()
+
+    def is_dirty(self) -> bool:
+        return bool(self.changes)
+
+    def inserted(self, item: Any) -> None:
+        self.edits += 1
+        item.item_id = self.next_id
+        self.next_id += 1
+        self.changes[item.item_id] = ["insert", item, False]
+
+        if self.journal:
+            self.journal.record("insert", item)
+
+    def updated(self, item: Any, moved: bool = False) -> None:
+        self.edits += 1
+        change = self.changes.get(item.item_id)
+
+        if change is None:
+            self.changes[item.item_id] = ["update", item, moved]
+        elif moved:
+            change[2] = True
+
+        if self.journal:
+            self.journal.record("move" if moved else "update", item)
+
+    def moved(self, item: Any) -> None:
+        self.updated(item, moved=True)
+
+    def deleted(self, item: Any) -> None:
+        self.edits += 1
+        change = self.changes.get(item.item_id)
+
+        # Inserting and then deleting an item is no change at all.
+        if change and change[0] == "insert":
+            del self.changes[item.item_id]
+        else:
+            self.changes[item.item_id] = ["delete", item, False]
+
+        if self.journal:
+            self.journal.record("delete", item)
+
+    def get_state(self) -> dict:
+        """
+        Get the tracker state in a form that can be stored as JSON.
+        """
+
+        return {
+            "version": self.version,
+            "next_id": self.next_id,
+            "full_save": self.full_save,
+            "changes": [
+                [item_id, kind, moved]
+                for item_id, (kind, _, moved) in self.changes.items()
+            ],
+        }
+
+    def set_state(self, state: dict, items: List[Any]) -> None:
+        """
+        Restore the state from get_state for items that already carry their
+        item_id.
+        """
+
+        by_id = {item.item_id: item for item in items}
+
+        self.version = state["version"]
+        self.next_id = state["next_id"]
+        self.full_save = state.get("full_save", False)
+        self.changes = {
+            item_id: [kind, by_id.get(item_id), moved]
+            for item_id, kind, moved in state["changes"]
+        }
+
+    def operations(
+        self, items: List[Any], serialize: Callable[[Any], dict]
+    ) -> List[dict]:
+        """
+        Build the insert/update/delete operations for the dirty items.
+
+        Inserted and moved items carry their position in the current list.
+        """
+
+        positions = {}
+        if any(change[0] == "insert" or change[2] for change in self.changes.values()):
+            for position, item in enumerate(items):
+                if item.item_id in self.changes:
+                    positions[item.item_id] = position
+
+        operations = []
+        for item_id, (kind, item, moved) in self.changes.items():
+            if kind == "delete":
+                operations.append({"op": "delete", "id": item_id})
+                continue
+
+            operation = {"op": kind, "id": item_id, "data": serialize(item)}
+            if kind == "insert" or moved:
+                operation["position"] = positions[item_id]
+            operations.append(operation)
+
+        return operations
+
+
+def apply_changes(items: List[dict], operations: List[dict]) -> List[dict]:
+    """
+    Apply operations from ChangeTracker.operations to the items of the base
+    version. This is the reference the backend implementation (or a local
+    stand-in for it) is expected to follow.
+    """
+
+    by_id = {item_id: copy.copy(item) for item_id, item in enumerate(items)}
+    placed = []
+
+    for operation in operations:
+        item_id = operation["id"]
+
+        if operation["op"] == "delete":
+            by_id.pop(item_id, None)
+        elif operation["op"] == "update":
+            by_id[item_id].update(operation["data"])
+        elif operation["op"] == "insert":
+            by_id[item_id] = dict(operation["data"])
+
+        if "position" in operation:
+            placed.append((operation["position"], item_id))
+
+    placed_ids = {item_id for _, item_id in placed}
+    result = [item for item_id, item in by_id.items() if item_id not in placed_ids]
+
+    # Items that stayed put keep their relative order, so the others can be
+    # inserted at their final positions in ascending order.
+    for position, item_id in sorted(placed):
+        result.insert(position, by_id[item_id])
+
+    return result
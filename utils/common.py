@@ -2,12 +2,22 @@ import asyncio
 import requests
 
 from nicegui import app
+from nicegui import run
 from nicegui import ui
+from typing import Any
+from typing import Awaitable
+from typing import Callable
+from typing import List
 from typing import Optional
+from utils import backend
+from utils.changes import ChangeTracker
+from utils.health import health
 from utils.settings import get_settings
+from utils.token import forget_token
 from utils.token import get_auth_header
-from utils.token import token_refresh
+from utils.token import schedule_token_refresh
 from utils.token import get_admin_status
+from utils.token import invalidate_user_data
 from starlette.formparsers import MultiPartParser
 
 
@@ -17,6 +27,10 @@ MultiPartParser.spool_max_size = 1024 * 1024 * 4096
 settings = get_settings()
 API_URL = settings.API_URL
 
+# Status codes of a backend that doesn't support saving changes, the full
+# result is sent instead.
+PATCH_UNSUPPORTED = (404, 405, 501)
+
 jobs_columns = [
     {
         "name": "filename",
@@ -69,23 +83,26 @@ def logout() -> None:
     Log out the user by clearing the token and navigating to the logout endpoint.
     """
 
+    forget_token(app.storage.user.get("token"))
+    invalidate_user_data()
     app.storage.user.clear()
     ui.navigate.to(settings.OIDC_APP_LOGOUT_ROUTE)
 
 
-def page_init(header_text: Optional[str] = "") -> None:
+def page_init(
+    header_text: Optional[str] = "", user_data: Optional[dict] = None
+) -> None:
     """
-    Initialize the page with a header and background color.
+    Initialize the page with a header and background color. Pages that have
+    already loaded the user profile pass it in as user_data.
     """
 
-    def refresh():
-        if not token_refresh():
-            ui.navigate.to(settings.OIDC_APP_LOGOUT_ROUTE)
-
     if header_text:
         header_text = f" - {header_text}"
 
-    is_admin = get_admin_status()
+    schedule_token_refresh()
+
+    is_admin = get_admin_status(user_data)
     if is_admin:
         header_text += " (ADMIN)"
 
@@ -111,7 +128,6 @@ def page_init(header_text: Optional[str] = "") -> None:
                 on_click=lambda: ui.navigate.to("/home"),
             ).props("flat color=white")
 
-            ui.timer(30, refresh)
             ui.add_head_html("<style>body {background-color: #ffffff;}</style>")
 
 
@@ -122,7 +138,7 @@ def jobs_get() -> list:
     jobs = []
 
     try:
-        response = requests.get(
+        response = backend.get(
             f"{API_URL}/api/v1/transcriber", headers=get_auth_header()
         )
         response.raise_for_status()
@@ -161,6 +177,145 @@ def jobs_get() -> list:
     return jobs
 
 
+async def save_result(
+    job_id: str,
+    result_format: str,
+    changes: ChangeTracker,
+    items: List[Any],
+    serialize: Callable[[Any], dict],
+    full_data: Callable[[], dict],
+) -> bool:
+    """
+    Save an edited result. Only the changed items are sent when possible,
+    the full document is sent if the backend doesn't support saving
+    changes or if most of the document changed anyway. A conflict, the
+    result having been changed elsewhere, is shown to the user instead of
+    being overwritten.
+
+    The payload is built on the event loop and sent from a worker thread,
+    one save per document at a time.
+    """
+
+    async with changes.save_lock:
+        if not changes.is_dirty():
+            return True
+
+        headers = get_auth_header()
+        headers["Content-Type"] = "application/json"
+        url = f"{API_URL}/api/v1/transcriber/{job_id}/result"
+        edits = changes.edits
+        response = None
+
+        if not changes.full_save and len(changes.changes) <= len(items) // 2:
+            payload = {
+                "format": result_format,
+                "base_version": changes.version,
+                "operations": changes.operations(items, serialize),
+            }
+            response = await run.io_bound(__send, backend.patch, url, headers, payload)
+
+            if response is None:
+                return False
+
+            if response.status_code == 409:
+                changes.conflict = True
+                ui.notify(
+                    "The file has been changed elsewhere, reload the page "
+                    "before saving again",
+                    type="warning",
+                    position="bottom",
+                )
+                return False
+
+        if response is None or response.status_code in PATCH_UNSUPPORTED:
+            response = await run.io_bound(
+                __send, backend.put, url, headers, full_data()
+            )
+
+        if response is None or not response.ok:
+            return False
+
+        if changes.edits == edits:
+            changes.reset(items, __result_version(response))
+        else:
+            # The edits made while saving were tracked against the old
+            # version, so they are sent as a whole document next time.
+            changes.version = __result_version(response)
+            changes.full_save = True
+            if changes.journal:
+                changes.journal.compact()
+
+    return True
+
+
+def __send(
+    send: Callable[..., requests.Response], url: str, headers: dict, payload: dict
+) -> Optional[requests.Response]:
+    """
+    Send a request, None means that no response was received.
+    """
+
+    try:
+        return send(url, headers=headers, json=payload)
+    except requests.exceptions.RequestException:
+        return None
+
+
+def __result_version(response: requests.Response) -> Optional[int]:
+    try:
+        return response.json()["result"]["version"]
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+def fetch_result(
+    job_id: str, result_format: str, version: Optional[int] = None
+) -> Awaitable[dict]:
+    """
+    Get the result of a job without blocking the event loop, so the page
+    stays responsive while a large result is downloaded.
+
+    With a version, e.g. of edits kept in the journal, the result is only
+    downloaded if it has changed since. Otherwise just {"version": version}
+    is returned.
+
+    The auth header needs the page's context, so it is looked up before
+    this returns and the result can be awaited together with other
+    requests.
+    """
+
+    headers = get_auth_header()
+    if version is not None:
+        headers["If-None-Match"] = f'"{version}"'
+
+    return run.io_bound(
+        __get_result,
+        f"{API_URL}/api/v1/transcriber/{job_id}/result/{result_format}",
+        headers,
+        version,
+    )
+
+
+def __get_result(url: str, headers: dict, version: Optional[int]) -> dict:
+    response = backend.get(url, headers=headers)
+
+    if response.status_code == 304:
+        return {"version": version}
+
+    response.raise_for_status()
+
+    return response.json()
+
+
+def loading_placeholder(rows: int = 6) -> None:
+    """
+    Skeleton rows shown in place of a result that is still loading.
+    """
+
+    for _ in range(rows):
+        ui.skeleton(height="80px").classes("w-full mb-2")
+
+
 def table_click(event) -> None:
     """
     Handle the click event on the table rows.
@@ -220,9 +375,12 @@ def post_file(file: str, filename: str) -> None:
     files_json = {"file": (filename, file.read())}
 
     try:
-        response = requests.post(
-            f"{API_URL}/api/v1/transcriber", files=files_json, headers=get_auth_header()
-        )
+        with health.track("uploads"):
+            response = backend.post(
+                f"{API_URL}/api/v1/transcriber",
+                files=files_json,
+                headers=get_auth_header(),
+            )
         response.raise_for_status()
     except requests.exceptions.RequestException as e:
         ui.notify(
@@ -230,6 +388,8 @@ def post_file(file: str, filename: str) -> None:
         )
         return
 
+    invalidate_user_data()
+
     return True
 
 
@@ -454,7 +614,7 @@ def __delete_files(rows: list, dialog: ui.dialog) -> bool:
     try:
         for row in rows:
             uuid = row["uuid"]
-            response = requests.delete(
+            response = backend.delete(
                 f"{API_URL}/api/v1/transcriber/{uuid}",
                 headers=get_auth_header(),
             )
@@ -465,6 +625,9 @@ def __delete_files(rows: list, dialog: ui.dialog) -> bool:
             f"Error: Failed to delete files: {str(e)}", type="negative", position="top"
         )
         return False
+    finally:
+        # Some of the files may have been deleted even if one failed.
+        invalidate_user_data()
 
     dialog.close()
 
@@ -481,7 +644,7 @@ def start_transcription(
             uuid = row["uuid"]
 
             try:
-                response = requests.put(
+                response = backend.put(
                     f"{API_URL}/api/v1/transcriber/{uuid}",
                     json={
                         "language": f"{selected_language}",
@@ -500,6 +663,7 @@ def start_transcription(
                 )
                 return
 
+        invalidate_user_data()
         dialog.close()
 
     except Exception as e:
@@ -0,0 +1,214 @@
+import json
+import uuid
+import weakref
+
+from fastapi import Request
+from fastapi.responses import Response
+from fastapi.responses import StreamingResponse
+from nicegui import app
+from typing import Callable
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
+from urllib.parse import quote
+from utils.token import get_auth_header
+from xml.sax.saxutils import escape
+from xml.sax.saxutils import quoteattr
+
+# Number of captions rendered into each chunk of the HTTP response.
+CHUNK_SIZE = 256
+
+# Editors that can be exported, keyed by a random per-editor export key.
+_editors: "weakref.WeakValueDictionary[str, object]" = weakref.WeakValueDictionary()
+
+
+def format_timestamp(seconds: float, separator: str = ",", short: bool = False) -> str:
+    """
+    Format seconds as HH:MM:SS<separator>mmm, or H:MM:SS<separator>mmm if short.
+    """
+
+    milliseconds = max(0, int(round(seconds * 1000)))
+    hours, milliseconds = divmod(milliseconds, 3600000)
+    minutes, milliseconds = divmod(milliseconds, 60000)
+    secs, milliseconds = divmod(milliseconds, 1000)
+
+    if short:
+        return f"{hours:d}:{minutes:02d}:{secs:02d}{separator}{milliseconds:03d}"
+
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}{separator}{milliseconds:03d}"
+
+
+def _chunked(captions: Iterable, render: Callable[[int, object], str]) -> Iterator[str]:
+    """
+    Render captions and yield the output in chunks of CHUNK_SIZE captions.
+    """
+
+    parts = []
+
+    for number, caption in enumerate(captions, 1):
+        parts.append(render(number, caption))
+
+        if len(parts) >= CHUNK_SIZE:
+            yield "".join(parts)
+            parts = []
+
+    if parts:
+        yield "".join(parts)
+
+
+def export_srt(captions: Iterable, **options) -> Iterator[str]:
+    def render(number: int, caption) -> str:
+        return (
+            f"{number}\n"
+            f"{format_timestamp(caption.start)} --> {format_timestamp(caption.end)}\n"
+            f"{caption.text}\n\n"
+        )
+
+    yield from _chunked(captions, render)
+
+
+def export_vtt(captions: Iterable, cue_settings: str = "", **options) -> Iterator[str]:
+    settings_suffix = f" {cue_settings.strip()}" if cue_settings.strip() else ""
+
+    def render(number: int, caption) -> str:
+        return (
+            f"{number}\n"
+            f"{format_timestamp(caption.start, '.')} --> "
+            f"{format_timestamp(caption.end, '.')}{settings_suffix}\n"
+            f"{caption.text}\n\n"
+        )
+
+    yield "WEBVTT\n\n"
+    yield from _chunked(captions, render)
+
+
+def export_ttml(captions: Iterable, language: str = "", **options) -> Iterator[str]:
+    def render(number: int, caption) -> str:
+        text = "<br/>".join(escape(line) for line in caption.text.split("\n"))
+        return (
+            f'      <p xml:id="c{number}" '
+            f'begin="{format_timestamp(caption.start, ".")}" '
+            f'end="{format_timestamp(caption.end, ".")}">{text}</p>\n'
+        )
+
+    lang = quoteattr(language or "und")
+    yield (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        f'<tt xmlns="http://www.w3.org/ns/ttml" xml:lang={lang}>\n'
+        "  <body>\n"
+        "    <div>\n"
+    )
+    yield from _chunked(captions, render)
+    yield "    </div>\n  </body>\n</tt>\n"
+
+
+def export_sbv(captions: Iterable, **options) -> Iterator[str]:
+    def render(number: int, caption) -> str:
+        return (
+            f"{format_timestamp(caption.start, '.', short=True)},"
+            f"{format_timestamp(caption.end, '.', short=True)}\n"
+            f"{caption.text}\n\n"
+        )
+
+    yield from _chunked(captions, render)
+
+
+def export_json(captions: Iterable, **options) -> Iterator[str]:
+    def render(number: int, caption) -> str:
+        item = json.dumps(
+            {
+                "index": number,
+                "start": caption.start,
+                "end": caption.end,
+                "text": caption.text,
+            },
+            ensure_ascii=False,
+        )
+        return f",\n    {item}" if number > 1 else f"\n    {item}"
+
+    yield '{\n  "captions": ['
+    yield from _chunked(captions, render)
+    yield "\n  ]\n}\n"
+
+
+# Exporters by format name: (generator, media type, file extension)
+EXPORTERS: Dict[str, tuple] = {
+    "srt": (export_srt, "application/x-subrip", "srt"),
+    "vtt": (export_vtt, "text/vtt", "vtt"),
+    "ttml": (export_ttml, "application/ttml+xml", "ttml"),
+    "dfxp": (export_ttml, "application/ttml+xml", "dfxp"),
+    "sbv": (export_sbv, "text/plain", "sbv"),
+    "json": (export_json, "application/json", "json"),
+}
+
+
+def export_captions(captions: Iterable, export_format: str, **options) -> str:
+    """
+    Render captions to a string in the given format.
+    """
+
+    exporter, _, _ = EXPORTERS[export_format]
+
+    return "".join(exporter(captions, **options))
+
+
+def register_editor(editor) -> str:
+    """
+    Make an editor exportable and return its export key.
+
+    The editor is only weakly referenced, so it is dropped once the page
+    owning it is gone.
+    """
+
+    key = uuid.uuid4().hex
+    _editors[key] = editor
+
+    return key
+
+
+def create_export_endpoint() -> None:
+    """
+    Create the endpoint streaming an editor's captions in a given format.
+    """
+
+    @app.get("/export/{key}/{export_format}")
+    async def export(
+        request: Request,
+        key: str,
+        export_format: str,
+        filename: str = "captions",
+        cue_settings: str = "",
+        language: str = "",
+    ) -> Response:
+        if not get_auth_header():
+            return Response(
+                content="Unauthorized",
+                status_code=401,
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+
+        editor = _editors.get(key)
+
+        if editor is None or export_format not in EXPORTERS:
+            return Response(content="Not found", status_code=404)
+
+        exporter, media_type, extension = EXPORTERS[export_format]
+
+        # Copy the list of references so edits made while the response is
+        # streaming don't change the document halfway through.
+        captions = list(editor.captions)
+
+        def stream() -> Iterator[bytes]:
+            for chunk in exporter(
+                captions, cue_settings=cue_settings, language=language
+            ):
+                yield chunk.encode("utf-8")
+
+        return StreamingResponse(
+            stream(),
+            media_type=media_type,
+            headers={
+                "Content-Disposition": "attachment; filename*=UTF-8''"
+                + quote(f"{filename}.{extension}")
+            },
+        )
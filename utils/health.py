@@ -0,0 +1,225 @@
+import asyncio
+import sys
+import time
+import weakref
+
+from collections import deque
+from contextlib import contextmanager
+from nicegui import Client
+from nicegui import run
+from typing import Any
+from typing import Dict
+from typing import Iterator
+from typing import Optional
+
+# Backend call durations kept per endpoint for the latency percentiles.
+LATENCY_SAMPLES = 512
+
+# How often the event loop lag is measured, and how many measurements are
+# kept for the recent maximum.
+LAG_INTERVAL = 0.5
+LAG_SAMPLES = 120
+
+# The proxied bytes per second are averaged over this many seconds.
+RATE_INTERVAL = 5.0
+
+# Walking the items of every open editor grows with the load, so their
+# memory is only estimated this often, in a worker thread.
+EDITOR_MEMORY_INTERVAL = 60.0
+
+
+class LatencyWindow:
+    __slots__ = ("samples", "count", "errors")
+
+    def __init__(self):
+        """
+        The most recent durations of calls to one backend endpoint, and the
+        number of calls and failed calls since the process started.
+        """
+
+        self.samples: deque = deque(maxlen=LATENCY_SAMPLES)
+        self.count = 0
+        self.errors = 0
+
+    def add(self, seconds: float, failed: bool) -> None:
+        self.samples.append(seconds)
+        self.count += 1
+        if failed:
+            self.errors += 1
+
+    def percentiles(self) -> Dict[str, float]:
+        samples = sorted(self.samples)
+        if not samples:
+            return {}
+
+        return {
+            f"p{percent}": samples[min(len(samples) - 1, len(samples) * percent // 100)]
+            for percent in (50, 90, 99)
+        }
+
+
+def editor_memory(editor: Any) -> int:
+    """
+    Estimate the bytes held by the captions or segments of an editor,
+    including their text and word timings.
+    """
+
+    total = 0
+    for item in editor.history_items():
+        total += sys.getsizeof(item) + sys.getsizeof(item.text)
+        for timings in (getattr(item, "parts", None), getattr(item, "words", None)):
+            if timings is not None:
+                total += sys.getsizeof(timings)
+
+    return total
+
+
+class HealthMonitor:
+    def __init__(self):
+        """
+        Lightweight in-process counters of the UI server.
+
+        Backend calls, video streams and uploads update plain counters as
+        they happen. The connected clients are only looked at when a
+        snapshot is taken, and the editor memory is estimated in the
+        background every EDITOR_MEMORY_INTERVAL seconds.
+        """
+
+        self.started = time.time()
+        self.loop_lag = 0.0
+        self.loop_lags: deque = deque(maxlen=LAG_SAMPLES)
+        self.active: Dict[str, int] = {"video_streams": 0, "uploads": 0}
+        self.proxied_bytes = 0
+        self.proxied_bytes_per_second = 0.0
+        self.backend: Dict[str, LatencyWindow] = {}
+        self.editors: "weakref.WeakSet" = weakref.WeakSet()
+        self.editor_bytes: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+        self.task: Optional[asyncio.Task] = None
+
+    def record_backend_call(
+        self, method: str, endpoint: str, status: Optional[int], seconds: float
+    ) -> None:
+        """
+        Record a backend call. A status of None means the request failed
+        without a response.
+        """
+
+        key = f"{method} {endpoint}"
+        window = self.backend.get(key)
+        if window is None:
+            # Calls are also recorded from worker threads.
+            window = self.backend.setdefault(key, LatencyWindow())
+
+        window.add(seconds, status is None or status >= 400)
+
+    @contextmanager
+    def track(self, activity: str) -> Iterator[None]:
+        """
+        Count an activity, e.g. a video stream or an upload, while it runs.
+        """
+
+        self.active[activity] += 1
+        try:
+            yield
+        finally:
+            self.active[activity] -= 1
+
+    def add_proxied_bytes(self, count: int) -> None:
+        self.proxied_bytes += count
+
+    def track_editor(self, editor: Any) -> None:
+        """
+        Include an editor in the memory figures for as long as it exists.
+        """
+
+        self.editors.add(editor)
+
+    def start(self) -> None:
+        if self.task is None or self.task.done():
+            self.task = asyncio.get_running_loop().create_task(self._measure())
+
+    async def _measure(self) -> None:
+        rate_start = time.monotonic()
+        rate_bytes = self.proxied_bytes
+        memory_estimated = 0.0
+
+        while True:
+            expected = time.monotonic() + LAG_INTERVAL
+            await asyncio.sleep(LAG_INTERVAL)
+            now = time.monotonic()
+
+            # Anything holding the event loop delays this wake-up.
+            self.loop_lag = max(0.0, now - expected)
+            self.loop_lags.append(self.loop_lag)
+
+            if now - rate_start >= RATE_INTERVAL:
+                self.proxied_bytes_per_second = (self.proxied_bytes - rate_bytes) / (
+                    now - rate_start
+                )
+                rate_start = now
+                rate_bytes = self.proxied_bytes
+
+            if now - memory_estimated >= EDITOR_MEMORY_INTERVAL:
+                memory_estimated = now
+                editors = list(self.editors)
+                estimates = await run.io_bound(
+                    lambda: [editor_memory(editor) for editor in editors]
+                )
+                self.editor_bytes.update(zip(editors, estimates))
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Get the current figures, as returned by the health endpoint.
+        """
+
+        clients = list(Client.instances.values())
+        sessions = set()
+        for client in clients:
+            try:
+                sessions.add(client.request.session["id"])
+            except (AttributeError, KeyError, TypeError):
+                continue
+
+        editors = [
+            {
+                "type": type(editor).__name__,
+                "items": len(editor.history_items()),
+                "bytes": self.editor_bytes.get(editor, 0),
+            }
+            for editor in list(self.editors)
+        ]
+
+        return {
+            "uptime": time.time() - self.started,
+            "event_loop": {
+                "lag": self.loop_lag,
+                "max_lag": max(self.loop_lags, default=0.0),
+            },
+            "clients": {
+                "total": len(clients),
+                "connected": sum(1 for c in clients if c.has_socket_connection),
+                "sessions": len(sessions),
+            },
+            "video": {
+                "active_streams": self.active["video_streams"],
+                "proxied_bytes": self.proxied_bytes,
+                "bytes_per_second": self.proxied_bytes_per_second,
+            },
+            "uploads_in_flight": self.active["uploads"],
+            "backend": {
+                endpoint: {
+                    "calls": window.count,
+                    "errors": window.errors,
+                    **window.percentiles(),
+                }
+                for endpoint, window in sorted(self.backend.items())
+            },
+            "editors": {
+                "count": len(editors),
+                "bytes": sum(editor["bytes"] for editor in editors),
+                "sessions": editors,
+            },
+        }
+
+
+health = HealthMonitor()
@@ -0,0 +1,307 @@
+import time
+
+from array import array
+from collections import deque
+from contextlib import contextmanager
+from typing import Any
+from typing import Iterator
+from typing import List
+from typing import Optional
+
+# Consecutive edits of the same field within this many seconds are merged
+# into one undo step, so typing a word doesn't create one step per key.
+COALESCE_SECONDS = 2.0
+
+
+def _append_varint(data: bytearray, value: int) -> None:
+    # Seven bits per byte, the high bit is set on all but the last byte.
+    while value >= 0x80:
+        data.append(value & 0x7F | 0x80)
+        value >>= 7
+    data.append(value)
+
+
+def _read_varints(data: bytearray) -> Iterator[int]:
+    value = 0
+    shift = 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        yield value
+        value = 0
+        shift = 0
+
+
+class ReplaceOperation:
+    def __init__(self, replacement: str):
+        """
+        A search and replace over many items, stored compactly.
+
+        Rather than keeping the old and new text of each item, only where
+        the matches were and the matched text are kept. Items are
+        referenced by their position in the editor's list, which is the
+        same whenever this operation is undone or redone since the history
+        is linear.
+
+        Each match is stored as two variable length integers: the distance
+        to the position of the previous match's item, and the distance from
+        the end of the previous match in the same item (or the offset in
+        the text of a new item). Most matches take two or three bytes.
+        Matches that equal the replacement don't change anything and are
+        not stored.
+        """
+
+        self.replacement = replacement
+        self.data = bytearray()
+        self.count = 0
+        self.originals: List[str] = []
+        self.codes: Optional[array] = None
+        self._position = 0
+        self._end = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    def add_match(self, position: int, offset: int, original: str) -> None:
+        """
+        Add a match at offset in the original text of the item at position.
+        Matches are added in order of position and offset.
+        """
+
+        if original == self.replacement:
+            return
+
+        if not self.originals:
+            self.originals.append(original)
+        elif original != self.originals[-1] or self.codes is not None:
+            # Only keep per-match codes once the matches differ, which can
+            # happen with case-insensitive searches.
+            if self.codes is None:
+                self.codes = array("H", [0] * self.count)
+            if original not in self.originals:
+                self.originals.append(original)
+            self.codes.append(self.originals.index(original))
+
+        if self.count and position == self._position:
+            _append_varint(self.data, 0)
+            _append_varint(self.data, offset - self._end)
+        else:
+            _append_varint(self.data, position - self._position)
+            _append_varint(self.data, offset)
+
+        self._position = position
+        self._end = offset + len(original)
+        self.count += 1
+
+    def _original(self, match: int) -> str:
+        if self.codes is None:
+            return self.originals[0]
+        return self.originals[self.codes[match]]
+
+    def item_matches(self) -> Iterator[tuple]:
+        """
+        Yield (position, matches) for each changed item, where matches is a
+        list of (offset, original) in the item's original text.
+        """
+
+        values = _read_varints(self.data)
+        position = 0
+        matches: List[tuple] = []
+        end = 0
+
+        # The values come in pairs of (step, distance).
+        for match, (step, distance) in enumerate(zip(values, values)):
+            original = self._original(match)
+
+            if match and step == 0:
+                offset = end + distance
+            else:
+                if matches:
+                    yield position, matches
+                position += step
+                matches = []
+                offset = distance
+
+            matches.append((offset, original))
+            end = offset + len(original)
+
+        if matches:
+            yield position, matches
+
+    def replaced_text(self, text: str, matches: List[tuple]) -> str:
+        """
+        Apply the replacement to the original text of one item.
+        """
+
+        parts = []
+        previous = 0
+        for offset, original in matches:
+            parts.append(text[previous:offset])
+            parts.append(self.replacement)
+            previous = offset + len(original)
+        parts.append(text[previous:])
+
+        return "".join(parts)
+
+    def original_text(self, text: str, matches: List[tuple]) -> str:
+        """
+        Restore the original text of one item from its replaced text.
+        """
+
+        parts = []
+        previous = 0
+        shift = 0
+        for offset, original in matches:
+            offset += shift
+            parts.append(text[previous:offset])
+            parts.append(original)
+            previous = offset + len(self.replacement)
+            shift += len(self.replacement) - len(original)
+        parts.append(text[previous:])
+
+        return "".join(parts)
+
+
+class EditHistory:
+    def __init__(self, editor: Any, limit: int = 200):
+        """
+        Undo and redo stacks of reversible operations.
+
+        Each entry is a list of operations that are undone together:
+          ("set", item, field, old value, new value)
+          ("insert", item, position)
+          ("delete", item, position)
+          ("move", item, from position, to position)
+          ("speakers", None, old state, new state)
+          ReplaceOperation
+
+        The editor applies them through apply_set, apply_insert,
+        apply_delete, apply_move and apply_speakers, and the items it keeps
+        in a list returned by history_items.
+        """
+
+        self.editor = editor
+        self.undo_stack: deque = deque(maxlen=limit)
+        self.redo_stack: List[list] = []
+        self._group: Optional[list] = None
+        self._last_set = 0.0
+
+    def can_undo(self) -> bool:
+        return bool(self.undo_stack)
+
+    def can_redo(self) -> bool:
+        return bool(self.redo_stack)
+
+    @contextmanager
+    def group(self) -> Iterator[None]:
+        """
+        Record all operations made inside the block as a single undo step.
+        """
+
+        if self._group is not None:
+            yield
+            return
+
+        self._group = []
+        try:
+            yield
+        finally:
+            operations, self._group = self._group, None
+            if operations:
+                self._push(operations)
+
+    def record(self, operation) -> None:
+        if self._group is not None:
+            self._group.append(operation)
+            return
+
+        if (
+            isinstance(operation, tuple)
+            and operation[0] == "set"
+            and self._coalesce(operation)
+        ):
+            return
+
+        self._push([operation])
+
+    def record_set(self, item: Any, field: str, old: Any, new: Any) -> None:
+        if old != new:
+            self.record(("set", item, field, old, new))
+
+    def _coalesce(self, operation: tuple) -> bool:
+        now = time.monotonic()
+        recent = now - self._last_set < COALESCE_SECONDS
+        self._last_set = now
+
+        if not recent or not self.undo_stack or self.redo_stack:
+            return False
+
+        last = self.undo_stack[-1]
+        if len(last) != 1 or not isinstance(last[0], tuple) or last[0][0] != "set":
+            return False
+
+        _, item, field, old, _ = last[0]
+        if item is not operation[1] or field != operation[2]:
+            return False
+
+        last[0] = ("set", item, field, old, operation[4])
+
+        return True
+
+    def _push(self, operations: list) -> None:
+        self.undo_stack.append(operations)
+        self.redo_stack.clear()
+        self._last_set = 0.0
+
+    def undo(self) -> bool:
+        if not self.undo_stack:
+            return False
+
+        operations = self.undo_stack.pop()
+        for operation in reversed(operations):
+            self._apply(operation, undo=True)
+        self.redo_stack.append(operations)
+        self._last_set = 0.0
+
+        return True
+
+    def redo(self) -> bool:
+        if not self.redo_stack:
+            return False
+
+        operations = self.redo_stack.pop()
+        for operation in operations:
+            self._apply(operation, undo=False)
+        self.undo_stack.append(operations)
+        self._last_set = 0.0
+
+        return True
+
+    def _apply(self, operation, undo: bool) -> None:
+        editor = self.editor
+
+        if isinstance(operation, ReplaceOperation):
+            items = editor.history_items()
+            for position, matches in operation.item_matches():
+                item = items[position]
+                if undo:
+                    text = operation.original_text(item.text, matches)
+                else:
+                    text = operation.replaced_text(item.text, matches)
+                editor.apply_set(item, "text", text)
+            return
+
+        kind, item = operation[0], operation[1]
+
+        if kind == "set":
+            editor.apply_set(item, operation[2], operation[3 if undo else 4])
+        elif kind == "speakers":
+            editor.apply_speakers(operation[2] if undo else operation[3])
+        elif kind == "move":
+            editor.apply_move(item, operation[2] if undo else operation[3])
+        elif (kind == "insert") != undo:
+            editor.apply_insert(item, operation[2])
+        else:
+            editor.apply_delete(item)
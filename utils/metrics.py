@@ -0,0 +1,340 @@
+import functools
+import hmac
+import inspect
+import ipaddress
+import threading
+import time
+
+from bisect import bisect_left
+from fastapi import Request
+from fastapi.responses import Response
+from nicegui import Client
+from nicegui import app
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+from typing import Union
+from utils.health import health
+from utils.settings import get_settings
+
+settings = get_settings()
+
+PREFIX = "transcriber_ui"
+
+# Upper bounds of the latency histogram buckets, in seconds.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def format_labels(names: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+    if not names:
+        return ""
+
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"')
+        pairs.append(f'{name}="{value}"')
+
+    return "{" + ",".join(pairs) + "}"
+
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, description: str, labels: Tuple[str, ...] = ()):
+        """
+        Counter that only goes up, with one series per combination of
+        label values.
+        """
+
+        self.name = f"{PREFIX}_{name}"
+        self.description = description
+        self.labels = labels
+        self.series: Dict[tuple, float] = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *values: str, amount: float = 1) -> None:
+        # Also called from worker threads.
+        with self.lock:
+            self.series[values] = self.series.get(values, 0) + amount
+
+    def collect(self) -> List[str]:
+        with self.lock:
+            series = sorted(self.series.items())
+
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} counter",
+        ]
+        for values, count in series:
+            labels = format_labels(self.labels, values)
+            lines.append(f"{self.name}{labels} {format_value(count)}")
+
+        return lines
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        labels: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = LATENCY_BUCKETS,
+    ):
+        """
+        Histogram of observed values with fixed bucket bounds.
+
+        An observation only increments one bucket, the cumulative counts
+        are added up when the metrics are collected.
+        """
+
+        self.name = f"{PREFIX}_{name}"
+        self.description = description
+        self.labels = labels
+        self.buckets = buckets
+        self.series: Dict[tuple, list] = {}
+        self.lock = threading.Lock()
+
+    def observe(self, *values: str, value: float) -> None:
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(values)
+            if series is None:
+                # One count per bucket, then the +Inf bucket and the sum.
+                series = self.series[values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def collect(self) -> List[str]:
+        with self.lock:
+            series = sorted((values, list(s)) for values, s in self.series.items())
+
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} histogram",
+        ]
+        names = self.labels + ("le",)
+        for values, counts in series:
+            total = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                total += count
+                labels = format_labels(names, values + (format_value(bound),))
+                lines.append(f"{self.name}_bucket{labels} {total}")
+
+            labels = format_labels(self.labels, values)
+            lines.append(f"{self.name}_sum{labels} {format_value(counts[-1])}")
+            lines.append(f"{self.name}_count{labels} {total}")
+
+        return lines
+
+
+class Gauge:
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        read: Callable[[], Dict[tuple, float]],
+        labels: Tuple[str, ...] = (),
+        kind: str = "gauge",
+    ):
+        """
+        Gauge whose series are read when the metrics are collected, so
+        nothing is updated while the server runs. A kind of "counter" is
+        for values read from counters kept elsewhere.
+        """
+
+        self.name = f"{PREFIX}_{name}"
+        self.description = description
+        self.read = read
+        self.labels = labels
+        self.kind = kind
+
+    def collect(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        for values, value in sorted(self.read().items()):
+            labels = format_labels(self.labels, values)
+            lines.append(f"{self.name}{labels} {format_value(value)}")
+
+        return lines
+
+
+def client_counts() -> Dict[tuple, float]:
+    clients = list(Client.instances.values())
+    connected = sum(1 for client in clients if client.has_socket_connection)
+
+    return {("connected",): connected, ("disconnected",): len(clients) - connected}
+
+
+backend_requests = Counter(
+    "backend_requests_total",
+    "Requests to the transcription backend.",
+    ("method", "endpoint", "status", "outcome"),
+)
+backend_duration = Histogram(
+    "backend_request_duration_seconds",
+    "Duration of requests to the transcription backend.",
+    ("method", "endpoint", "outcome"),
+)
+page_duration = Histogram(
+    "page_render_duration_seconds",
+    "Time taken to build a page, including the data it waits for.",
+    ("page",),
+)
+cache_requests = Counter(
+    "cache_requests_total",
+    "Cache lookups. The hit ratio is hits over all lookups of a cache.",
+    ("cache", "result"),
+)
+proxied_bytes = Gauge(
+    "video_proxied_bytes_total",
+    "Bytes of video returned by the video proxy.",
+    lambda: {(): health.proxied_bytes},
+    kind="counter",
+)
+websocket_clients = Gauge(
+    "websocket_clients",
+    "Page clients, by whether their websocket is connected.",
+    client_counts,
+    ("state",),
+)
+active = Gauge(
+    "active_requests",
+    "Video proxy requests and uploads in flight.",
+    lambda: {(activity,): count for activity, count in health.active.items()},
+    ("activity",),
+)
+event_loop_lag = Gauge(
+    "event_loop_lag_seconds",
+    "How late the event loop last woke up a sleeping task.",
+    lambda: {(): health.loop_lag},
+)
+
+METRICS = [
+    backend_requests,
+    backend_duration,
+    page_duration,
+    cache_requests,
+    proxied_bytes,
+    websocket_clients,
+    active,
+    event_loop_lag,
+]
+
+
+def record_backend_call(
+    method: str, endpoint: str, status: Optional[int], seconds: float
+) -> None:
+    """
+    Record a backend call. A status of None means the request failed
+    without a response.
+    """
+
+    if status is None:
+        outcome = "failure"
+    elif status >= 400:
+        outcome = "error"
+    else:
+        outcome = "success"
+
+    backend_requests.inc(method, endpoint, str(status or ""), outcome)
+    backend_duration.observe(method, endpoint, outcome, value=seconds)
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    cache_requests.inc(cache, "hit" if hit else "miss")
+
+
+def measure_page(page: str) -> Callable:
+    """
+    Decorator recording how long a page function takes, placed between
+    @ui.page and the function.
+    """
+
+    def decorator(func: Callable) -> Callable:
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def measured(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    page_duration.observe(page, value=time.perf_counter() - start)
+
+        else:
+
+            @functools.wraps(func)
+            def measured(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    page_duration.observe(page, value=time.perf_counter() - start)
+
+        return measured
+
+    return decorator
+
+
+def exposition() -> str:
+    """
+    Get all metrics in the Prometheus text format.
+    """
+
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.collect())
+
+    return "\n".join(lines) + "\n"
+
+
+def allowed_networks() -> List[Union[ipaddress.IPv4Network, ipaddress.IPv6Network]]:
+    return [
+        ipaddress.ip_network(network.strip(), strict=False)
+        for network in settings.METRICS_ALLOWED_IPS.split(",")
+        if network.strip()
+    ]
+
+
+def create_metrics_endpoint() -> None:
+    """
+    Create the endpoint scraped by Prometheus, if METRICS_ENABLED is set.
+    """
+
+    if not settings.METRICS_ENABLED:
+        return
+
+    networks = allowed_networks()
+    expected = f"Bearer {settings.METRICS_TOKEN}".encode()
+
+    @app.get("/metrics")
+    async def metrics(request: Request) -> Response:
+        if networks:
+            try:
+                address = ipaddress.ip_address(request.client.host)
+            except (AttributeError, ValueError):
+                address = None
+            if address is None or not any(address in n for n in networks):
+                return Response(content="Forbidden", status_code=403)
+
+        if settings.METRICS_TOKEN:
+            authorization = request.headers.get("Authorization", "").encode()
+            if not hmac.compare_digest(authorization, expected):
+                return Response(
+                    content="Unauthorized",
+                    status_code=401,
+                    headers={"WWW-Authenticate": "Bearer"},
+                )
+
+        return Response(content=exposition(), media_type=CONTENT_TYPE)
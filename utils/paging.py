@@ -0,0 +1,166 @@
+import json
+import numpy as np
+import pandas as pd
+import threading
+
+from collections import OrderedDict
+from nicegui import run
+from nicegui import ui
+from typing import Callable
+from typing import List
+from typing import Optional
+from utils.metrics import record_cache
+
+# Number of sort and filter combinations whose row order is kept per table.
+ORDER_CACHE_SIZE = 8
+
+ROWS_PER_PAGE_OPTIONS = [10, 25, 50]
+
+
+class PagedTable:
+    def __init__(
+        self,
+        columns: List[dict],
+        frame: pd.DataFrame,
+        format_row: Callable[[dict], dict],
+        search_columns: List[str],
+        sort_by: Optional[str] = None,
+        descending: bool = False,
+        rows_per_page: int = 10,
+    ):
+        """
+        Table that is sorted, filtered and paged on the server.
+
+        Only the rows of the visible page are formatted and sent to the
+        browser, so each page change costs the same however many rows
+        there are. Sortable columns are sorted on the frame column of the
+        same name, i.e. on the raw values rather than the formatted text.
+        The row order and count of recent sort and filter combinations
+        are cached, so paging through them is a slice.
+        """
+
+        self.columns = columns
+        self.frame = frame.reset_index(drop=True)
+        self.format_row = format_row
+        self.search_columns = search_columns
+        self.filter_text = ""
+        self.pagination = {
+            "page": 1,
+            "rowsPerPage": rows_per_page,
+            "sortBy": sort_by,
+            "descending": descending,
+            "rowsNumber": len(self.frame),
+        }
+        self.orders: OrderedDict = OrderedDict()
+        self.orders_lock = threading.Lock()
+        self.table: Optional[ui.table] = None
+
+    def order(self, filter_text: str, sort_by: Optional[str], descending: bool):
+        """
+        Get the positions of the rows matching a filter, in sorted order.
+        """
+
+        key = (filter_text, sort_by, descending)
+        with self.orders_lock:
+            hit = key in self.orders
+            if hit:
+                self.orders.move_to_end(key)
+        record_cache("table_order", hit)
+        if hit:
+            return self.orders[key]
+
+        frame = self.frame
+        if filter_text:
+            matches = np.zeros(len(frame), dtype=bool)
+            for column in self.search_columns:
+                matches |= (
+                    frame[column]
+                    .astype(str)
+                    .str.contains(filter_text, case=False, regex=False)
+                    .to_numpy()
+                )
+            positions = np.flatnonzero(matches)
+        else:
+            positions = np.arange(len(frame))
+
+        if sort_by in frame.columns:
+            values = frame[sort_by].iloc[positions]
+            values = values.sort_values(ascending=not descending, kind="stable")
+            positions = values.index.to_numpy()
+
+        with self.orders_lock:
+            self.orders[key] = positions
+            if len(self.orders) > ORDER_CACHE_SIZE:
+                self.orders.popitem(last=False)
+
+        return positions
+
+    def page_rows(self, pagination: dict, filter_text: str) -> tuple:
+        """
+        Get the formatted rows of one page and the number of matching rows.
+        """
+
+        positions = self.order(
+            filter_text, pagination.get("sortBy"), bool(pagination.get("descending"))
+        )
+        rows_per_page = pagination.get("rowsPerPage") or ROWS_PER_PAGE_OPTIONS[0]
+        first = (max(1, pagination.get("page", 1)) - 1) * rows_per_page
+        page = positions[first : first + rows_per_page]
+
+        rows = []
+        for position, record in zip(page, self.frame.iloc[page].to_dict("records")):
+            row = self.format_row(record)
+            row["id"] = int(position)
+            rows.append(row)
+
+        return rows, len(positions)
+
+    async def load(self, pagination: dict) -> None:
+        pagination = {**self.pagination, **pagination}
+        rows, total = await run.io_bound(self.page_rows, pagination, self.filter_text)
+
+        # A page past the end, e.g. after narrowing the filter, shows the
+        # last page instead.
+        rows_per_page = pagination["rowsPerPage"] or ROWS_PER_PAGE_OPTIONS[0]
+        last_page = max(1, -(-total // rows_per_page))
+        if pagination["page"] > last_page:
+            pagination["page"] = last_page
+            rows, total = await run.io_bound(
+                self.page_rows, pagination, self.filter_text
+            )
+
+        pagination["rowsNumber"] = total
+        self.pagination = pagination
+
+        self.table.rows = rows
+        self.table.pagination = pagination
+
+    async def set_filter(self, filter_text: str) -> None:
+        self.filter_text = (filter_text or "").strip()
+        await self.load({"page": 1})
+
+    def render(self, search_label: str = "Search") -> ui.table:
+        """
+        Create the search field and the table, and show the first page.
+        """
+
+        ui.input(search_label, on_change=lambda e: self.set_filter(e.value)).props(
+            "clearable debounce=300"
+        ).classes("w-64")
+
+        self.table = ui.table(
+            columns=self.columns,
+            rows=[],
+            row_key="id",
+            pagination=self.pagination,
+        )
+        options = json.dumps(ROWS_PER_PAGE_OPTIONS, separators=(",", ":"))
+        self.table.props(f":rows-per-page-options={options}")
+        self.table.on("request", lambda e: self.load(e.args.get("pagination", {})))
+
+        rows, total = self.page_rows(self.pagination, self.filter_text)
+        self.pagination["rowsNumber"] = total
+        self.table.rows = rows
+        self.table.pagination = self.pagination
+
+        return self.table
@@ -0,0 +1,196 @@
+import html
+import re
+
+from typing import Any
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Set
+from typing import Tuple
+
+WORD_RE = re.compile(r"\w+")
+
+# The text of an edited segment is the HTML of the editor. Searches only
+# look at the text between tags, with character references decoded.
+TAG_RE = re.compile(r"<[^>]*>")
+ENTITY_RE = re.compile(r"&(?:#\d+|#[xX][0-9a-fA-F]+|[A-Za-z]\w*);")
+
+
+def text_runs(text: str) -> Iterator[Tuple[int, str, Optional[List[int]]]]:
+    """
+    Yield (offset, visible text, positions) for each run of text between
+    tags. positions maps each visible character, and the end of the run,
+    to its offset in text. It is None when the run has no character
+    references and the visible text is the run itself.
+    """
+
+    if "<" not in text and "&" not in text:
+        yield 0, text, None
+        return
+
+    previous = 0
+    for tag in TAG_RE.finditer(text):
+        if tag.start() > previous:
+            yield _decode_run(text, previous, tag.start())
+        previous = tag.end()
+
+    if previous < len(text):
+        yield _decode_run(text, previous, len(text))
+
+
+def _decode_run(text: str, start: int, end: int) -> Tuple[int, str, Optional[list]]:
+    run = text[start:end]
+    if "&" not in run:
+        return start, run, None
+
+    visible = []
+    positions = []
+    previous = 0
+    for entity in ENTITY_RE.finditer(run):
+        character = html.unescape(entity.group())
+        if len(character) != 1:
+            # Unknown, or decoded to more than one character.
+            continue
+
+        for offset in range(previous, entity.start()):
+            visible.append(run[offset])
+            positions.append(start + offset)
+        # The editor separates words with &nbsp;, which should match a space.
+        visible.append(" " if character == "\xa0" else character)
+        positions.append(start + entity.start())
+        previous = entity.end()
+    for offset in range(previous, len(run)):
+        visible.append(run[offset])
+        positions.append(start + offset)
+    positions.append(end)
+
+    return start, "".join(visible), positions
+
+
+def visible_text(text: str) -> str:
+    """
+    Get the text of a segment without its markup.
+    """
+
+    if "<" not in text and "&" not in text:
+        return text
+
+    return " ".join(run for _, run, _ in text_runs(text))
+
+
+class SegmentIndex:
+    def __init__(self):
+        """
+        Word index over the text of transcript segments.
+
+        Each lower-cased word maps to the segments containing it. Plain
+        text searches use it to narrow down the segments to look at, which
+        are then matched exactly. The index is built on the first search
+        and then kept up to date one segment at a time as text changes.
+        """
+
+        self.built = False
+        self.postings: Dict[str, Set[Any]] = {}
+        self.words: Dict[Any, Set[str]] = {}
+
+    def build(self, segments: Iterable[Any]) -> None:
+        self.postings = {}
+        self.words = {}
+        self.built = True
+
+        for segment in segments:
+            self.add(segment)
+
+    def add(self, segment: Any) -> None:
+        if not self.built:
+            return
+
+        words = set(WORD_RE.findall(visible_text(segment.text).lower()))
+        self.words[segment] = words
+
+        for word in words:
+            self.postings.setdefault(word, set()).add(segment)
+
+    def remove(self, segment: Any) -> None:
+        if not self.built:
+            return
+
+        for word in self.words.pop(segment, ()):
+            postings = self.postings[word]
+            postings.discard(segment)
+            if not postings:
+                del self.postings[word]
+
+    def update(self, segment: Any) -> None:
+        self.remove(segment)
+        self.add(segment)
+
+    def candidates(self, term: str) -> Optional[Set[Any]]:
+        """
+        Get the segments that can contain a plain text term, or None if the
+        term has no word characters to narrow the search down with.
+        """
+
+        tokens = WORD_RE.findall(term.lower())
+        if not tokens:
+            return None
+
+        # The first and last token may be parts of longer words, so look
+        # for the longest token inside the indexed words.
+        token = max(tokens, key=len)
+        segments = set()
+        for word, postings in self.postings.items():
+            if token in word:
+                segments |= postings
+
+        return segments
+
+
+def compile_search(term: str, regex: bool, case_sensitive: bool) -> re.Pattern:
+    """
+    Compile a search term, raising re.error for an invalid expression.
+    """
+
+    flags = 0 if case_sensitive else re.IGNORECASE
+
+    return re.compile(term if regex else re.escape(term), flags)
+
+
+def find_matches(
+    segments: List[Any],
+    pattern: re.Pattern,
+    candidates: Optional[Set[Any]] = None,
+    speaker_id: Optional[int] = None,
+) -> List[Tuple[Any, int, int]]:
+    """
+    Get (segment, start, end) of every match, in transcript order. Matches
+    are found in the visible text and don't span tags; start and end are
+    offsets in the segment text.
+    """
+
+    matches = []
+
+    for segment in segments:
+        if candidates is not None and segment not in candidates:
+            continue
+        if (
+            speaker_id is not None
+            and segment.speakers.resolve(segment.speaker_id) != speaker_id
+        ):
+            continue
+
+        for offset, run, positions in text_runs(segment.text):
+            for match in pattern.finditer(run):
+                if match.end() == match.start():
+                    continue
+                if positions is None:
+                    start = offset + match.start()
+                    end = offset + match.end()
+                else:
+                    start = positions[match.start()]
+                    end = positions[match.end()]
+                matches.append((segment, start, end))
+
+    return matches
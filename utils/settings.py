@@ -20,6 +20,21 @@ class Settings(BaseSettings):
     OIDC_APP_LOGOUT_ROUTE: str = ""
     OIDC_APP_REFRESH_ROUTE: str = ""
 
+    JOURNAL_DIR: str = "journal"
+    JOURNAL_MAX_OPS: int = 1000
+    JOURNAL_MAX_AGE: int = 7 * 24 * 3600
+    AUTOSAVE_DELAY: int = 5
+
+    STATISTICS_INTERVAL: int = 300
+
+    # The /metrics endpoint is only served when enabled. Scrapers must then
+    # send "Authorization: Bearer <METRICS_TOKEN>" if a token is set, and
+    # connect from one of METRICS_ALLOWED_IPS (comma-separated addresses or
+    # networks) if any are given.
+    METRICS_ENABLED: bool = False
+    METRICS_TOKEN: str = ""
+    METRICS_ALLOWED_IPS: str = ""
+
     WHISPER_MODELS: list[str] = ["Tiny", "Base", "Small", "Medium", "Large"]
     WHISPER_LANGUAGES: list[str] = [
         "Swedish",
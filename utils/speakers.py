@@ -0,0 +1,136 @@
+from typing import Dict
+from typing import Iterator
+from typing import List
+
+
+class SpeakerTable:
+    def __init__(self):
+        """
+        Interned speaker names of a transcript.
+
+        Segments store a speaker id instead of the name. Renaming and
+        swapping speakers only changes the table, and merging one speaker
+        into another makes its id an alias of the other, so none of them
+        touch the segments. The options list is shared by every speaker
+        select in the editor and updated in place.
+        """
+
+        self.names: List[str] = []
+        self.parents: List[int] = []
+        self.ids: Dict[str, int] = {}
+        self.options: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self.options)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.options)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.ids
+
+    def resolve(self, speaker_id: int) -> int:
+        """
+        Get the id a (possibly merged) speaker id stands for.
+        """
+
+        parents = self.parents
+        root = speaker_id
+        while parents[root] != root:
+            root = parents[root]
+
+        # Point the whole chain at the root so later lookups are direct.
+        while parents[speaker_id] != root:
+            parents[speaker_id], speaker_id = root, parents[speaker_id]
+
+        return root
+
+    def name(self, speaker_id: int) -> str:
+        return self.names[self.resolve(speaker_id)]
+
+    def intern(self, name: str) -> int:
+        """
+        Get the id of a speaker name, adding it if it is new.
+        """
+
+        speaker_id = self.ids.get(name)
+        if speaker_id is not None:
+            return speaker_id
+
+        speaker_id = len(self.names)
+        self.names.append(name)
+        self.parents.append(speaker_id)
+        self.ids[name] = speaker_id
+        self.options.append(name)
+
+        return speaker_id
+
+    def add(self, name: str) -> None:
+        self.intern(name)
+
+    def rename(self, name: str, new_name: str) -> None:
+        """
+        Rename a speaker. Renaming to the name of another speaker merges
+        the two.
+        """
+
+        if new_name in self.ids:
+            self.merge(name, new_name)
+            return
+
+        speaker_id = self.ids.pop(name)
+        self.names[speaker_id] = new_name
+        self.ids[new_name] = speaker_id
+        self._update_options()
+
+    def merge(self, name: str, into: str) -> None:
+        """
+        Make all segments of one speaker belong to another.
+        """
+
+        speaker_id = self.ids[name]
+        target_id = self.ids[into]
+        if speaker_id == target_id:
+            return
+
+        self.parents[speaker_id] = target_id
+        del self.ids[name]
+        self._update_options()
+
+    def swap(self, name: str, other: str) -> None:
+        """
+        Swap the names of two speakers, e.g. after the diarization mixed
+        them up.
+        """
+
+        speaker_id = self.ids[name]
+        other_id = self.ids[other]
+
+        self.names[speaker_id] = other
+        self.names[other_id] = name
+        self.ids[name] = other_id
+        self.ids[other] = speaker_id
+        self._update_options()
+
+    def get_state(self) -> tuple:
+        return list(self.names), list(self.parents)
+
+    def set_state(self, state: tuple) -> None:
+        names, parents = state
+
+        # Speakers added after the state was taken are kept.
+        self.names = list(names) + self.names[len(names) :]
+        self.parents = list(parents) + self.parents[len(parents) :]
+        self.ids = {
+            name: speaker_id
+            for speaker_id, name in enumerate(self.names)
+            if self.parents[speaker_id] == speaker_id
+        }
+        self._update_options()
+
+    def _update_options(self) -> None:
+        self.options[:] = [
+            name
+            for speaker_id, name in enumerate(self.names)
+            if self.parents[speaker_id] == speaker_id
+        ]
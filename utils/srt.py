@@ -1,11 +1,50 @@
+import asyncio
 import re
 
 from nicegui import ui
+from typing import Any
 from typing import List
 from typing import Optional
+from urllib.parse import urlencode
+from utils.autosave import replay
+from utils.changes import ChangeTracker
+from utils.exporters import export_captions
+from utils.exporters import format_timestamp
+from utils.exporters import register_editor
+from utils.health import health
+from utils.history import EditHistory
+from utils.history import ReplaceOperation
+from utils.srt_parser import ParseError
+from utils.srt_parser import parse_srt
+from utils.validation import CaptionValidator
+
+# Caption cards are sent to the browser this many at a time on first load,
+# with a short pause in between for the page to stay responsive.
+RENDER_BATCH = 100
+RENDER_PAUSE = 0.01
+
+
+def timestamp_to_seconds(timestamp: str) -> float:
+    """
+    Convert an SRT timestamp to seconds.
+    """
+
+    time_parts = timestamp.strip().replace(",", ".").split(":")
+    if len(time_parts) != 3:
+        raise ValueError(f"Invalid timestamp: {timestamp}")
+
+    hours = float(time_parts[0])
+    minutes = float(time_parts[1])
+    seconds = float(time_parts[2])
+
+    return hours * 3600 + minutes * 60 + seconds
 
 
 class SRTCaption:
+    # Only caption data is kept here. Selection and search highlighting are
+    # held by the editor, for the few captions they apply to.
+    __slots__ = ("index", "start", "end", "text", "item_id")
+
     def __init__(self, index: int, start_time: str, end_time: str, text: str):
         """
         Initialize a caption with index, start time, end time, and text.
@@ -15,35 +54,56 @@ class SRTCaption:
         self.start_time = start_time
         self.end_time = end_time
         self.text = text
-        self.is_selected = False
-        self.is_highlighted = False  # For search highlighting
+
+    @classmethod
+    def from_seconds(
+        cls, index: int, start: float, end: float, text: str
+    ) -> "SRTCaption":
+        """
+        Create a caption from start and end times in seconds.
+        """
+
+        caption = cls.__new__(cls)
+        caption.index = index
+        caption.start = start
+        caption.end = end
+        caption.text = text
+
+        return caption
+
+    # Times are stored as seconds and only formatted when displayed.
+    @property
+    def start_time(self) -> str:
+        return format_timestamp(self.start)
+
+    @start_time.setter
+    def start_time(self, value: str) -> None:
+        self.start = timestamp_to_seconds(value)
+
+    @property
+    def end_time(self) -> str:
+        return format_timestamp(self.end)
+
+    @end_time.setter
+    def end_time(self, value: str) -> None:
+        self.end = timestamp_to_seconds(value)
 
     def to_srt_format(self) -> str:
         return f"{self.index}\n{self.start_time} --> {self.end_time}\n{self.text}\n"
 
     def get_start_seconds(self) -> float:
         """
-        Convert timestamp to seconds for calculations.
+        Get the start time in seconds.
         """
 
-        time_parts = self.start_time.replace(",", ".").split(":")
-        hours = float(time_parts[0])
-        minutes = float(time_parts[1])
-        seconds = float(time_parts[2])
-
-        return hours * 3600 + minutes * 60 + seconds
+        return self.start
 
     def get_end_seconds(self) -> float:
         """
-        Convert timestamp to seconds for calculations.
+        Get the end time in seconds.
         """
 
-        time_parts = self.end_time.replace(",", ".").split(":")
-        hours = float(time_parts[0])
-        minutes = float(time_parts[1])
-        seconds = float(time_parts[2])
-
-        return hours * 3600 + minutes * 60 + seconds
+        return self.end
 
     def matches_search(self, search_term: str, case_sensitive: bool = False) -> bool:
         """
@@ -66,8 +126,10 @@ class SRTEditor:
 
         self.captions: List[SRTCaption] = []
         self.selected_caption: Optional[SRTCaption] = None
+        self.highlighted_captions = set()
         self.caption_cards = {}
         self.main_container = None
+        self.render_generation = 0
         self.search_term = ""
         self.search_results = []
         self.current_search_index = 0
@@ -76,6 +138,14 @@ class SRTEditor:
         self.__video_player = None
         self.autoscroll = False
         self.words_per_minute_element = None
+        self.validator = CaptionValidator()
+        self.issues_container = None
+        self.issue_icons = {}
+        self.parse_errors: List[ParseError] = []
+        self.changes = ChangeTracker()
+        self.history = EditHistory(self)
+        self.export_key = register_editor(self)
+        health.track_editor(self)
 
     def set_words_per_minute_element(self, element) -> None:
         """
@@ -118,59 +188,74 @@ class SRTEditor:
 
         self.__video_player = player
 
-    def parse_srt(self, srt_content: str) -> None:
+    def parse_srt(self, srt_content, version: Optional[int] = None) -> None:
         """
-        Parse SRT content and populate captions list.
+        Parse SRT content from a string, bytes or a stream and populate
+        captions list. Recoverable problems are kept in parse_errors.
         """
 
-        self.captions = []
+        self.parse_errors = []
+        self.captions = parse_srt(
+            srt_content, SRTCaption.from_seconds, self.parse_errors
+        )
+
+        self.renumber_captions()
+        self.validator.validate_all(self.captions)
+        self.changes.reset(self.captions, version)
+
+    def restore_journal(self, journal: dict) -> None:
+        """
+        Restore captions and unsaved changes from an autosave journal.
+        """
 
-        caption_blocks = re.split(r"\n\s*\n", srt_content.strip())
+        self.captions = replay(
+            journal, self.changes, self.build_caption, self.apply_caption_data
+        )
 
-        for block in caption_blocks:
-            if not block.strip():
-                continue
+        self.renumber_captions()
+        self.validator.validate_all(self.captions)
 
-            lines = block.strip().split("\n")
-            if len(lines) < 3:
-                continue
+    def build_caption(self, data: dict) -> SRTCaption:
+        return SRTCaption(0, data["start"], data["end"], data["text"])
 
-            try:
-                index = int(lines[0])
-                timestamp_line = lines[1]
-                text = "\n".join(lines[2:])
+    def apply_caption_data(self, caption: SRTCaption, data: dict) -> None:
+        caption.start_time = data["start"]
+        caption.end_time = data["end"]
+        caption.text = data["text"]
 
-                # Parse timestamp
-                if " --> " in timestamp_line:
-                    start_time, end_time = timestamp_line.split(" --> ")
-                    caption = SRTCaption(
-                        index, start_time.strip(), end_time.strip(), text
-                    )
-                    self.captions.append(caption)
-            except (ValueError, IndexError):
-                continue
+    def serialize_caption(self, caption: SRTCaption) -> dict:
+        """
+        Caption data sent to the backend when saving changes.
+        """
 
-        self.renumber_captions()
+        return {
+            "start": caption.start_time,
+            "end": caption.end_time,
+            "text": caption.text,
+        }
 
     def export_srt(self) -> str:
         """
         Export captions to SRT format.
         """
 
-        return "\n\n".join(caption.to_srt_format() for caption in self.captions)
+        return export_captions(self.captions, "srt")
 
     def export_vtt(self) -> str:
         """
         Export captions to VTT format.
         """
 
-        vtt_content = "WEBVTT\n\n"
-        for caption in self.captions:
-            vtt_content += f"{caption.index}\n"
-            vtt_content += f"{caption.start_time.replace(',', '.')} --> {caption.end_time.replace(',', '.')}\n"
-            vtt_content += f"{caption.text}\n\n"
+        return export_captions(self.captions, "vtt")
 
-        return vtt_content
+    def export_url(self, export_format: str, filename: str, **options) -> str:
+        """
+        Get the URL streaming the captions in the given format.
+        """
+
+        query = urlencode({"filename": filename, **options})
+
+        return f"/export/{self.export_key}/{export_format}?{query}"
 
     def renumber_captions(self) -> None:
         """
@@ -192,13 +277,7 @@ class SRTEditor:
         Convert seconds back to SRT timestamp format.
         """
 
-        hours = int(seconds // 3600)
-        minutes = int((seconds % 3600) // 60)
-        secs = seconds % 60
-        milliseconds = int((secs % 1) * 1000)
-        secs = int(secs)
-
-        return f"{hours:02d}:{minutes:02d}:{secs:02d},{milliseconds:03d}"
+        return format_timestamp(seconds)
 
     def search_captions(self, search_term: str) -> None:
         """
@@ -209,8 +288,7 @@ class SRTEditor:
         self.search_results = []
 
         # Clear previous highlights
-        for caption in self.captions:
-            caption.is_highlighted = False
+        self.highlighted_captions = set()
 
         if not search_term.strip():
             self.refresh_display()
@@ -221,7 +299,7 @@ class SRTEditor:
         for i, caption in enumerate(self.captions):
             if caption.matches_search(search_term, self.case_sensitive):
                 self.search_results.append(i)
-                caption.is_highlighted = True
+                self.highlighted_captions.add(caption)
 
         self.current_search_index = 0
         self.refresh_display()
@@ -277,8 +355,12 @@ class SRTEditor:
                 pattern = re.compile(re.escape(self.search_term), re.IGNORECASE)
                 new_text = pattern.sub(replacement, self.selected_caption.text)
 
-            self.selected_caption.text = new_text
+            self.history.record_set(
+                self.selected_caption, "text", self.selected_caption.text, new_text
+            )
+            self.apply_set(self.selected_caption, "text", new_text)
             self.refresh_display()
+            self.refresh_issues()
             ui.notify("Replacement made", type="positive")
         else:
             ui.notify("Current caption doesn't contain search term", type="warning")
@@ -291,19 +373,32 @@ class SRTEditor:
             ui.notify("No search term entered", type="warning")
             return
 
+        flags = 0 if self.case_sensitive else re.IGNORECASE
+        pattern = re.compile(re.escape(self.search_term), flags)
+
+        # The whole replacement is a single undo step that only stores where
+        # the matches were, not the text of every caption.
+        operation = ReplaceOperation(replacement)
         count = 0
-        for caption in self.captions:
-            if caption.matches_search(self.search_term, self.case_sensitive):
-                if self.case_sensitive:
-                    caption.text = caption.text.replace(self.search_term, replacement)
-                else:
-                    pattern = re.compile(re.escape(self.search_term), re.IGNORECASE)
-                    caption.text = pattern.sub(replacement, caption.text)
+        for position, caption in enumerate(self.captions):
+            matched = False
+            for match in pattern.finditer(caption.text):
+                operation.add_match(position, match.start(), match.group())
+                matched = True
+
+            if matched:
+                text = pattern.sub(lambda _: replacement, caption.text)
+                if text != caption.text:
+                    self.apply_set(caption, "text", text)
                 count += 1
 
+        if len(operation):
+            self.history.record(operation)
+
         if count > 0:
             # Refresh search results
             self.search_captions(self.search_term)
+            self.refresh_issues()
             ui.notify(f"Replaced {count} occurrences", type="positive")
         else:
             ui.notify("No matches found to replace", type="info")
@@ -368,10 +463,6 @@ class SRTEditor:
         end_seconds = caption.get_end_seconds()
         mid_seconds = (start_seconds + end_seconds) / 2
 
-        # Update first caption
-        caption.text = first_part
-        caption.end_time = self.seconds_to_timestamp(mid_seconds)
-
         # Create second caption
         new_caption = SRTCaption(
             caption.index + 1,
@@ -379,14 +470,24 @@ class SRTEditor:
             self.seconds_to_timestamp(end_seconds),
             second_part,
         )
-
-        # Insert new caption
         caption_index = self.captions.index(caption)
-        self.captions.insert(caption_index + 1, new_caption)
+
+        # Update first caption and insert the new one as one undo step
+        with self.history.group():
+            self.history.record_set(caption, "text", caption.text, first_part)
+            self.history.record_set(caption, "end", caption.end, new_caption.start)
+            self.history.record(("insert", new_caption, caption_index + 1))
+
+        caption.text = first_part
+        caption.end = new_caption.start
+        self.validator.caption_changed(caption)
+        self.changes.updated(caption)
+        self.apply_insert(new_caption, caption_index + 1)
 
         self.renumber_captions()
         self.update_words_per_minute()
         self.refresh_display()
+        self.refresh_issues()
 
     def add_caption_after(self, caption: SRTCaption) -> None:
         """
@@ -413,10 +514,12 @@ class SRTEditor:
         )
 
         # Insert new caption
-        self.captions.insert(caption_index + 1, new_caption)
+        self.apply_insert(new_caption, caption_index + 1)
+        self.history.record(("insert", new_caption, caption_index + 1))
 
         self.renumber_captions()
         self.refresh_display()
+        self.refresh_issues()
         self.update_words_per_minute()
 
     def remove_caption(self, caption: SRTCaption) -> None:
@@ -425,9 +528,11 @@ class SRTEditor:
         """
 
         if len(self.captions) > 1:  # Don't remove if it's the only caption
-            self.captions.remove(caption)
+            self.history.record(("delete", caption, self.captions.index(caption)))
+            self.apply_delete(caption)
             self.renumber_captions()
             self.refresh_display()
+            self.refresh_issues()
         else:
             ui.notify("Cannot remove the only remaining caption", type="warning")
 
@@ -438,13 +543,9 @@ class SRTEditor:
         Select/deselect a caption.
         """
 
-        if self.selected_caption:
-            self.selected_caption.is_selected = False
-
         if self.selected_caption == caption:
             self.selected_caption = None
         else:
-            caption.is_selected = True
             self.selected_caption = caption
 
             # Get caption start time
@@ -460,7 +561,13 @@ class SRTEditor:
         Update caption text.
         """
 
+        if caption.text == new_text:
+            return
+
+        self.history.record_set(caption, "text", caption.text, new_text)
         caption.text = new_text
+        self.changes.updated(caption)
+        self.refresh_issues(self.validator.caption_changed(caption))
         # self.refresh_display()
 
     def update_caption_timing(
@@ -470,10 +577,80 @@ class SRTEditor:
         Update caption timing.
         """
 
-        caption.start_time = start_time
-        caption.end_time = end_time
+        old_start = caption.start
+        old_end = caption.end
 
+        try:
+            caption.start_time = start_time
+            caption.end_time = end_time
+        except ValueError:
+            caption.start = old_start
+            caption.end = old_end
+            ui.notify("Invalid timestamp, use HH:MM:SS,mmm", type="warning")
+            return
+
+        with self.history.group():
+            self.history.record_set(caption, "start", old_start, caption.start)
+            self.history.record_set(caption, "end", old_end, caption.end)
+
+        self.validator.caption_changed(caption)
+        self.changes.updated(caption)
         self.refresh_display()
+        self.refresh_issues()
+
+    def history_items(self) -> List[SRTCaption]:
+        return self.captions
+
+    def apply_set(self, caption: SRTCaption, field: str, value: Any) -> None:
+        setattr(caption, field, value)
+        self.validator.caption_changed(caption)
+        self.changes.updated(caption)
+
+    def apply_insert(self, caption: SRTCaption, position: int) -> None:
+        self.captions.insert(position, caption)
+        self.validator.caption_added(caption)
+        self.changes.inserted(caption)
+
+    def apply_delete(self, caption: SRTCaption) -> None:
+        self.captions.remove(caption)
+        self.validator.caption_removed(caption)
+        self.changes.deleted(caption)
+
+        if self.selected_caption is caption:
+            self.selected_caption = None
+
+    def apply_move(self, caption: SRTCaption, position: int) -> None:
+        self.captions.remove(caption)
+        self.captions.insert(position, caption)
+        self.changes.moved(caption)
+
+    def undo(self) -> None:
+        """
+        Undo the last edit.
+        """
+
+        if not self.history.undo():
+            ui.notify("Nothing to undo", type="info")
+            return
+
+        self.after_history_change()
+
+    def redo(self) -> None:
+        """
+        Redo the last undone edit.
+        """
+
+        if not self.history.redo():
+            ui.notify("Nothing to redo", type="info")
+            return
+
+        self.after_history_change()
+
+    def after_history_change(self) -> None:
+        self.renumber_captions()
+        self.update_words_per_minute()
+        self.refresh_display()
+        self.refresh_issues()
 
     def create_search_panel(self) -> None:
         """
@@ -572,23 +749,34 @@ class SRTEditor:
         """
 
         card_class = "cursor-pointer border-0 transition-all duration-200 w-full"
+        is_selected = caption is self.selected_caption
+        is_highlighted = caption in self.highlighted_captions
 
-        if caption.is_selected:
+        if is_selected:
             card_class += " border-blue-500 bg-blue-50 shadow-lg"
-        elif caption.is_highlighted:
+        elif is_highlighted:
             card_class += " border-yellow-400 bg-yellow-50 hover:border-yellow-500"
         else:
             card_class += " hover:border-gray-300 hover:shadow-md shadow-none"
 
         with ui.card().classes(card_class) as card:
             with ui.row().classes("w-full items-center justify-between"):
-                ui.label(f"#{caption.index}").classes("font-bold text-sm text-gray-500")
+                with ui.row().classes("items-center gap-1"):
+                    ui.label(f"#{caption.index}").classes(
+                        "font-bold text-sm text-gray-500"
+                    )
+                    with ui.icon("error", color="negative").classes(
+                        "text-sm"
+                    ) as issue_icon:
+                        issue_tooltip = ui.tooltip("")
+                    self.issue_icons[caption] = (issue_icon, issue_tooltip)
+                    self.update_issue_flag(caption)
                 ui.label(
                     f"{self.format_time_display(caption.start_time)} → {self.format_time_display(caption.end_time)}"
                 ).classes("text-xs text-gray-400 font-mono")
 
             # Caption text (editable when selected)
-            if caption.is_selected:
+            if is_selected:
                 text_area = (
                     ui.textarea(value=caption.text)
                     .classes("w-full")
@@ -640,7 +828,7 @@ class SRTEditor:
                     ).on("click", lambda: self.select_caption(caption))
             else:
                 # Show text with search highlighting
-                if caption.is_highlighted and self.search_term:
+                if is_highlighted and self.search_term:
                     highlighted_text = self.get_highlighted_text(caption.text)
                     ui.html(highlighted_text).classes(
                         "text-sm leading-relaxed whitespace-pre-wrap"
@@ -653,7 +841,7 @@ class SRTEditor:
             card.on(
                 "click",
                 lambda: self.select_caption(caption)
-                if not caption.is_selected
+                if caption is not self.selected_caption
                 else None,
             )
 
@@ -661,8 +849,10 @@ class SRTEditor:
 
     def refresh_display(self) -> None:
         """Refresh the caption display"""
+        self.render_generation += 1
         if self.main_container:
             self.main_container.clear()
+            self.issue_icons = {}
             with self.main_container:
                 if not self.captions:
                     ui.label("No captions loaded").classes(
@@ -672,60 +862,134 @@ class SRTEditor:
                     for caption in self.captions:
                         self.create_caption_card(caption)
 
-    def validate_captions(self):
+    async def render_progressively(self, batch_size: int = RENDER_BATCH) -> None:
         """
-        Validate captions for overlapping times and empty text.
+        Build the caption cards in batches, letting each batch reach the
+        browser before the next one is built, so the first captions can be
+        read and edited while the rest of a long file is still coming in.
         """
-        errors = []
-        seen_times = set()
-        start_times = {}
 
-        for caption in self.captions:
-            if not caption.text.strip():
-                errors.append(f"Caption #{caption.index} has no text.")
-            if (caption.start_time, caption.end_time) in seen_times:
-                errors.append(
-                    f"Caption #{caption.index} overlaps with another caption."
-                )
+        if not self.main_container:
+            return
 
-            seen_times.add((caption.start_time, caption.end_time))
+        self.render_generation += 1
+        generation = self.render_generation
+        self.main_container.clear()
+        self.issue_icons = {}
 
-            if caption.start_time in start_times:
-                start_times[caption.start_time].append(caption.index)
-            else:
-                start_times[caption.start_time] = [caption.index]
+        if not self.captions:
+            with self.main_container:
+                ui.label("No captions loaded").classes("text-gray-500 text-center p-8")
+            return
 
-            if caption.get_end_seconds() < caption.get_start_seconds():
-                errors.append(
-                    f"Caption #{caption.index} has end time before start time."
-                )
+        captions = list(self.captions)
+        for first in range(0, len(captions), batch_size):
+            # A full refresh (e.g. after an edit) replaces what was built.
+            if generation != self.render_generation:
+                return
+            with self.main_container:
+                for caption in captions[first : first + batch_size]:
+                    self.create_caption_card(caption)
+            await asyncio.sleep(RENDER_PAUSE)
 
-        # Check for overlapping times
-        for i in range(len(self.captions) - 1):
-            current = self.captions[i]
-            next_caption = self.captions[i + 1]
+    def update_issue_flag(self, caption: SRTCaption) -> None:
+        """
+        Show or hide the inline issue marker of a caption card.
+        """
 
-            if current.get_end_seconds() > next_caption.get_start_seconds():
-                errors.append(
-                    f"Caption #{current.index} overlaps with caption #{next_caption.index}."
-                )
+        if caption not in self.issue_icons:
+            return
 
-        # Find start times with multiple captions
-        for start_time, indices in start_times.items():
-            if len(indices) > 1:
-                errors.append(
-                    f"Multiple captions start at the same time: {', '.join(map(str, indices))}."
-                )
+        issue_icon, issue_tooltip = self.issue_icons[caption]
+        issues = self.validator.get_issues(caption)
+
+        issue_icon.set_visibility(bool(issues))
+        issue_tooltip.set_text(" ".join(issue.message for issue in issues))
+
+    def refresh_issues(self, captions: Optional[set] = None) -> None:
+        """
+        Update the inline markers of the given captions and the issue list.
+        """
+
+        for caption in captions or ():
+            self.update_issue_flag(caption)
+
+        if not self.issues_container:
+            return
+
+        self.issues_container.clear()
+        with self.issues_container:
+            self._render_issue_list(limit=100)
+
+    def _render_issue_list(self, limit: int) -> None:
+        issues = self.validator.all_issues()
+
+        if not issues:
+            ui.label("No issues found").classes("text-sm text-green-600")
+            return
+
+        for issue in issues[:limit]:
+            ui.label(issue.message).classes(
+                "text-sm text-red-600 cursor-pointer hover:underline"
+            ).on("click", lambda issue=issue: self.show_issue(issue))
+
+        if len(issues) > limit:
+            ui.label(f"... and {len(issues) - limit} more").classes(
+                "text-sm text-gray-500"
+            )
+
+    def show_issue(self, issue) -> None:
+        """
+        Select the caption an issue belongs to.
+        """
+
+        if (
+            issue.caption in self.captions
+            and issue.caption is not self.selected_caption
+        ):
+            self.select_caption(issue.caption)
+
+    def create_issues_panel(self) -> None:
+        """
+        Create the panel listing validation issues.
+        """
+
+        with ui.expansion("Issues", icon="error_outline").classes("w-full").style(
+            "background-color: #eff4fb;"
+        ):
+            with ui.scroll_area().style("max-height: 200px;"):
+                self.issues_container = ui.column().classes("w-full gap-1")
+
+        self.refresh_issues()
+
+    def validate_captions(self):
+        """
+        Validate all captions and show the issues found.
+        """
+
+        self.validator.validate_all(self.captions)
+        self.refresh_display()
+        self.refresh_issues()
 
         with ui.dialog() as dialog:
             with ui.card().style(
                 "background-color: white; align-self: center; border: 0; width: 100%;"
             ):
-                if errors:
+                if self.validator.issue_count():
                     ui.label(
                         "The following issues were found with the captions:"
                     ).classes("text-bold")
-                    ui.html("<br>".join(errors)).classes("text-red-600")
+                    with ui.column().classes("gap-1"):
+                        for issue in self.validator.all_issues():
+                            ui.label(issue.message).classes(
+                                "text-red-600 cursor-pointer hover:underline"
+                            ).on(
+                                "click",
+                                lambda issue=issue: (
+                                    dialog.close(),
+                                    self.show_issue(issue),
+                                ),
+                            )
                 else:
                     ui.label("All captions are valid!").classes("text-green-600")
                 ui.button("Close", on_click=dialog.close).props("color=primary flat")
@@ -0,0 +1,276 @@
+import codecs
+import re
+
+from typing import Callable
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import Union
+
+# Timing line, e.g. "00:00:01,000 --> 00:00:02,500". Hours and milliseconds
+# are optional and "." is accepted as the millisecond separator. Anything
+# after the end time (such as VTT cue settings) is ignored.
+TIMING_RE = re.compile(
+    r"\s*(?:(\d+):)?(\d{1,2}):(\d{1,2})(?:[,.](\d{1,3}))?\s*-->\s*"
+    r"(?:(\d+):)?(\d{1,2}):(\d{1,2})(?:[,.](\d{1,3}))?"
+)
+
+# Characters split into lines at a time when parsing from a string or stream.
+READ_SIZE = 256 * 1024
+
+# The fixed width fields of canonical timestamps are looked up, which is
+# several times faster than calling int() on every slice.
+TWO_DIGITS = {f"{value:02d}": value for value in range(100)}
+MILLISECONDS = {f"{value:03d}": value / 1000 for value in range(1000)}
+
+
+class ParseError:
+    def __init__(self, line: int, message: str):
+        """
+        A recoverable problem found while parsing, with its line number.
+        """
+
+        self.line = line
+        self.message = message
+
+    def __str__(self) -> str:
+        return f"Line {self.line}: {self.message}"
+
+
+def _is_index(text: str) -> bool:
+    # str.isdigit() is also true for e.g. "²", which int() rejects.
+    return text.isascii() and text.isdigit()
+
+
+def _to_seconds(hours, minutes, seconds, milliseconds) -> float:
+    result = int(hours or 0) * 3600 + int(minutes) * 60 + int(seconds)
+
+    if milliseconds:
+        result += int(milliseconds.ljust(3, "0")) / 1000
+
+    return result
+
+
+def parse_timing(line: str):
+    """
+    Parse a timing line into (start, end) seconds, or None if it isn't one.
+    """
+
+    # Fast path for the canonical "HH:MM:SS,mmm --> HH:MM:SS,mmm".
+    if len(line) >= 29 and line[12:17] == " --> " and line[2] == line[19] == ":":
+        try:
+            return (
+                TWO_DIGITS[line[0:2]] * 3600
+                + TWO_DIGITS[line[3:5]] * 60
+                + TWO_DIGITS[line[6:8]]
+                + MILLISECONDS[line[9:12]],
+                TWO_DIGITS[line[17:19]] * 3600
+                + TWO_DIGITS[line[20:22]] * 60
+                + TWO_DIGITS[line[23:25]]
+                + MILLISECONDS[line[26:29]],
+            )
+        except KeyError:
+            pass
+
+    match = TIMING_RE.match(line)
+    if not match:
+        return None
+
+    groups = match.groups()
+
+    return _to_seconds(*groups[:4]), _to_seconds(*groups[4:])
+
+
+def _split_lines(text: str, final: bool) -> tuple:
+    """
+    Split text into complete lines and the unfinished rest.
+
+    Cutting at the last "\n" keeps a CRLF pair together, the rest is split
+    with str.splitlines() which handles both line endings in C.
+    """
+
+    if final:
+        return text.splitlines(), ""
+
+    cut = text.rfind("\n")
+    if cut < 0:
+        return [], text
+
+    return text[:cut].splitlines(), text[cut + 1 :]
+
+
+def _iter_text_lines(text: str) -> Iterator[str]:
+    """
+    Yield the lines of a string, splitting it a slice at a time.
+    """
+
+    pending = ""
+
+    for offset in range(0, len(text), READ_SIZE):
+        lines, pending = _split_lines(
+            pending + text[offset : offset + READ_SIZE], False
+        )
+        yield from lines
+
+    yield from _split_lines(pending, True)[0]
+
+
+def _iter_stream_lines(stream) -> Iterator[str]:
+    """
+    Decode a binary or text stream incrementally and yield its lines.
+    """
+
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    pending = ""
+    first = True
+
+    while True:
+        chunk = stream.read(READ_SIZE)
+        if not chunk:
+            break
+
+        if isinstance(chunk, bytes):
+            chunk = decoder.decode(chunk)
+
+        if first:
+            chunk = chunk.lstrip("\ufeff")
+            first = False
+
+        lines, pending = _split_lines(pending + chunk, False)
+        yield from lines
+
+    pending += decoder.decode(b"", final=True)
+    yield from _split_lines(pending, True)[0]
+
+
+def iter_lines(source: Union[str, bytes, Iterable]) -> Iterator[str]:
+    """
+    Yield the lines of a string, bytes object, stream or other iterable of
+    lines, without their line endings.
+    """
+
+    if isinstance(source, bytes):
+        source = source.decode("utf-8", errors="replace")
+
+    if isinstance(source, str):
+        return _iter_text_lines(source.lstrip("\ufeff"))
+
+    if hasattr(source, "read"):
+        return _iter_stream_lines(source)
+
+    return (line.rstrip("\r\n") for line in source)
+
+
+def parse_srt(
+    source: Union[str, bytes, Iterable],
+    make_caption: Callable[[int, float, float, str], object],
+    errors: List[ParseError] = None,
+) -> list:
+    """
+    Parse SRT content in a single pass over its lines.
+
+    CRLF line endings, a leading BOM, missing indices, "." millisecond
+    separators and missing blank lines between captions are tolerated.
+    Captions are built with make_caption(index, start, end, text) and
+    problems are appended to errors when a list is given.
+    """
+
+    captions = []
+    append = captions.append
+    index = None
+    timing = None
+    text_lines: List[str] = []
+    skipping = False
+
+    # Lines are classified by the state they are read in: inside a caption
+    # only blank lines and timing lines need a second look, and outside one
+    # the common index and timing lines are recognised without stripping.
+    for line_number, line in enumerate(iter_lines(source), 1):
+        if timing is not None:
+            # Inside a caption: collect text until the next blank line.
+            if not line or line.isspace():
+                append(
+                    make_caption(
+                        index or len(captions) + 1,
+                        timing[0],
+                        timing[1],
+                        "\n".join(text_lines),
+                    )
+                )
+                index, timing, text_lines = None, None, []
+                continue
+
+            if "-->" in line:
+                next_timing = parse_timing(line.strip())
+                if next_timing is not None:
+                    # A new caption that isn't separated by a blank line.
+                    next_index = None
+                    if text_lines and _is_index(text_lines[-1].strip()):
+                        next_index = int(text_lines.pop())
+                    append(
+                        make_caption(
+                            index or len(captions) + 1,
+                            timing[0],
+                            timing[1],
+                            "\n".join(text_lines),
+                        )
+                    )
+                    index, timing, text_lines = next_index, next_timing, []
+                    if errors is not None:
+                        errors.append(
+                            ParseError(line_number, "Missing blank line before caption")
+                        )
+                    continue
+
+            text_lines.append(line)
+            continue
+
+        if skipping:
+            if not line or line.isspace():
+                skipping = False
+            continue
+
+        if index is None and line.isdigit() and line.isascii():
+            index = int(line)
+            continue
+
+        timing = parse_timing(line)
+        if timing is not None:
+            continue
+
+        stripped = line.strip()
+
+        if not stripped:
+            index = None
+            continue
+
+        if index is None and _is_index(stripped):
+            index = int(stripped)
+            continue
+
+        if "-->" in stripped:
+            timing = parse_timing(stripped)
+            if timing is not None:
+                continue
+
+        if errors is not None:
+            expected = "timing line" if index is not None else "caption index"
+            errors.append(
+                ParseError(line_number, f"Expected {expected}, got {stripped!r}")
+            )
+
+        # Drop the rest of the broken block.
+        index = None
+        skipping = True
+
+    if timing is not None:
+        append(
+            make_caption(
+                index or len(captions) + 1,
+                timing[0],
+                timing[1],
+                "\n".join(text_lines),
+            )
+        )
+
+    return captions
@@ -0,0 +1,112 @@
+import asyncio
+import requests
+import time
+
+from datetime import datetime
+from nicegui import background_tasks
+from nicegui import run
+from typing import Optional
+from utils import backend
+from utils.metrics import record_cache
+from utils.settings import get_settings
+
+settings = get_settings()
+
+# The background refresh stops when no admin has looked at the statistics
+# for this many seconds, and starts again with the next view.
+IDLE_AFTER = 600
+
+
+def get_statistics(headers: dict) -> dict:
+    """
+    Get statistics from the API.
+    """
+
+    response = backend.get(f"{settings.API_URL}/api/v1/statistics", headers=headers)
+    response.raise_for_status()
+
+    return response.json()
+
+
+class StatisticsCache:
+    def __init__(self, interval: int):
+        """
+        Process-wide snapshot of the backend statistics.
+
+        Admin pages are served the snapshot straight away while a
+        background task fetches a new one every interval seconds, so the
+        backend sees at most one statistics query per interval however
+        many admins are looking. The query is made with the auth header of
+        the admin who last viewed the statistics.
+        """
+
+        self.interval = interval
+        self.snapshot: Optional[dict] = None
+        self.updated: Optional[datetime] = None
+        self.error: Optional[Exception] = None
+        self.headers: Optional[dict] = None
+        self.last_fetch = 0.0
+        self.last_view = 0.0
+        self.fetching: Optional[asyncio.Future] = None
+        self.task: Optional[asyncio.Task] = None
+
+    async def get(self, headers: dict) -> dict:
+        """
+        Get the statistics for an admin, waiting for them only if there is
+        no snapshot yet. Raises the error of the last fetch in that case.
+        """
+
+        self.headers = headers
+        self.last_view = time.monotonic()
+
+        if self.task is None or self.task.done():
+            self.task = background_tasks.create(
+                self._refresh_loop(), name="statistics refresh"
+            )
+
+        record_cache("statistics", self.snapshot is not None)
+        if self.snapshot is None:
+            await self.refresh(force=True)
+            if self.snapshot is None:
+                raise self.error
+
+        return self.snapshot
+
+    async def refresh(self, force: bool = False) -> None:
+        """
+        Fetch new statistics if the snapshot is older than the interval,
+        or regardless of its age if forced. Concurrent callers share one
+        request.
+        """
+
+        if not force and time.monotonic() - self.last_fetch < self.interval:
+            return
+
+        if self.fetching is None:
+            self.fetching = asyncio.ensure_future(self._fetch())
+
+        await asyncio.shield(self.fetching)
+
+    async def _fetch(self) -> None:
+        try:
+            self.snapshot = await run.io_bound(get_statistics, self.headers)
+            self.updated = datetime.now()
+            self.error = None
+        except requests.exceptions.RequestException as e:
+            # The last good snapshot is kept, a stale dashboard is better
+            # than an empty one.
+            self.error = e
+        finally:
+            self.last_fetch = time.monotonic()
+            self.fetching = None
+
+    async def _refresh_loop(self) -> None:
+        while time.monotonic() - self.last_view < IDLE_AFTER:
+            await self.refresh()
+            await asyncio.sleep(
+                max(1.0, self.interval - (time.monotonic() - self.last_fetch))
+            )
+
+
+# Shared by the admin dashboard and the usage export.
+statistics_cache = StatisticsCache(settings.STATISTICS_INTERVAL)
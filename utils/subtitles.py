@@ -0,0 +1,207 @@
+import html
+import re
+
+from typing import Iterable
+from typing import List
+from typing import Tuple
+from utils.srt import SRTCaption
+
+# Words and HTML tags (the transcript editor stores its text as HTML).
+TOKEN_RE = re.compile(r"<[^>]*>|[^\s<]+")
+
+SENTENCE_ENDINGS = (".", "?", "!", "…")
+
+
+class SubtitleStyle:
+    def __init__(
+        self,
+        max_line_length: int = 42,
+        max_lines: int = 2,
+        max_cps: float = 17.0,
+        min_duration: float = 1.0,
+        max_duration: float = 7.0,
+        min_gap: float = 0.08,
+    ):
+        """
+        Constraints for generated subtitles. The defaults follow common
+        broadcast guidelines.
+        """
+
+        self.max_line_length = max_line_length
+        self.max_lines = max_lines
+        self.max_cps = max_cps
+        self.min_duration = min_duration
+        self.max_duration = max_duration
+        self.min_gap = min_gap
+
+
+def timed_words(segment) -> List[Tuple[str, float, float]]:
+    """
+    Get (word, start, end) for the words of a transcript segment.
+
+    Words covered by a word timing get its times. Words covered by a part
+    timing, or between timings, share the time available to them in
+    proportion to their length.
+    """
+
+    timings = segment.words or segment.parts
+    spans = len(timings) if timings else 0
+    groups = []
+    group_key = None
+    span = 0
+
+    for match in TOKEN_RE.finditer(segment.text):
+        token = match.group()
+        if token[0] == "<":
+            continue
+
+        first, last = match.span()
+        while span < spans and timings.offsets[span] + timings.lengths[span] <= first:
+            span += 1
+
+        if span < spans and timings.offsets[span] < last:
+            key = (span, True)
+            start, end = timings.starts[span], timings.ends[span]
+        else:
+            key = (span, False)
+            start = timings.ends[span - 1] if span else segment.start
+            end = timings.starts[span] if span < spans else segment.end
+
+        if key != group_key:
+            groups.append((start, max(start, end), []))
+            group_key = key
+
+        groups[-1][2].append(html.unescape(token))
+
+    words = []
+    for start, end, tokens in groups:
+        total = sum(len(token) for token in tokens)
+        elapsed = 0
+        for token in tokens:
+            word_start = start + (end - start) * elapsed / total
+            elapsed += len(token)
+            words.append((token, word_start, start + (end - start) * elapsed / total))
+
+    return words
+
+
+def wrap_lines(words: List[str], width: int) -> List[str]:
+    """
+    Break words into lines of at most width characters. Two lines are
+    balanced rather than filling the first one up.
+    """
+
+    lines = []
+    line = ""
+    for word in words:
+        if line and len(line) + 1 + len(word) > width:
+            lines.append(line)
+            line = word
+        else:
+            line = f"{line} {word}" if line else word
+    if line:
+        lines.append(line)
+
+    if len(lines) != 2:
+        return lines
+
+    best = lines
+    best_difference = abs(len(lines[0]) - len(lines[1]))
+    for split in range(1, len(words)):
+        top = " ".join(words[:split])
+        bottom = " ".join(words[split:])
+        if len(top) > width or len(bottom) > width:
+            continue
+        if abs(len(top) - len(bottom)) < best_difference:
+            best = [top, bottom]
+            best_difference = abs(len(top) - len(bottom))
+
+    return best
+
+
+def build_captions(segments: Iterable, style: SubtitleStyle = None) -> List[SRTCaption]:
+    """
+    Build subtitle captions from transcript segments in a single pass.
+
+    A caption ends at a speaker change, at the end of a sentence, or when
+    the next word would break the line, line count, duration or reading
+    speed limits. Short or dense captions are then lengthened into the gap
+    before the next caption to meet the minimum duration and reading
+    speed, which is not always possible when the speech itself is faster
+    than max_cps.
+    """
+
+    style = style or SubtitleStyle()
+    captions: List[SRTCaption] = []
+    words: List[str] = []
+    start = end = 0.0
+    length = 0
+    speaker = None
+
+    def fits(new_length: int, word: str) -> bool:
+        # Only wrap the words when a single line isn't enough.
+        if new_length <= style.max_line_length:
+            return True
+        if new_length > style.max_line_length * style.max_lines:
+            return False
+        lines = wrap_lines(words + [word], style.max_line_length)
+        return len(lines) <= style.max_lines
+
+    def readable(chars: int, duration: float) -> bool:
+        return chars <= style.max_cps * duration
+
+    def split_for_speed(new_length: int, word_start: float, word_end: float) -> bool:
+        # Ending the caption before a word only helps the reading speed if
+        # the caption is readable without it, given the time up to that
+        # word. Otherwise the speech is just fast and splitting it up would
+        # only make more captions that are too fast.
+        return not readable(new_length, word_end - start) and readable(
+            length, word_start - style.min_gap - start
+        )
+
+    def flush() -> None:
+        if words:
+            text = "\n".join(wrap_lines(words, style.max_line_length))
+            captions.append(
+                SRTCaption.from_seconds(len(captions) + 1, start, end, text)
+            )
+            words.clear()
+
+    for segment in segments:
+        if segment.speaker != speaker:
+            flush()
+            speaker = segment.speaker
+
+        for word, word_start, word_end in timed_words(segment):
+            new_length = length + 1 + len(word)
+            if words and (
+                word_end - start > style.max_duration
+                or split_for_speed(new_length, word_start, word_end)
+                or not fits(new_length, word)
+            ):
+                flush()
+
+            if not words:
+                start = word_start
+                length = -1
+            words.append(word)
+            length += 1 + len(word)
+            end = word_end
+
+            # Very short sentences share a caption with the next one.
+            if word.endswith(SENTENCE_ENDINGS) and end - start >= style.min_duration:
+                flush()
+
+    flush()
+
+    for number, caption in enumerate(captions):
+        limit = float("inf")
+        if number + 1 < len(captions):
+            limit = captions[number + 1].start - style.min_gap
+
+        needed = max(style.min_duration, len(caption.text) / style.max_cps)
+        if caption.end - caption.start < needed:
+            caption.end = max(caption.end, min(caption.start + needed, limit))
+        caption.end = max(caption.start, min(caption.end, limit))
+
+    return captions
@@ -1,20 +1,101 @@
+import asyncio
 import jwt
 import requests
 import time
 
+from collections import OrderedDict
+from nicegui import Client
 from nicegui import app
+from nicegui import background_tasks
+from nicegui import context
+from nicegui import run
+from nicegui import ui
+from typing import Awaitable
+from typing import Dict
+from typing import Optional
+from typing import Set
+from utils import backend
+from utils.metrics import record_cache
 from utils.settings import get_settings
 
 
 settings = get_settings()
 
+# Number of tokens whose decoded claims are kept, least recently used first
+# out. Each token is decoded once and then looked up on every backend call.
+CLAIMS_CACHE_SIZE = 1024
 
-def token_refresh_call() -> str:
+# Tokens are refreshed this many seconds before they expire, and a session
+# is never refreshed more often than every REFRESH_MIN_INTERVAL seconds.
+REFRESH_MARGIN = 60
+REFRESH_MIN_INTERVAL = 10
+
+# Seconds the user profile from /api/v1/me is reused for by the pages of a
+# browser session.
+PROFILE_TTL = 60
+
+__jwt = jwt.JWT()
+__claims: OrderedDict = OrderedDict()
+
+# Per browser session: the task that refreshes its token, the refresh
+# request in flight and the ids of the clients (pages and tabs) using it.
+__refresh_tasks: Dict[str, asyncio.Task] = {}
+__refreshing: Dict[str, asyncio.Future] = {}
+__session_clients: Dict[str, Set[str]] = {}
+
+# Per browser session: when the user profile was fetched, and the profile.
+__profiles: Dict[str, tuple] = {}
+
+
+def get_claims(token: Optional[str]) -> Optional[dict]:
+    """
+    Get the decoded claims of a token, or None if the token is missing,
+    invalid or expired.
+    """
+
+    if not token:
+        return None
+
+    claims = __claims.get(token)
+    record_cache("claims", claims is not None)
+
+    if claims is None:
+        try:
+            # Expiry is checked below on every lookup instead.
+            claims = __jwt.decode(token, do_verify=False, do_time_check=False)
+        except Exception:
+            return None
+
+        __claims[token] = claims
+        if len(__claims) > CLAIMS_CACHE_SIZE:
+            __claims.popitem(last=False)
+    else:
+        __claims.move_to_end(token)
+
+    now = time.time()
+    if claims.get("exp", now + 1) <= now:
+        # An expired token never becomes valid again.
+        del __claims[token]
+        return None
+    if claims.get("nbf", now) > now:
+        return None
+
+    return claims
+
+
+def forget_token(token: Optional[str]) -> None:
+    """
+    Drop the cached claims of a token that has been replaced or logged out.
+    """
+
+    __claims.pop(token, None)
+
+
+def token_refresh_call(refresh_token: Optional[str]) -> str:
     try:
-        token_refresh = app.storage.user.get("refresh_token")
-        response = requests.post(
+        response = backend.post(
             settings.OIDC_APP_REFRESH_ROUTE,
-            json={"token": token_refresh},
+            json={"token": refresh_token},
         )
         response.raise_for_status()
     except requests.exceptions.RequestException:
@@ -23,35 +104,94 @@ def token_refresh_call() -> str:
     return response.json().get("access_token")
 
 
-def token_refresh() -> bool:
+def schedule_token_refresh() -> None:
     """
-    Refresh the token using the refresh token.
+    Keep the token of the current browser session fresh while any of its
+    pages are open.
+
+    All pages and tabs of a session share one task, which sleeps until
+    shortly before the token expires and then refreshes it. The new token
+    is stored in the session's user storage, where every page reads it.
     """
 
-    token_auth = app.storage.user.get("token")
+    session_id = app.storage.browser["id"]
+    __session_clients.setdefault(session_id, set()).add(context.client.id)
 
-    try:
-        jwt_instance = jwt.JWT()
-        jwt_decoded = jwt_instance.decode(token_auth, do_verify=False)
-    except Exception:
-        token = token_refresh_call()
-        if not token:
-            return None
-        jwt_decoded = jwt_instance.decode(token, do_verify=False)
-        app.storage.user["token"] = token
-    try:
-        # Only refresh if the token is about to expire within 60 seconds.
-        if jwt_decoded["exp"] - int(time.time()) > 60:
-            return True
+    task = __refresh_tasks.get(session_id)
+    if task is None or task.done():
+        __refresh_tasks[session_id] = background_tasks.create(
+            __refresh_loop(session_id, app.storage.user),
+            name=f"token refresh {session_id}",
+        )
 
-        token = token_refresh_call()
-        app.storage.user["token"] = token
-    except requests.exceptions.RequestException:
-        return None
+
+async def refresh_session_token(session_id: str, storage: dict) -> bool:
+    """
+    Refresh the token of a session. Callers arriving while a refresh is in
+    flight wait for it instead of sending the same refresh token again.
+    """
+
+    refreshing = __refreshing.get(session_id)
+    if refreshing is None:
+        refreshing = asyncio.ensure_future(__refresh(storage))
+        __refreshing[session_id] = refreshing
+        refreshing.add_done_callback(lambda _: __refreshing.pop(session_id, None))
+
+    return await asyncio.shield(refreshing)
+
+
+async def __refresh(storage: dict) -> bool:
+    old_token = storage.get("token")
+    token = await run.io_bound(token_refresh_call, storage.get("refresh_token"))
+
+    if not token:
+        # A token that hasn't expired yet stays usable until it does.
+        return get_claims(old_token) is not None
+
+    forget_token(old_token)
+    storage["token"] = token
 
     return True
 
 
+def __refresh_delay(token: Optional[str]) -> float:
+    claims = get_claims(token)
+    if not claims:
+        return 0.0
+
+    return claims.get("exp", float("inf")) - time.time() - REFRESH_MARGIN
+
+
+def __clients(session_id: str) -> Set[str]:
+    clients = __session_clients.get(session_id, set())
+    clients.intersection_update(Client.instances)
+    if not clients:
+        __session_clients.pop(session_id, None)
+
+    return clients
+
+
+async def __refresh_loop(session_id: str, storage: dict) -> None:
+    try:
+        while __clients(session_id):
+            delay = __refresh_delay(storage.get("token"))
+            if delay > 0:
+                # Wake up at least hourly to stop once the session's pages
+                # are gone. A token replaced meanwhile gets a new delay.
+                await asyncio.sleep(min(delay, 3600))
+                continue
+
+            if not await refresh_session_token(session_id, storage):
+                for client_id in __clients(session_id):
+                    with Client.instances[client_id]:
+                        ui.navigate.to(settings.OIDC_APP_LOGOUT_ROUTE)
+                return
+
+            await asyncio.sleep(REFRESH_MIN_INTERVAL)
+    finally:
+        __refresh_tasks.pop(session_id, None)
+
+
 def get_auth_header() -> dict[str, str]:
     """
     Get the authorization header for API requests.
@@ -59,10 +199,7 @@ def get_auth_header() -> dict[str, str]:
 
     token = app.storage.user.get("token")
 
-    try:
-        jwt_instance = jwt.JWT()
-        jwt_instance.decode(token, do_verify=False)
-    except Exception:
+    if get_claims(token) is None:
         return None
 
     return {"Authorization": f"Bearer {token}"}
@@ -73,39 +210,70 @@ def get_user_info() -> tuple[str, int] | None:
     Get user information from token.
     """
 
-    token = app.storage.user.get("token")
+    decoded_token = get_claims(app.storage.user.get("token"))
 
-    if not token:
+    if not decoded_token:
         return None, None
 
     try:
-        jwt_instance = jwt.JWT()
-        decoded_token = jwt_instance.decode(token, do_verify=False)
         lifetime = decoded_token["exp"] - int(time.time())
-
-        if "eduPersonPrincipalName" in decoded_token:
-            username = decoded_token["eduPersonPrincipalName"]
-        elif "preferred_username" in decoded_token:
-            username = decoded_token["preferred_username"]
-        elif "username" in decoded_token:
-            username = decoded_token["username"]
-        else:
-            username = "Unknown"
-    except Exception:
+    except KeyError:
         return None, None
 
+    if "eduPersonPrincipalName" in decoded_token:
+        username = decoded_token["eduPersonPrincipalName"]
+    elif "preferred_username" in decoded_token:
+        username = decoded_token["preferred_username"]
+    elif "username" in decoded_token:
+        username = decoded_token["username"]
+    else:
+        username = "Unknown"
+
     return username, lifetime
 
 
-def get_user_data() -> dict:
+def get_user_data(refresh: bool = False) -> dict:
     """
     Get user data.
+
+    The profile is fetched once per PROFILE_TTL seconds per browser
+    session and shared by the header, the admin check and the user page.
     """
 
+    session_id = app.storage.browser["id"]
+    cached = __cached_profile(session_id, refresh)
+    if cached is not None:
+        return cached
+
+    return __store_profile(session_id, __fetch_user_data(get_auth_header()))
+
+
+def load_user_data(refresh: bool = False) -> Awaitable[dict]:
+    """
+    Like get_user_data, but the request runs in a worker thread.
+
+    The session and auth header are looked up before this returns, so the
+    result can be awaited together with other requests of the page.
+    """
+
+    session_id = app.storage.browser["id"]
+    cached = __cached_profile(session_id, refresh)
+    headers = get_auth_header()
+
+    async def load() -> dict:
+        if cached is not None:
+            return cached
+
+        data = await run.io_bound(__fetch_user_data, headers)
+
+        return __store_profile(session_id, data)
+
+    return load()
+
+
+def __fetch_user_data(headers: dict) -> Optional[dict]:
     try:
-        response = requests.get(
-            f"{settings.API_URL}/api/v1/me", headers=get_auth_header()
-        )
+        response = backend.get(f"{settings.API_URL}/api/v1/me", headers=headers)
         response.raise_for_status()
         data = response.json()
 
@@ -115,11 +283,47 @@ def get_user_data() -> dict:
         return None
 
 
-def get_admin_status() -> bool:
+def __cached_profile(session_id: str, refresh: bool) -> Optional[dict]:
+    if refresh:
+        return None
+
+    cached = __profiles.get(session_id)
+    hit = cached is not None and time.monotonic() - cached[0] < PROFILE_TTL
+    record_cache("profile", hit)
+
+    return cached[1] if hit else None
+
+
+def __store_profile(session_id: str, data: Optional[dict]) -> Optional[dict]:
+    if data is None:
+        return None
+
+    # Sessions that haven't been seen for a while are dropped here rather
+    # than by a timer.
+    now = time.monotonic()
+    for other_id, (fetched, _) in list(__profiles.items()):
+        if now - fetched >= PROFILE_TTL:
+            del __profiles[other_id]
+
+    __profiles[session_id] = (now, data)
+
+    return data
+
+
+def invalidate_user_data() -> None:
+    """
+    Forget the cached profile of the current session, e.g. after its jobs
+    changed or the user logged in or out.
+    """
+
+    __profiles.pop(app.storage.browser["id"], None)
+
+
+def get_admin_status(user_data: Optional[dict] = None) -> bool:
     """
-    Check if the user is an admin based on the token.
+    Check if the user is an admin, from the given or the cached profile.
     """
     try:
-        return get_user_data()["user"]["is_admin"]
+        return (user_data or get_user_data())["user"]["is_admin"]
     except (KeyError, TypeError):
         return False
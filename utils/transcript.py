@@ -1,19 +1,426 @@
+import asyncio
 import json
+import re
+import sys
+
+from array import array
+from bisect import bisect_left
+from bisect import bisect_right
 from nicegui import ui
 from typing import Any
 from typing import Dict
 from typing import List
+from typing import Optional
+from utils.autosave import replay
+from utils.changes import ChangeTracker
+from utils.exporters import export_captions
+from utils.health import health
+from utils.history import EditHistory
+from utils.history import ReplaceOperation
+from utils.search import TAG_RE
+from utils.search import SegmentIndex
+from utils.search import compile_search
+from utils.search import find_matches
+from utils.search import text_runs
+from utils.speakers import SpeakerTable
+from utils.subtitles import build_captions
+
+# Tags the segment editor produces, which are kept as formatting when a
+# segment is rendered. Any other tag is shown as text.
+EDITOR_TAG_RE = re.compile(
+    r"</?(?:b|i|u|s|strike|em|strong|br|div|p|ul|ol|li|sub|sup|code|pre|"
+    r"blockquote|h[1-6]|hr)\s*/?>",
+    re.IGNORECASE,
+)
+
+# Characters to escape in the text between tags, "&" only if it doesn't
+# start a character reference.
+UNSAFE_RE = re.compile(r"&(?!#\d+;|#[xX][0-9a-fA-F]+;|[A-Za-z]\w*;)|[<>]")
+ESCAPES = {"&": "&amp;", "<": "&lt;", ">": "&gt;"}
+
+
+def _escape_text(text: str) -> str:
+    return UNSAFE_RE.sub(lambda match: ESCAPES[match.group()], text)
+
+
+def _escape_tag(tag: re.Match) -> str:
+    # Keep the tags of the editor, escape any others.
+    if EDITOR_TAG_RE.fullmatch(tag.group()):
+        return tag.group()
+
+    return _escape_text(tag.group())
+
+
+def _escape_tags(tags: str) -> str:
+    return TAG_RE.sub(_escape_tag, tags)
+
+
+# Highlights search matches in the rendered rows with the CSS Custom
+# Highlight API, which doesn't change the markup of the rows.
+SEARCH_HIGHLIGHT_JS = """
+<style>
+::highlight(transcript-search) { background-color: #fef08a; }
+</style>
+<script>
+window.transcriptSearch = {
+  pattern: null, scheduled: false,
+  set(term, regex, flags) {
+    this.pattern = null;
+    if (term) {
+      try {
+        const source = regex ? term : term.replace(/[.*+?^${}()|[\\]\\\\]/g, "\\\\$&");
+        this.pattern = new RegExp(source, flags);
+      } catch (e) {}
+    }
+    this.apply();
+  },
+  schedule() {
+    if (this.scheduled) return;
+    this.scheduled = true;
+    requestAnimationFrame(() => {
+      this.scheduled = false;
+      this.apply();
+    });
+  },
+  apply() {
+    if (!window.CSS || !CSS.highlights) return;
+    const ranges = [];
+    if (this.pattern) {
+      document.querySelectorAll(".transcript-text").forEach((element) => {
+        const nodes = [], starts = [];
+        let text = "";
+        const walker = document.createTreeWalker(element, NodeFilter.SHOW_TEXT);
+        while (walker.nextNode()) {
+          nodes.push(walker.currentNode);
+          starts.push(text.length);
+          text += walker.currentNode.data;
+        }
+        const locate = (offset) => {
+          let i = nodes.length - 1;
+          while (i > 0 && starts[i] > offset) i--;
+          return [nodes[i], offset - starts[i]];
+        };
+        for (const match of text.matchAll(this.pattern)) {
+          if (!match[0]) continue;
+          const range = new Range();
+          range.setStart(...locate(match.index));
+          range.setEnd(...locate(match.index + match[0].length));
+          ranges.push(range);
+        }
+      });
+    }
+    CSS.highlights.set("transcript-search", new Highlight(...ranges));
+  },
+};
+</script>
+"""
+
+# Rows rendered above and below the visible part of the transcript.
+OVERSCAN_ROWS = 10
+
+# Used to estimate the height of rows that aren't rendered.
+ROW_HEIGHT = 90
+LINE_HEIGHT = 20
+LINE_CHARACTERS = 80
+EDITOR_HEIGHT = 60
+
+# Seconds without typing before text typed into a segment editor is applied.
+# The editor reports every keystroke, applying them one by one would add a
+# history step and a journal operation for each.
+TEXT_EDIT_DELAY = 1.0
+
+# Highlights the word being played and seeks to a clicked word entirely in
+# the browser. The server only sends the word timings after rendering.
+WORD_HIGHLIGHT_JS = """
+<style>
+.transcript-word { cursor: pointer; border-radius: 2px; }
+.transcript-word.playing { background-color: #fde68a; }
+</style>
+<script>
+window.transcriptWords = {
+  segments: {}, entries: null, current: null,
+  set(segments) {
+    this.segments = segments;
+    this.entries = null;
+  },
+  setSegment(key, timings) {
+    this.segments[key] = timings;
+    this.entries = null;
+  },
+  build() {
+    this.entries = [];
+    for (const [key, [starts, ends]] of Object.entries(this.segments)) {
+      starts.forEach((start, i) => {
+        this.entries.push([start, ends[i], `tw-${key}-${i}`]);
+      });
+    }
+    this.entries.sort((a, b) => a[0] - b[0]);
+  },
+  find(time) {
+    if (!this.entries) this.build();
+    let low = 0, high = this.entries.length - 1, found = null;
+    while (low <= high) {
+      const middle = (low + high) >> 1;
+      if (this.entries[middle][0] <= time) {
+        found = this.entries[middle];
+        low = middle + 1;
+      } else {
+        high = middle - 1;
+      }
+    }
+    return found && found[1] >= time ? found[2] : null;
+  },
+  update(time) {
+    const word = this.find(time);
+    const previous = this.current && document.getElementById(this.current);
+    if (word === this.current && (!word || previous)) return;
+    if (previous) previous.classList.remove("playing");
+    const element = word && document.getElementById(word);
+    if (element) element.classList.add("playing");
+    this.current = word;
+  },
+};
+document.addEventListener("timeupdate", (e) => {
+  if (e.target.tagName === "VIDEO") transcriptWords.update(e.target.currentTime);
+}, true);
+document.addEventListener("click", (e) => {
+  const element = e.target.closest && e.target.closest(".transcript-word");
+  const video = document.querySelector("video");
+  if (!element || !video) return;
+  video.currentTime = parseFloat(element.dataset.start);
+}, true);
+</script>
+"""
+
+
+class Timings:
+    __slots__ = ("starts", "ends", "offsets", "lengths")
+
+    def __init__(self):
+        """
+        Start and end times of spans of a segment's text, kept in arrays
+        rather than as one object per span. Spans are sorted by offset.
+        """
+
+        self.starts = array("d")
+        self.ends = array("d")
+        self.offsets = array("I")
+        self.lengths = array("I")
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def __sizeof__(self) -> int:
+        return object.__sizeof__(self) + sum(
+            sys.getsizeof(values)
+            for values in (self.starts, self.ends, self.offsets, self.lengths)
+        )
+
+    def append(self, start: float, end: float, offset: int, length: int) -> None:
+        self.starts.append(start)
+        self.ends.append(end)
+        self.offsets.append(offset)
+        self.lengths.append(length)
+
+    def to_list(self) -> List[list]:
+        return [
+            self.starts.tolist(),
+            self.ends.tolist(),
+            self.offsets.tolist(),
+            self.lengths.tolist(),
+        ]
+
+    @classmethod
+    def from_list(cls, values: Optional[List[list]]) -> Optional["Timings"]:
+        if not values:
+            return None
+
+        timings = cls()
+        for column, items in zip(
+            (timings.starts, timings.ends, timings.offsets, timings.lengths), values
+        ):
+            column.extend(items)
+
+        return timings
+
+    def index_at(self, time: float) -> int:
+        """
+        Get the index of the last span starting at or before time, or -1.
+        """
+
+        return bisect_right(self.starts, time) - 1
+
+    def retarget(self, prefix: int, old_end: int, shift: int) -> "Timings":
+        """
+        Get the spans after the text between prefix and old_end was edited
+        and its length changed by shift. Spans inside the edit are dropped,
+        spans that overlap it are stretched to cover the new text.
+        """
+
+        new_end = old_end + shift
+        timings = Timings()
+        for span in range(len(self)):
+            offset = self.offsets[span]
+            end = offset + self.lengths[span]
+            if end <= prefix:
+                timings.append(
+                    self.starts[span], self.ends[span], offset, self.lengths[span]
+                )
+                continue
+            if offset >= old_end:
+                timings.append(
+                    self.starts[span],
+                    self.ends[span],
+                    offset + shift,
+                    self.lengths[span],
+                )
+                continue
+            if offset >= prefix and end <= old_end:
+                continue
+
+            start = min(offset, prefix)
+            end = end + shift if end > old_end else new_end
+            timings.append(self.starts[span], self.ends[span], start, end - start)
+
+        return timings
 
 
 class TranscriptSegment:
-    def __init__(self, speaker: str, text: str, start: float = 0.0, end: float = 0.0):
-        self.speaker = speaker
+    # Only segment data is kept here. Selection and search highlighting are
+    # held by the editor, for the few segments they apply to.
+    __slots__ = (
+        "speakers",
+        "speaker_id",
+        "text",
+        "start",
+        "end",
+        "parts",
+        "words",
+        "item_id",
+    )
+
+    def __init__(
+        self,
+        speaker: str,
+        text: str,
+        start: float = 0.0,
+        end: float = 0.0,
+        speakers: Optional[SpeakerTable] = None,
+    ):
+        self.speakers = speakers if speakers is not None else SpeakerTable()
+        self.speaker_id = self.speakers.intern(speaker)
         self.text = text
         self.start = start
         self.end = end
-        self.duration = end - start
-        self.is_selected = False
-        self.is_highlighted = False
+        # Timing of the merged backend segments and of single words.
+        self.parts: Optional[Timings] = None
+        self.words: Optional[Timings] = None
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+    # The name is looked up in the speaker table, so renaming a speaker
+    # doesn't touch its segments.
+    @property
+    def speaker(self) -> str:
+        return self.speakers.name(self.speaker_id)
+
+    @speaker.setter
+    def speaker(self, name: str) -> None:
+        self.speaker_id = self.speakers.intern(name)
+
+    @classmethod
+    def from_parts(
+        cls, speaker: str, parts: List[dict], speakers: SpeakerTable
+    ) -> "TranscriptSegment":
+        """
+        Merge consecutive backend segments of one speaker, keeping the
+        timing of each of them and of their words.
+        """
+
+        texts = []
+        part_timings = Timings()
+        word_timings = Timings()
+        offset = 0
+
+        for part in parts:
+            text = part.get("text", "")
+            part_timings.append(
+                part.get("start", 0.0), part.get("end", 0.0), offset, len(text)
+            )
+
+            cursor = 0
+            for word in part.get("words") or ():
+                word_text = word.get("word", "").strip()
+                if not word_text or "start" not in word or "end" not in word:
+                    continue
+
+                position = text.find(word_text, cursor)
+                if position < 0:
+                    continue
+
+                cursor = position + len(word_text)
+                word_timings.append(
+                    word["start"], word["end"], offset + position, len(word_text)
+                )
+
+            texts.append(text)
+            offset += len(text) + 1
+
+        segment = cls(
+            speaker,
+            " ".join(texts),
+            parts[0].get("start", 0.0),
+            parts[-1].get("end", 0.0),
+            speakers,
+        )
+        # A single part has the timing of the segment itself.
+        segment.parts = part_timings if len(parts) > 1 else None
+        segment.words = word_timings or None
+
+        return segment
+
+    def set_text(self, text: str) -> None:
+        """
+        Change the text, moving the part and word timings that are outside
+        the edited range.
+        """
+
+        old_text = self.text
+        self.text = text
+
+        if self.parts is None and self.words is None:
+            return
+
+        shortest = min(len(old_text), len(text))
+        prefix = 0
+        while prefix < shortest and old_text[prefix] == text[prefix]:
+            prefix += 1
+        suffix = 0
+        while suffix < shortest - prefix and old_text[-1 - suffix] == text[-1 - suffix]:
+            suffix += 1
+
+        old_end = len(old_text) - suffix
+        shift = len(text) - len(old_text)
+
+        if self.parts is not None:
+            self.parts = self.parts.retarget(prefix, old_end, shift)
+        if self.words is not None:
+            self.words = self.words.retarget(prefix, old_end, shift)
+
+    def time_at(self, offset: int) -> float:
+        """
+        Get the time the text at offset is spoken, as far as it is known.
+        """
+
+        for timings in (self.words, self.parts):
+            if timings:
+                span = bisect_right(timings.offsets, offset) - 1
+                if span >= 0:
+                    return timings.starts[span]
+
+        return self.start
 
     def to_dict(self) -> Dict[str, Any]:
         return {
@@ -24,17 +431,53 @@ class TranscriptSegment:
             "duration": self.duration,
         }
 
+    def to_journal(self) -> Dict[str, Any]:
+        """
+        Like to_dict, but including the part and word timings.
+        """
+
+        data = self.to_dict()
+        data["parts"] = self.parts.to_list() if self.parts is not None else None
+        data["words"] = self.words.to_list() if self.words is not None else None
+
+        return data
+
 
 class TranscriptEditor:
-    def __init__(self, data: str):
-        self.original_data = json.loads(data)
+    def __init__(self, data: Optional[str] = None, version: Optional[int] = None):
         self.segments: List[TranscriptSegment] = []
-        self.speakers = set()
+        self.speakers = SpeakerTable()
+        self.speaker_selects: List[ui.select] = []
         self.container = None
-        self.parse_segments()
+        self.changes = ChangeTracker()
+        self.history = EditHistory(self)
+        health.track_editor(self)
+        self.load(data, version)
         self.video_player = None
+        self.assets_added = False
         self.autoscroll = False
         self.selected_segment: TranscriptSegment = None
+        self.segment_rows: Dict[TranscriptSegment, ui.column] = {}
+        self.scroll_area = None
+        self.rows_column = None
+        self.top_spacer = None
+        self.bottom_spacer = None
+        self.viewport_top = 0.0
+        self.viewport_height = 1000.0
+        self.row_offsets = array("d")
+        self.layout_dirty = True
+        self.stale_segments = set()
+        self.window = (0, 0)
+        self.search_index = SegmentIndex()
+        self.search_term = ""
+        self.search_options = (False, False, None)
+        self.search_matches: List[tuple] = []
+        self.search_pattern: Optional[re.Pattern] = None
+        self.search_position = 0
+        self.search_info_label = None
+        self.highlighted_segment: Optional[TranscriptSegment] = None
+        self.pending_text: Optional[tuple] = None
+        self.pending_text_timer: Optional[asyncio.TimerHandle] = None
 
     async def select_segment_from_video(self, autoscroll: bool) -> None:
         if not autoscroll:
@@ -50,22 +493,34 @@ class TranscriptEditor:
 
         if caption:
             if self.selected_segment != caption:
-                self.select_segment(caption, None)
+                self.select_segment(caption)
+                self.scroll_to_segment(caption)
 
-    def select_segment(self, caption: TranscriptSegment, action_col: ui.column) -> None:
-        if self.selected_segment:
-            self.selected_segment.is_selected = False
+    def select_segment(self, caption: TranscriptSegment, seek: bool = True) -> None:
+        """
+        Select a segment, mounting its editor and unmounting the editor of
+        the previously selected segment. Other rows are left untouched.
+        """
 
-        caption.is_selected = True
+        self.apply_pending_text()
+        previous = self.selected_segment
         self.selected_segment = caption
 
-        if self.video_player:
+        # A click on a word has already moved the player to that word.
+        if self.video_player and seek:
             self.video_player.seek(caption.start)
 
-        if action_col:
-            action_col.visible = True
+        if previous is not caption:
+            self.refresh_segment(previous)
+            self.refresh_segment(caption)
 
-        self.refresh_ui()
+    def deselect_segment(self) -> None:
+        self.apply_pending_text()
+        segment = self.selected_segment
+
+        if segment:
+            self.selected_segment = None
+            self.refresh_segment(segment)
 
     def get_segment_from_time(self, time: float) -> TranscriptSegment:
         for segment in self.segments:
@@ -77,71 +532,561 @@ class TranscriptEditor:
     def set_video_player(self, player) -> None:
         self.video_player = player
 
-    def parse_segments(self):
-        if not self.original_data.get("segments"):
-            return
+    def load(self, data: Optional[str], version: Optional[int] = None) -> None:
+        """
+        Replace the segments with those of a transcription result. Nothing
+        here touches the UI, so pages can run it off the event loop.
+        """
+
+        self.segments = []
+        # The raw result is only kept until it has been parsed.
+        self.parse_segments(json.loads(data) if data else {})
+        self.changes.reset(self.segments, version)
 
-        raw_segments = self.original_data["segments"]
+    def parse_segments(self, data: dict):
+        raw_segments = data.get("segments")
 
         if not raw_segments:
             return
 
-        concatenated = []
-        current = raw_segments[0].copy()
+        # Consecutive segments of the same speaker are collected and joined
+        # once, which keeps merging linear in the length of the transcript.
+        group = [raw_segments[0]]
 
         for segment in raw_segments[1:]:
-            if segment["speaker"] == current["speaker"]:
-                current["text"] += " " + segment["text"]
-                current["end"] = segment["end"]
-                current["duration"] = current["end"] - current["start"]
-            else:
-                concatenated.append(current)
-                current = segment.copy()
-
-        concatenated.append(current)
-
-        for seg in concatenated:
-            if seg.get("text", "").strip():
-                self.segments.append(
-                    TranscriptSegment(
-                        speaker=seg["speaker"],
-                        text=seg["text"],
-                        start=seg.get("start", 0.0),
-                        end=seg.get("end", 0.0),
-                    )
-                )
-                self.speakers.add(seg["speaker"])
+            if segment["speaker"] != group[0]["speaker"]:
+                self._add_merged_segment(group)
+                group = []
+            group.append(segment)
+
+        self._add_merged_segment(group)
+
+    def _add_merged_segment(self, parts: List[dict]) -> None:
+        segment = TranscriptSegment.from_parts(
+            parts[0]["speaker"], parts, self.speakers
+        )
+
+        if segment.text.strip():
+            self.segments.append(segment)
+
+    def restore_journal(self, journal: dict) -> None:
+        """
+        Restore segments and unsaved changes from an autosave journal.
+        """
+
+        self.segments = replay(
+            journal,
+            self.changes,
+            self.build_segment,
+            self.apply_segment_data,
+        )
+
+    def build_segment(self, data: dict) -> TranscriptSegment:
+        segment = TranscriptSegment(
+            data["speaker"], data["text"], data["start"], data["end"], self.speakers
+        )
+        segment.parts = Timings.from_list(data.get("parts"))
+        segment.words = Timings.from_list(data.get("words"))
+
+        return segment
+
+    def apply_segment_data(self, segment: TranscriptSegment, data: dict) -> None:
+        segment.speaker = data["speaker"]
+        segment.text = data["text"]
+        segment.start = data["start"]
+        segment.end = data["end"]
+        segment.parts = Timings.from_list(data.get("parts"))
+        segment.words = Timings.from_list(data.get("words"))
 
     def add_segment(self, speaker: str, text: str, position: int = None):
         if position is None:
             position = len(self.segments)
 
-        new_segment = TranscriptSegment(speaker, text)
+        new_segment = TranscriptSegment(speaker, text, speakers=self.speakers)
 
-        self.segments.insert(position, new_segment)
-        self.speakers.add(speaker)
+        self.apply_insert(new_segment, position)
+        self.history.record(("insert", new_segment, position))
         self.refresh_ui()
 
     def remove_segment(self, index: int):
         if 0 <= index < len(self.segments):
-            self.segments.pop(index)
+            segment = self.segments[index]
+            self.history.record(("delete", segment, index))
+            self.apply_delete(segment)
             self.refresh_ui()
 
     def update_segment(self, index: int, speaker: str = None, text: str = None):
         if 0 <= index < len(self.segments):
+            segment = self.segments[index]
             if speaker is not None:
-                self.segments[index].speaker = speaker
-                self.speakers.add(speaker)
+                speaker_id = self.speakers.intern(speaker)
+                self.history.record_set(
+                    segment, "speaker_id", segment.speaker_id, speaker_id
+                )
+                segment.speaker_id = speaker_id
             if text is not None:
-                self.segments[index].text = text
+                self.history.record_set(segment, "text", segment.text, text)
+                segment.set_text(text)
+                self.search_index.update(segment)
+            self.changes.updated(segment)
+            self.layout_dirty = True
+
+    def edit_text(self, segment: TranscriptSegment, text: str) -> None:
+        """
+        Apply text typed into a segment editor once typing pauses.
+        """
+
+        if self.pending_text and self.pending_text[0] is not segment:
+            self.apply_pending_text()
+
+        self.pending_text = (segment, text)
+
+        if self.pending_text_timer:
+            self.pending_text_timer.cancel()
+        self.pending_text_timer = asyncio.get_running_loop().call_later(
+            TEXT_EDIT_DELAY, self.apply_pending_text
+        )
+
+    def apply_pending_text(self) -> None:
+        """
+        Apply text from edit_text right away, e.g. when the editor loses
+        focus or before saving.
+        """
+
+        if self.pending_text_timer:
+            self.pending_text_timer.cancel()
+            self.pending_text_timer = None
+
+        if not self.pending_text:
+            return
+
+        segment, text = self.pending_text
+        self.pending_text = None
+
+        try:
+            index = self.segments.index(segment)
+        except ValueError:
+            return
+
+        self.update_segment(index, text=text)
 
     def move_segment(self, from_index: int, to_index: int):
         if 0 <= from_index < len(self.segments) and 0 <= to_index < len(self.segments):
-            segment = self.segments.pop(from_index)
+            segment = self.segments[from_index]
 
-            self.segments.insert(to_index, segment)
+            self.apply_move(segment, to_index)
+            self.history.record(("move", segment, from_index, to_index))
             self.refresh_ui()
 
+    def history_items(self) -> List[TranscriptSegment]:
+        return self.segments
+
+    def apply_set(self, segment: TranscriptSegment, field: str, value: Any) -> None:
+        if field == "text":
+            segment.set_text(value)
+            self.search_index.update(segment)
+        else:
+            setattr(segment, field, value)
+        self.stale_segments.add(segment)
+        self.changes.updated(segment)
+
+    def apply_insert(self, segment: TranscriptSegment, position: int) -> None:
+        self.segments.insert(position, segment)
+        self.search_index.add(segment)
+        self.changes.inserted(segment)
+
+    def apply_delete(self, segment: TranscriptSegment) -> None:
+        self.segments.remove(segment)
+        self.search_index.remove(segment)
+        self.changes.deleted(segment)
+
+        if self.selected_segment is segment:
+            self.selected_segment = None
+
+    def apply_move(self, segment: TranscriptSegment, position: int) -> None:
+        self.segments.remove(segment)
+        self.segments.insert(position, segment)
+        self.changes.moved(segment)
+
+        # The move buttons of an open editor depend on the position.
+        if self.selected_segment:
+            self.stale_segments.add(self.selected_segment)
+
+    def apply_speakers(self, state: tuple) -> None:
+        old_state = self.speakers.get_state()
+        self.speakers.set_state(state)
+        self._speakers_changed(old_state)
+
+    def _speakers_changed(self, old_state: tuple) -> None:
+        """
+        Mark the segments whose speaker name changed since old_state as
+        updated, in one pass over the segments.
+        """
+
+        old_names, old_parents = old_state
+        names, parents = self.speakers.get_state()
+        changed = {
+            speaker_id
+            for speaker_id in range(len(old_names))
+            if names[speaker_id] != old_names[speaker_id]
+            or parents[speaker_id] != old_parents[speaker_id]
+        }
+
+        for segment in self.segments:
+            speaker_id = segment.speaker_id
+            if speaker_id in changed or self.speakers.resolve(speaker_id) in changed:
+                self.changes.updated(segment)
+                self.stale_segments.add(segment)
+
+        self.update_speaker_options()
+
+    def change_speakers(self, action: str, name: str, other: str) -> None:
+        """
+        Rename, merge or swap speakers as a single undo step.
+        """
+
+        if name not in self.speakers or not other:
+            ui.notify("Please select a speaker and a new name", type="warning")
+            return
+
+        if action != "rename" and other not in self.speakers:
+            ui.notify(f"Unknown speaker: {other}", type="warning")
+            return
+
+        old_state = self.speakers.get_state()
+
+        if action == "rename":
+            self.speakers.rename(name, other)
+        elif action == "merge":
+            self.speakers.merge(name, other)
+        else:
+            self.speakers.swap(name, other)
+
+        self._speakers_changed(old_state)
+        self.history.record(("speakers", None, old_state, self.speakers.get_state()))
+        self.refresh_ui()
+
+    def update_speaker_options(self) -> None:
+        """
+        Push the shared speaker options list to the selects that use it.
+        """
+
+        self.speaker_selects = [
+            select for select in self.speaker_selects if not select.is_deleted
+        ]
+        for select in self.speaker_selects:
+            select.update()
+
+    def search(
+        self,
+        term: str,
+        regex: bool = False,
+        case_sensitive: bool = False,
+        speaker: Optional[str] = None,
+    ) -> None:
+        """
+        Find all matches of a term, optionally only in segments of one
+        speaker, and jump to the first one.
+        """
+
+        self.search_term = term or ""
+        self.search_options = (regex, case_sensitive, speaker)
+
+        if not self._find_matches():
+            return
+
+        ui.run_javascript(
+            "transcriptSearch.set(%s, %s, %s)"
+            % (
+                json.dumps(self.search_term),
+                json.dumps(regex),
+                json.dumps("g" if case_sensitive else "gi"),
+            )
+        )
+
+        if self.search_matches:
+            self.show_match(0)
+            ui.notify(f"Found {len(self.search_matches)} matches", type="positive")
+        else:
+            self._highlight_segment(None)
+            self.update_search_info()
+            if self.search_term:
+                ui.notify("No matches found", type="info")
+
+    def _find_matches(self) -> bool:
+        regex, case_sensitive, speaker = self.search_options
+        self.search_matches = []
+
+        if not self.search_term:
+            return True
+
+        try:
+            pattern = compile_search(self.search_term, regex, case_sensitive)
+        except re.error as e:
+            ui.notify(f"Invalid regular expression: {e}", type="warning")
+            return False
+
+        # Regular expressions can match across words, so they are matched
+        # against every segment instead of using the word index.
+        candidates = None
+        if not regex:
+            if not self.search_index.built:
+                self.search_index.build(self.segments)
+            candidates = self.search_index.candidates(self.search_term)
+
+        speaker_id = None
+        if speaker in self.speakers:
+            speaker_id = self.speakers.resolve(self.speakers.ids[speaker])
+
+        self.search_pattern = pattern
+        self.search_matches = find_matches(
+            self.segments, pattern, candidates, speaker_id
+        )
+
+        return True
+
+    def show_match(self, position: int) -> None:
+        """
+        Scroll to a match, mark its segment and seek the player to it.
+        """
+
+        if not self.search_matches:
+            return
+
+        self.search_position = position % len(self.search_matches)
+        segment, start, _ = self.search_matches[self.search_position]
+
+        self._highlight_segment(segment)
+        self.scroll_to_segment(segment)
+
+        if self.video_player:
+            self.video_player.seek(segment.time_at(start))
+
+        self.update_search_info()
+
+    def _highlight_segment(self, segment: Optional[TranscriptSegment]) -> None:
+        previous = self.highlighted_segment
+        if previous is segment:
+            return
+
+        self.highlighted_segment = segment
+        self.refresh_segment(previous)
+        self.refresh_segment(segment)
+
+    def update_search_info(self) -> None:
+        if not self.search_info_label:
+            return
+
+        if self.search_matches:
+            info_text = (
+                f"{self.search_position + 1} of {len(self.search_matches)} matches"
+            )
+        else:
+            info_text = "No matches" if self.search_term else ""
+
+        self.search_info_label.set_text(info_text)
+
+    def replace_current(self, replacement: str) -> None:
+        """
+        Replace the current match.
+        """
+
+        self.apply_pending_text()
+
+        if not self.search_matches:
+            ui.notify("No match selected", type="warning")
+            return
+
+        # The offsets go stale once the text is edited, so the segment is
+        # matched again and the replacement only made if the match is still
+        # there.
+        segment, start, end = self.search_matches[self.search_position]
+        if (segment, start, end) not in find_matches([segment], self.search_pattern):
+            position = self.search_position
+            self._find_matches()
+            self.update_search_info()
+            if self.search_matches:
+                self.show_match(min(position, len(self.search_matches) - 1))
+            ui.notify("The text has changed, check the match again", type="warning")
+            return
+
+        text = segment.text[:start] + replacement + segment.text[end:]
+
+        self.history.record_set(segment, "text", segment.text, text)
+        self.apply_set(segment, "text", text)
+        self.layout_dirty = True
+        self.refresh_ui()
+
+        position = self.search_position
+        self._find_matches()
+        self.update_search_info()
+        if self.search_matches:
+            self.show_match(min(position, len(self.search_matches) - 1))
+
+        ui.notify("Replacement made", type="positive")
+
+    def replace_all(self, replacement: str) -> None:
+        """
+        Replace all matches as a single undo step.
+        """
+
+        # Text may have been edited since the search, so match again.
+        self.apply_pending_text()
+        if not self.search_term or not self._find_matches():
+            return
+
+        if not self.search_matches:
+            ui.notify("No matches found to replace", type="info")
+            return
+
+        matches: Dict[TranscriptSegment, list] = {}
+        for segment, start, end in self.search_matches:
+            matches.setdefault(segment, []).append((start, end))
+
+        operation = ReplaceOperation(replacement)
+        for position, segment in enumerate(self.segments):
+            if segment not in matches:
+                continue
+
+            text = segment.text
+            parts = []
+            previous = 0
+            for start, end in matches[segment]:
+                operation.add_match(position, start, text[start:end])
+                parts.append(text[previous:start])
+                parts.append(replacement)
+                previous = end
+            parts.append(text[previous:])
+
+            # Matches equal to the replacement leave the text as it was.
+            new_text = "".join(parts)
+            if new_text != text:
+                self.apply_set(segment, "text", new_text)
+
+        if len(operation):
+            self.history.record(operation)
+
+        self.layout_dirty = True
+        self.refresh_ui()
+
+        count = len(self.search_matches)
+        self._find_matches()
+        self.update_search_info()
+
+        ui.notify(f"Replaced {count} occurrences", type="positive")
+
+    def create_search_panel(self) -> None:
+        """
+        Create the search and replace panel.
+        """
+
+        with ui.expansion("Search & Replace").classes("w-full"):
+            with ui.row().classes("w-full gap-2 mb-2 items-center"):
+                search_input = (
+                    ui.input(placeholder="Search in transcript...")
+                    .classes("flex-1")
+                    .props("outlined dense")
+                )
+                speaker_filter = (
+                    ui.select(
+                        options=self.speakers.options,
+                        label="Speaker",
+                        clearable=True,
+                    )
+                    .classes("w-40")
+                    .props("dense")
+                )
+                case_sensitive = ui.checkbox("Case sensitive")
+                regex = ui.checkbox("Regex")
+
+                def run_search() -> None:
+                    self.search(
+                        search_input.value,
+                        regex.value,
+                        case_sensitive.value,
+                        speaker_filter.value,
+                    )
+
+                ui.button("Search", icon="search", color="primary").props("dense").on(
+                    "click", run_search
+                )
+                search_input.on("keydown.enter", run_search)
+
+            with ui.row().classes("w-full gap-2 mb-2"):
+                ui.button("Previous", icon="keyboard_arrow_up", color="grey").props(
+                    "dense flat"
+                ).on("click", lambda: self.show_match(self.search_position - 1))
+                ui.button("Next", icon="keyboard_arrow_down", color="grey").props(
+                    "dense flat"
+                ).on("click", lambda: self.show_match(self.search_position + 1))
+
+                self.search_info_label = ui.label("").classes(
+                    "text-sm text-gray-600 self-center"
+                )
+
+            with ui.row().classes("w-full gap-2"):
+                replace_input = (
+                    ui.input(placeholder="Replace with...")
+                    .classes("flex-1")
+                    .props("outlined dense")
+                )
+
+                ui.button("Replace Current", color="orange").props("dense").on(
+                    "click", lambda: self.replace_current(replace_input.value or "")
+                )
+                ui.button("Replace All", color="red").props("dense").on(
+                    "click", lambda: self.replace_all(replace_input.value or "")
+                )
+
+        self.speaker_selects.append(speaker_filter)
+
+    def create_speaker_panel(self) -> None:
+        """
+        Create the panel for renaming, merging and swapping speakers.
+        """
+
+        with ui.expansion("Speakers").classes("w-full"):
+            with ui.row().classes("w-full gap-2 items-center"):
+                speaker_select = ui.select(
+                    options=self.speakers.options, label="Speaker"
+                ).classes("w-48")
+                other_input = (
+                    ui.input(
+                        label="New name or other speaker",
+                        autocomplete=self.speakers.options,
+                    )
+                    .classes("flex-1")
+                    .props("dense")
+                )
+
+                for label, action in (
+                    ("Rename", "rename"),
+                    ("Merge into", "merge"),
+                    ("Swap with", "swap"),
+                ):
+                    ui.button(label).props("dense flat color=primary").on(
+                        "click",
+                        lambda action=action: self.change_speakers(
+                            action, speaker_select.value, other_input.value
+                        ),
+                    )
+
+        self.speaker_selects.append(speaker_select)
+
+    def undo(self) -> None:
+        self.apply_pending_text()
+        if not self.history.undo():
+            ui.notify("Nothing to undo", type="info")
+            return
+        self.refresh_ui()
+
+    def redo(self) -> None:
+        self.apply_pending_text()
+        if not self.history.redo():
+            ui.notify("Nothing to redo", type="info")
+            return
+        self.refresh_ui()
+
     def get_export_data(self) -> str:
         result = []
 
@@ -152,110 +1097,295 @@ class TranscriptEditor:
 
         return "\n\n".join(result)
 
-    def get_json_data(self) -> str:
+    def get_subtitles(self, export_format: str = "srt") -> str:
+        """
+        Build subtitles from the edited transcript, without asking the
+        backend for a new SRT result.
+        """
+
+        return export_captions(build_captions(self.segments), export_format)
+
+    def get_json_data(self) -> dict:
+        """
+        Get the transcript as sent when saving the whole result. The text is
+        only sent once, as part of the segments.
+        """
+
         return {
             "segments": [seg.to_dict() for seg in self.segments],
             "speaker_count": len(self.speakers),
-            "full_transcription": " ".join(seg.text for seg in self.segments),
         }
 
     def refresh_ui(self):
-        if self.container:
+        """
+        Bring the rendered rows up to date after segments were added,
+        removed, moved or changed. Only rows in the window are touched.
+        """
+
+        if not self.container:
+            return
+
+        # The placeholder for an empty transcript needs a full render.
+        if not self.rows_column or not self.segments:
             self.container.clear()
             with self.container:
                 self._render_segments()
+            return
+
+        self.layout_dirty = True
+        self._sync_window(force=True)
+
+    def _row_height(self, segment: TranscriptSegment) -> float:
+        lines = len(segment.text) // LINE_CHARACTERS
+        height = ROW_HEIGHT + lines * LINE_HEIGHT
+
+        if segment is self.selected_segment:
+            height += EDITOR_HEIGHT
+
+        return height
+
+    def _update_layout(self) -> None:
+        """
+        Estimate where each row starts, for the spacers that stand in for
+        the rows that aren't rendered.
+        """
+
+        offsets = array("d", [0.0])
+        top = 0.0
+        for segment in self.segments:
+            top += self._row_height(segment)
+            offsets.append(top)
+
+        self.row_offsets = offsets
+        self.layout_dirty = False
+
+    def _window_bounds(self) -> tuple:
+        if self.layout_dirty:
+            self._update_layout()
+
+        offsets = self.row_offsets
+        top = self.viewport_top
+        bottom = top + self.viewport_height
+
+        first = max(0, bisect_right(offsets, top) - 1 - OVERSCAN_ROWS)
+        last = min(len(self.segments), bisect_left(offsets, bottom) + OVERSCAN_ROWS)
+
+        return first, last
+
+    def _sync_window(self, force: bool = False) -> None:
+        """
+        Render the rows in the visible window plus overscan, removing rows
+        that left it and re-rendering stale rows that are still in it.
+        """
+
+        first, last = self._window_bounds()
+
+        # Scrolling within the window doesn't change any rows.
+        if not force and (first, last) == self.window:
+            return
+
+        self.window = (first, last)
+        offsets = self.row_offsets
+        window = self.segments[first:last]
+        in_window = set(window)
+
+        for segment in list(self.segment_rows):
+            if segment not in in_window:
+                self.segment_rows.pop(segment).delete()
+                self.stale_segments.discard(segment)
 
-    def _create_segment_ui(self, segment: TranscriptSegment, index: int):
+        for position, segment in enumerate(window):
+            row = self.segment_rows.get(segment)
+
+            if row is None:
+                with self.rows_column:
+                    self._create_segment_ui(segment)
+                row = self.segment_rows[segment]
+            elif segment in self.stale_segments:
+                self.stale_segments.discard(segment)
+                self.refresh_segment(segment)
+
+            if self.rows_column.default_slot.children[position] is not row:
+                row.move(self.rows_column, target_index=position)
+
+        self.top_spacer.style(f"height: {offsets[first]}px")
+        self.bottom_spacer.style(f"height: {offsets[-1] - offsets[last]}px")
+
+        if self.search_term:
+            ui.run_javascript("transcriptSearch.schedule()")
+
+    def _on_scroll(self, e) -> None:
+        self.viewport_top = e.vertical_position
+        self.viewport_height = e.vertical_container_size or self.viewport_height
+        self._sync_window()
+
+    def scroll_to_segment(self, segment: TranscriptSegment) -> None:
+        if not self.scroll_area or segment not in self.segments:
+            return
+
+        if self.layout_dirty:
+            self._update_layout()
+
+        position = self.segments.index(segment)
+        self.scroll_area.scroll_to(pixels=self.row_offsets[position])
+
+    def refresh_segment(self, segment: Optional[TranscriptSegment]) -> None:
+        """
+        Re-render the row of a single segment.
+        """
+
+        if segment is None or segment not in self.segment_rows:
+            return
+
+        self._fill_segment_row(segment)
+
+        if segment is not self.selected_segment:
+            ui.run_javascript(
+                "transcriptWords.setSegment(%d, %s)"
+                % (id(segment), json.dumps(self._segment_timings(segment)))
+            )
+
+        if self.search_term:
+            ui.run_javascript("transcriptSearch.schedule()")
+
+    def _segment_class(self, segment: TranscriptSegment) -> str:
         segment_class = "cursor-pointer border-0 transition-all duration-200 w-full"
 
-        if segment.is_selected:
+        if segment is self.selected_segment:
             segment_class += " border-blue-500 bg-blue-50 shadow-none"
-        elif segment.is_highlighted:
+        elif segment is self.highlighted_segment:
             segment_class += " border-yellow-400 bg-yellow-50 hover:border-yellow-500"
         else:
             segment_class += " hover:border-gray-300 hover:shadow-md shadow-none"
 
-        with ui.column().classes("w-full mb-4 p-4"):
-            with ui.row().classes("w-full") as segment_row:
-                segment_row.classes(segment_class)
-
-                with ui.button(icon="add").props("flat round"):
-                    with ui.menu():
-                        with ui.column():
-                            new_speaker_input = ui.input("New Speaker")
-                            ui.button(
-                                "Add",
-                                on_click=lambda: self._add_new_speaker(
-                                    new_speaker_input.value,
-                                    speaker_select,
-                                    index,
-                                ),
-                            )
-
-                with ui.column().classes("flex-grow"):
-                    with ui.row().classes("items-center gap-2 w-32"):
-                        speaker_select = ui.select(
-                            options=list(self.speakers),
-                            value=segment.speaker,
-                            with_input=True,
-                        ).style("font-family: verdana; font-size: 10px;")
-                        speaker_select.on_value_change(
-                            lambda e, idx=index: self.update_segment(
-                                idx, speaker=e.value
-                            )
-                        )
+        return segment_class
 
-                with ui.row().classes("items-center w-2/3") as text_row:
-                    ui.label(f"{segment.start:.2f} - {segment.end:.2f}").classes(
-                        "text-sm text-gray-500"
-                    ).classes(segment_class)
+    def _create_segment_ui(self, segment: TranscriptSegment):
+        with ui.column().classes("w-full mb-4 p-4") as row:
+            self.segment_rows[segment] = row
+            self._fill_segment_row(segment)
 
-                    text_editor = (
-                        ui.editor(value=segment.text, placeholder="Enter text...")
-                        .style("font-family: verdana; border: 0; width: 100%;")
-                        .props("min-height=0")
-                        .classes(segment_class)
-                    )
-                    text_editor.on_value_change(
-                        lambda e, idx=index: self.update_segment(idx, text=e.value)
-                    )
+    def _fill_segment_row(self, segment: TranscriptSegment) -> None:
+        """
+        Fill the row of a segment with read-only text, or with the editor and
+        its controls if the segment is selected.
+        """
 
-                    text_row.on(
-                        "click",
-                        lambda e, idx=index: (
-                            self.select_segment(segment, action_col),
-                        ),
+        row = self.segment_rows[segment]
+        row.clear()
+
+        with row:
+            if segment is self.selected_segment:
+                self._create_segment_editor(segment)
+            else:
+                self._create_segment_text(segment)
+
+    def _create_segment_text(self, segment: TranscriptSegment) -> None:
+        segment_class = self._segment_class(segment)
+
+        with ui.row().classes("w-full no-wrap items-start") as text_row:
+            text_row.classes(segment_class)
+
+            with ui.column().classes("w-32 flex-shrink-0 gap-0"):
+                ui.label(segment.speaker).style(
+                    "font-family: verdana; font-size: 10px;"
+                )
+                ui.label(f"{segment.start:.2f} - {segment.end:.2f}").classes(
+                    "text-sm text-gray-500"
+                )
+
+            ui.html(self._segment_html(segment)).classes("transcript-text").style(
+                "font-family: verdana; width: 100%;"
+            )
+
+        text_row.on(
+            "click",
+            lambda e: self.select_segment(segment, seek=not e.args),
+            js_handler="""(e) => emit(!!e.target.closest(".transcript-word"))""",
+        )
+
+    def _create_segment_editor(self, segment: TranscriptSegment) -> None:
+        segment_class = self._segment_class(segment)
+        index = self.segments.index(segment)
+
+        # Handlers look up the position when they run, since segments can
+        # move while the editor is open.
+        def position() -> int:
+            return self.segments.index(segment)
+
+        with ui.row().classes("w-full") as segment_row:
+            segment_row.classes(segment_class)
+
+            with ui.button(icon="add").props("flat round"):
+                with ui.menu():
+                    with ui.column():
+                        new_speaker_input = ui.input("New Speaker")
+                        ui.button(
+                            "Add",
+                            on_click=lambda: self._add_new_speaker(
+                                new_speaker_input.value,
+                                speaker_select,
+                                position(),
+                            ),
+                        )
+
+            with ui.column().classes("flex-grow"):
+                with ui.row().classes("items-center gap-2 w-32"):
+                    speaker_select = ui.select(
+                        options=self.speakers.options,
+                        value=segment.speaker,
+                        with_input=True,
+                    ).style("font-family: verdana; font-size: 10px;")
+                    speaker_select.on_value_change(
+                        lambda e: self.update_segment(position(), speaker=e.value)
                     )
-                with ui.column().classes("flex-shrink-0 gap-1") as action_col:
-                    action_col.visible = segment.is_selected
+                    self.speaker_selects.append(speaker_select)
+
+            with ui.row().classes("items-center w-2/3"):
+                ui.label(f"{segment.start:.2f} - {segment.end:.2f}").classes(
+                    "text-sm text-gray-500"
+                ).classes(segment_class)
+
+                text_editor = (
+                    ui.editor(value=segment.text, placeholder="Enter text...")
+                    .style("font-family: verdana; border: 0; width: 100%;")
+                    .props("min-height=0")
+                    .classes(segment_class)
+                )
+                text_editor.on_value_change(lambda e: self.edit_text(segment, e.value))
+                text_editor.on("blur", lambda: self.apply_pending_text())
 
-                    ui.button(
-                        icon="keyboard_arrow_up",
-                        on_click=lambda idx=index: self.move_segment(
-                            idx, max(0, idx - 1)
-                        ),
-                    ).props("flat round").set_enabled(index > 0)
-                    ui.button(
-                        icon="keyboard_arrow_down",
-                        on_click=lambda idx=index: self.move_segment(
-                            idx, min(len(self.segments) - 1, idx + 1)
-                        ),
-                    ).props("flat round").set_enabled(index < len(self.segments) - 1)
-                    ui.button(
-                        icon="add_circle",
-                        color="positive",
-                        on_click=lambda idx=index: self._show_insert_dialog(idx),
-                    ).props("flat round")
-                    ui.button(
-                        icon="delete",
-                        color="negative",
-                        on_click=lambda idx=index: self._confirm_delete(idx),
-                    ).props("flat round")
+            with ui.column().classes("flex-shrink-0 gap-1"):
+                ui.button(icon="check", on_click=lambda: self.deselect_segment()).props(
+                    "flat round"
+                )
+                ui.button(
+                    icon="keyboard_arrow_up",
+                    on_click=lambda: self.move_segment(
+                        position(), max(0, position() - 1)
+                    ),
+                ).props("flat round").set_enabled(index > 0)
+                ui.button(
+                    icon="keyboard_arrow_down",
+                    on_click=lambda: self.move_segment(
+                        position(), min(len(self.segments) - 1, position() + 1)
+                    ),
+                ).props("flat round").set_enabled(index < len(self.segments) - 1)
+                ui.button(
+                    icon="add_circle",
+                    color="positive",
+                    on_click=lambda: self._show_insert_dialog(position()),
+                ).props("flat round")
+                ui.button(
+                    icon="delete",
+                    color="negative",
+                    on_click=lambda: self._confirm_delete(position()),
+                ).props("flat round")
 
     def _add_new_speaker(self, speaker_name: str, speaker_select, segment_index: int):
         if speaker_name and speaker_name not in self.speakers:
             self.speakers.add(speaker_name)
-            speaker_select.options = list(self.speakers)
+            self.update_speaker_options()
             speaker_select.value = speaker_name
             self.update_segment(segment_index, speaker=speaker_name)
 
@@ -278,7 +1408,7 @@ class TranscriptEditor:
                 ui.label("Insert New Segment")
 
                 speaker_input = ui.select(
-                    options=list(self.speakers), label="Speaker"
+                    options=self.speakers.options, label="Speaker"
                 ).classes("w-full")
 
                 text_input = ui.textarea("Text").classes("w-full")
@@ -323,15 +1453,126 @@ class TranscriptEditor:
 
         ui.notify("Segment inserted successfully", type="positive")
 
+    def _segment_spans(self, segment: TranscriptSegment) -> List[tuple]:
+        """
+        Get (start, end, first, last) of the timed words of a segment, or of
+        its parts if there are no word timings.
+        """
+
+        timings = segment.words or segment.parts
+        if not timings:
+            return [(segment.start, segment.end, 0, len(segment.text))]
+
+        spans = []
+        previous = 0
+        for span in range(len(timings)):
+            offset = timings.offsets[span]
+            if offset < previous:
+                continue
+
+            previous = offset + timings.lengths[span]
+            spans.append((timings.starts[span], timings.ends[span], offset, previous))
+
+        return spans
+
+    def _segment_timings(self, segment: TranscriptSegment) -> List[List[float]]:
+        spans = self._segment_spans(segment)
+
+        return [
+            [round(start, 3) for start, _, _, _ in spans],
+            [round(end, 3) for _, end, _, _ in spans],
+        ]
+
+    def _segment_html(self, segment: TranscriptSegment) -> str:
+        """
+        Get the text of a segment with each timed span wrapped in an element
+        the browser can highlight and seek to.
+
+        Spans are only built over the text between tags, so a span that
+        crosses a tag is split in two and only the first part gets the id.
+        """
+
+        text = segment.text
+        spans = self._segment_spans(segment)
+        html = []
+        span = 0
+        continued = False
+        previous = 0
+
+        for offset, visible, positions in text_runs(text):
+            end = offset + len(visible) if positions is None else positions[-1]
+            html.append(_escape_tags(text[previous:offset]))
+            previous = offset
+
+            while span < len(spans) and spans[span][2] < end:
+                start, _, first, last = spans[span]
+                if last <= previous:
+                    # Ends in a tag, or has been rendered up to a tag.
+                    span += 1
+                    continued = False
+                    continue
+
+                first = max(first, previous)
+                html.append(_escape_text(text[previous:first]))
+
+                part = min(last, end)
+                element_id = "" if continued else f'id="tw-{id(segment)}-{span}" '
+                html.append(
+                    f'<span {element_id}class="transcript-word" '
+                    f'data-start="{start:.3f}">'
+                )
+                html.append(_escape_text(text[first:part]))
+                html.append("</span>")
+                previous = part
+
+                # The rest of a span that crosses a tag is in the next run.
+                if last > end:
+                    continued = True
+                    break
+                span += 1
+                continued = False
+
+            html.append(_escape_text(text[previous:end]))
+            previous = end
+
+        html.append(_escape_tags(text[previous:]))
+
+        return "".join(html)
+
     def _render_segments(self):
+        self.segment_rows = {}
+        self.stale_segments = set()
+        self.rows_column = None
+
         if not self.segments:
             ui.label("No segments found").classes("text-center text-gray-500")
             return
 
-        for i, segment in enumerate(self.segments):
-            self._create_segment_ui(segment, i)
+        # Only the rows in view are rendered, the spacers take the place of
+        # the rows above and below them.
+        self.top_spacer = ui.element("div").classes("w-full")
+        self.rows_column = ui.column().classes("w-full gap-0")
+        self.bottom_spacer = ui.element("div").classes("w-full")
+        self.layout_dirty = True
+        self._sync_window(force=True)
+
+        # The timings are sent once per render, the lookup on every
+        # timeupdate happens in the browser.
+        timings = {
+            id(segment): self._segment_timings(segment) for segment in self.segments
+        }
+        ui.run_javascript(f"transcriptWords.set({json.dumps(timings)})")
+
+    def add_assets(self) -> None:
+        """
+        Add the editor's CSS and scripts to the page. Pages that render the
+        editor after the page has been sent call this while building it.
+        """
+
+        if self.assets_added:
+            return
+        self.assets_added = True
 
-    def render(self):
         ui.add_css(
             """
             .q-textarea .q-field__control { 
@@ -341,17 +1582,26 @@ class TranscriptEditor:
         """
         )
 
+        ui.add_head_html(WORD_HIGHLIGHT_JS)
+        ui.add_head_html(SEARCH_HIGHLIGHT_JS)
+
+    def render(self, scroll_area: Optional[ui.scroll_area] = None):
+        self.add_assets()
         self.container = ui.column().classes("w-full")
 
         with self.container:
             self._render_segments()
 
+        if scroll_area:
+            self.scroll_area = scroll_area
+            scroll_area.on_scroll(self._on_scroll)
+
     def _show_add_segment_dialog(self):
         with ui.dialog() as dialog, ui.card():
             ui.label("Add New Segment")
 
             speaker_input = ui.select(
-                options=list(self.speakers), label="Speaker"
+                options=self.speakers.options, label="Speaker"
             ).classes("w-full")
 
             new_speaker_input = ui.input("New Speaker").classes("w-full")
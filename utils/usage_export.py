@@ -0,0 +1,144 @@
+import pyarrow as pa
+import pyarrow.csv
+import pyarrow.parquet
+
+from fastapi import Request
+from fastapi.responses import Response
+from fastapi.responses import StreamingResponse
+from nicegui import app
+from nicegui import run
+from typing import Iterator
+from typing import List
+from utils.analytics import analyze
+from utils.statistics import statistics_cache
+from utils.token import get_admin_status
+from utils.token import get_auth_header
+from utils.token import load_user_data
+
+# Rows written per record batch. Each batch is sent as soon as it has been
+# written, so only one batch of output is held in memory at a time.
+BATCH_ROWS = 65536
+
+# Media type and file extension of each export format.
+EXPORT_FORMATS = {
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "arrow": ("application/vnd.apache.arrow.file", "arrow"),
+    "csv": ("text/csv", "csv"),
+}
+
+EXPORT_TABLES = ("users", "realms")
+
+
+class StreamSink:
+    def __init__(self):
+        """
+        Write-only file that keeps what is written until it is drained.
+
+        tell() counts every byte ever written, which the Parquet writer
+        relies on for the offsets in the file footer.
+        """
+
+        self.chunks: List[bytes] = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def usage_table(statistics: dict, table: str) -> pa.Table:
+    """
+    Get one of the export tables of a statistics snapshot as an Arrow table.
+    """
+
+    analytics = analyze(statistics)
+
+    if table == "realms":
+        frame = analytics.realms.reset_index()
+        frame["realm"] = frame["realm"].astype(str)
+        frame = frame.rename(columns={"seconds": "transcribed_seconds"})
+    else:
+        frame = analytics.users[
+            ["username", "realm", "admin", "transcribed_seconds", "last_login"]
+        ].copy()
+        frame["realm"] = frame["realm"].astype(str)
+
+    return pa.Table.from_pandas(frame, preserve_index=False)
+
+
+def write_batches(table: pa.Table, export_format: str) -> Iterator[bytes]:
+    """
+    Write a table in the given format one record batch at a time, yielding
+    the output of each batch.
+    """
+
+    sink = StreamSink()
+    output = pa.PythonFile(sink, mode="w")
+
+    if export_format == "parquet":
+        writer = pyarrow.parquet.ParquetWriter(output, table.schema)
+    elif export_format == "arrow":
+        # The IPC file format can be memory-mapped and read without copies.
+        writer = pa.ipc.new_file(output, table.schema)
+    else:
+        writer = pyarrow.csv.CSVWriter(output, table.schema)
+
+    for batch in table.to_batches(max_chunksize=BATCH_ROWS):
+        writer.write_batch(batch)
+        yield sink.drain()
+
+    writer.close()
+    yield sink.drain()
+
+
+def create_usage_export_endpoint() -> None:
+    """
+    Create the endpoint streaming the usage statistics for admins.
+    """
+
+    @app.get("/admin/export/{table}/{export_format}")
+    async def export_usage(request: Request, table: str, export_format: str):
+        if not get_auth_header():
+            return Response(
+                content="Unauthorized",
+                status_code=401,
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+
+        if not get_admin_status(await load_user_data()):
+            return Response(content="Forbidden", status_code=403)
+
+        if table not in EXPORT_TABLES or export_format not in EXPORT_FORMATS:
+            return Response(content="Not found", status_code=404)
+
+        try:
+            statistics = await statistics_cache.get(get_auth_header())
+        except Exception:
+            return Response(content="Statistics unavailable", status_code=502)
+
+        media_type, extension = EXPORT_FORMATS[export_format]
+        arrow_table = await run.io_bound(usage_table, statistics, table)
+        filename = f"{table}-{statistics_cache.updated:%Y%m%d-%H%M%S}.{extension}"
+
+        return StreamingResponse(
+            write_batches(arrow_table, export_format),
+            media_type=media_type,
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+        )
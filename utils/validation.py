@@ -0,0 +1,289 @@
+from bisect import bisect_left
+from bisect import bisect_right
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+
+
+class CaptionIssue:
+    def __init__(self, caption, kind: str, other=None, value: float = 0.0):
+        """
+        A single validation problem found for a caption.
+
+        The message is rendered on demand so that it always reflects the
+        current caption numbering.
+        """
+
+        self.caption = caption
+        self.kind = kind
+        self.other = other
+        self.value = value
+
+    @property
+    def message(self) -> str:
+        index = self.caption.index
+
+        if self.kind == "empty":
+            return f"Caption #{index} has no text."
+        if self.kind == "inverted":
+            return f"Caption #{index} has end time before start time."
+        if self.kind == "zero_length":
+            return f"Caption #{index} has zero length."
+        if self.kind == "overlap":
+            return f"Caption #{index} overlaps with caption #{self.other.index}."
+        if self.kind == "gap":
+            return (
+                f"Caption #{index} is only {self.value:.3f}s before "
+                f"caption #{self.other.index}."
+            )
+        if self.kind == "reading_speed":
+            return f"Caption #{index} reads at {self.value:.1f} characters per second."
+
+        return f"Caption #{index}: {self.kind}"
+
+
+class CaptionValidator:
+    def __init__(self, min_gap: float = 0.08, max_cps: float = 21.0):
+        """
+        Incrementally validate captions.
+
+        Captions are kept in an index sorted by start time, so overlaps are
+        found with a sweep over the sorted intervals rather than by only
+        comparing list neighbours. After an edit only the captions around the
+        old and new position of the edited caption are checked again.
+        """
+
+        self.min_gap = min_gap
+        self.max_cps = max_cps
+        self.issues: Dict[object, List[CaptionIssue]] = {}
+        self._starts: List[float] = []
+        self._order: List[object] = []
+        self._intervals: Dict[object, tuple] = {}
+        self._max_duration = 0.0
+
+    def issue_count(self) -> int:
+        return sum(len(issues) for issues in self.issues.values())
+
+    def get_issues(self, caption) -> List[CaptionIssue]:
+        return self.issues.get(caption, [])
+
+    def all_issues(self) -> List[CaptionIssue]:
+        """
+        Get all issues ordered by caption start time.
+        """
+
+        result = []
+        for caption in self._order:
+            result.extend(self.issues.get(caption, []))
+
+        return result
+
+    def validate_all(self, captions: Iterable) -> None:
+        """
+        Rebuild the index and validate every caption with a single sweep.
+        """
+
+        self.issues = {}
+        self._intervals = {}
+        self._max_duration = 0.0
+
+        entries = []
+        for seq, caption in enumerate(captions):
+            entries.append((caption.start, seq, caption))
+            self._track(caption)
+
+        entries.sort(key=lambda entry: (entry[0], entry[1]))
+        self._starts = [entry[0] for entry in entries]
+        self._order = [entry[2] for entry in entries]
+
+        # Sweep line: captions are visited in start order and compared with
+        # every earlier caption that is still running.
+        active = []
+
+        for caption in self._order:
+            issues = self._check_self(caption)
+
+            active = [other for other in active if other.end > caption.start]
+            for other in active:
+                if caption.end > other.start:
+                    issues.append(CaptionIssue(caption, "overlap", other))
+                    self.issues.setdefault(other, []).append(
+                        CaptionIssue(other, "overlap", caption)
+                    )
+
+            gap_issue = self._check_gap(caption)
+            if gap_issue:
+                issues.append(gap_issue)
+
+            if issues:
+                self.issues.setdefault(caption, []).extend(issues)
+
+            active.append(caption)
+
+    def caption_added(self, caption) -> set:
+        """
+        Index and validate a newly added caption.
+
+        Like the other update methods, this returns the captions that were
+        checked again so that only their flags need to be redrawn.
+        """
+
+        self._insert(caption)
+        affected = self._affected(caption.start, caption.end)
+        affected.add(caption)
+        self._recheck(affected)
+
+        return affected
+
+    def caption_removed(self, caption) -> set:
+        """
+        Drop a caption from the index and re-check its old neighbourhood.
+        """
+
+        if caption not in self._intervals:
+            return set()
+
+        start, end = self._intervals[caption]
+        self._remove(caption)
+        self.issues.pop(caption, None)
+        affected = self._affected(start, end)
+        self._recheck(affected)
+
+        return affected
+
+    def caption_changed(self, caption) -> set:
+        """
+        Re-validate a caption after its text or timing was edited.
+        """
+
+        if caption not in self._intervals:
+            return self.caption_added(caption)
+
+        old_start, old_end = self._intervals[caption]
+
+        # Text edits only change the caption's own result.
+        if (old_start, old_end) == (caption.start, caption.end):
+            self._recheck([caption])
+            return {caption}
+
+        affected = self._affected(old_start, old_end)
+        self._remove(caption)
+        self._insert(caption)
+        affected |= self._affected(caption.start, caption.end)
+        affected.add(caption)
+        self._recheck(affected)
+
+        return affected
+
+    def _track(self, caption) -> None:
+        self._intervals[caption] = (caption.start, caption.end)
+        self._max_duration = max(self._max_duration, caption.end - caption.start)
+
+    def _insert(self, caption) -> None:
+        self._track(caption)
+        position = bisect_right(self._starts, caption.start)
+        self._starts.insert(position, caption.start)
+        self._order.insert(position, caption)
+
+    def _remove(self, caption) -> None:
+        start, _ = self._intervals.pop(caption)
+        position = bisect_left(self._starts, start)
+        while self._order[position] is not caption:
+            position += 1
+        del self._starts[position]
+        del self._order[position]
+
+    def _affected(self, start: float, end: float) -> set:
+        """
+        Captions whose result may depend on the interval [start, end]: every
+        caption touching it and those ending just before it.
+        """
+
+        reach = start - self.min_gap
+        low = bisect_left(self._starts, reach - self._max_duration)
+        high = bisect_right(self._starts, max(start, end))
+        affected = set()
+
+        for position in range(low, high):
+            other = self._order[position]
+            if other.end >= reach or other.start >= start:
+                affected.add(other)
+
+        return affected
+
+    def _recheck(self, captions: Iterable) -> None:
+        for caption in captions:
+            if caption not in self._intervals:
+                continue
+
+            issues = self._check_self(caption)
+            issues.extend(self._check_overlaps(caption))
+
+            gap_issue = self._check_gap(caption)
+            if gap_issue:
+                issues.append(gap_issue)
+
+            if issues:
+                self.issues[caption] = issues
+            else:
+                self.issues.pop(caption, None)
+
+    def _check_self(self, caption) -> List[CaptionIssue]:
+        issues = []
+        duration = caption.end - caption.start
+        text = caption.text.strip()
+
+        if not text:
+            issues.append(CaptionIssue(caption, "empty"))
+
+        if duration < 0:
+            issues.append(CaptionIssue(caption, "inverted"))
+        elif duration == 0:
+            issues.append(CaptionIssue(caption, "zero_length"))
+        elif self.max_cps and text:
+            cps = len(text.replace("\n", "")) / duration
+            if cps > self.max_cps:
+                issues.append(CaptionIssue(caption, "reading_speed", value=cps))
+
+        return issues
+
+    def _check_overlaps(self, caption) -> List[CaptionIssue]:
+        issues = []
+        low = bisect_left(self._starts, caption.start - self._max_duration)
+        high = bisect_left(self._starts, caption.end)
+
+        for position in range(low, high):
+            other = self._order[position]
+            if other is caption:
+                continue
+            if other.end > caption.start and other.start < caption.end:
+                issues.append(CaptionIssue(caption, "overlap", other))
+
+        return issues
+
+    def _check_gap(self, caption) -> Optional[CaptionIssue]:
+        """
+        Check the gap to the first caption starting after this one ends.
+        Touching captions are fine, only a short pause between two captions
+        is flagged.
+        """
+
+        if not self.min_gap or caption.end <= caption.start:
+            return None
+
+        position = bisect_left(self._starts, caption.end)
+        while position < len(self._order) and self._order[position] is caption:
+            position += 1
+
+        if position >= len(self._order):
+            return None
+
+        following = self._order[position]
+        gap = following.start - caption.end
+
+        # Below the millisecond resolution of SRT the captions touch.
+        if 0.0005 < gap < self.min_gap:
+            return CaptionIssue(caption, "gap", following, value=gap)
+
+        return None
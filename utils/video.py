@@ -1,10 +1,10 @@
-import requests
-
 from fastapi import Request
 from fastapi.responses import Response
 from nicegui import app
+from utils import backend
 from utils.common import API_URL
 from utils.common import get_auth_header
+from utils.health import health
 
 
 def create_vtt_proxy() -> Response:
@@ -21,7 +21,7 @@ def create_vtt_proxy() -> Response:
             )
 
         headers["Authorization"] = headers_auth.get("Authorization", "")
-        response = requests.get(
+        response = backend.get(
             f"{API_URL}/api/v1/transcriber/{job_id}/vtt",
             headers=headers,
         )
@@ -55,10 +55,12 @@ def create_video_proxy() -> Response:
             )
 
         headers["Authorization"] = headers_auth.get("Authorization", "")
-        response = requests.get(
-            f"{API_URL}/api/v1/transcriber/{job_id}/videostream",
-            headers=headers,
-        )
+        with health.track("video_streams"):
+            response = backend.get(
+                f"{API_URL}/api/v1/transcriber/{job_id}/videostream",
+                headers=headers,
+            )
+        health.add_proxied_bytes(len(response.content))
 
         return Response(
             content=response.content,